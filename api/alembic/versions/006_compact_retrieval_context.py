@@ -0,0 +1,74 @@
+"""compact chat_message.retrieval_context to source references
+
+Revision ID: 006_compact_retrieval_context
+Revises: 005_add_updated_by
+Create Date: 2026-10-19 16:21:07.531840
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006_compact_retrieval_context'
+down_revision = '005_add_updated_by'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _ref(hit: dict) -> dict:
+    # Same shape as app.routers.chat.compact_sources
+    return {
+        "chunk_id": str(hit.get("chunk_id")),
+        "doc_id": hit.get("doc_id"),
+        "chunk_index": hit.get("chunk_index"),
+        "score": round(hit["score"], 4) if hit.get("score") is not None else None,
+    }
+
+
+def upgrade() -> None:
+    op.create_index('ix_chat_message_session_created', 'chat_message', ['session_id', 'created_at'])
+
+    conn = op.get_bind()
+    select = sa.text("""
+        SELECT id, retrieval_context FROM chat_message
+        WHERE retrieval_context IS NOT NULL AND id > :after
+        ORDER BY id LIMIT :limit
+    """)
+    update = sa.text("UPDATE chat_message SET retrieval_context = CAST(:ctx AS json) WHERE id = :id")
+    # Keep texts that only ever made it into chat history (chunks written before chunk.text existed)
+    backfill = sa.text("""
+        UPDATE chunk SET text = :text
+        WHERE document_id = :doc_id AND chunk_index = :chunk_index AND text IS NULL
+    """)
+    after = ""
+    while True:
+        rows = conn.execute(select, {"after": after, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        updates, texts = [], []
+        for msg_id, ctx in rows:
+            if isinstance(ctx, str):
+                ctx = json.loads(ctx)
+            if not isinstance(ctx, list) or not any(isinstance(h, dict) and "text" in h for h in ctx):
+                continue
+            hits = [h for h in ctx if isinstance(h, dict)]
+            texts.extend(
+                {"text": h["text"], "doc_id": h["doc_id"], "chunk_index": h["chunk_index"]}
+                for h in hits if h.get("text") and h.get("doc_id") and h.get("chunk_index") is not None
+            )
+            updates.append({"id": msg_id, "ctx": json.dumps([_ref(h) for h in hits])})
+        if texts:
+            conn.execute(backfill, texts)
+        if updates:
+            conn.execute(update, updates)
+        after = rows[-1][0]
+
+
+def downgrade() -> None:
+    # Texts are not copied back into chat rows; expand=true reads them from the chunk table
+    op.drop_index('ix_chat_message_session_created', table_name='chat_message')
@@ -1,10 +1,14 @@
 from fastapi import FastAPI
-from app.routers import knowledge, documents, chat
+from prometheus_client import make_asgi_app
+from app.routers import knowledge, documents, chat, ingestion
 app = FastAPI(title="RAG API")
 # Register more specific routes first to avoid conflicts
 app.include_router(documents.router, prefix="/api", tags=["documents"])
 app.include_router(knowledge.router, prefix="/api", tags=["knowledge"])
+app.include_router(ingestion.router, prefix="/api", tags=["ingestion"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 
+app.mount("/metrics", make_asgi_app())
+
 @app.get("/health")
 def health(): return {"ok": True}
@@ -1,5 +1,5 @@
 # app/models/chat.py
-from sqlalchemy import String, DateTime, func, ForeignKey, CheckConstraint, JSON
+from sqlalchemy import String, DateTime, func, ForeignKey, CheckConstraint, Index, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 from uuid import uuid4
 from app.db import Base
@@ -17,11 +17,12 @@ class ChatMessage(Base):
     __tablename__ = "chat_message"
     __table_args__ = (
         CheckConstraint("role IN ('user','assistant','system')", name="ck_chat_message_role"),
+        Index("ix_chat_message_session_created", "session_id", "created_at"),
     )
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid4()))
     session_id: Mapped[str] = mapped_column(String, ForeignKey("chat_session.id", ondelete="CASCADE"), nullable=False)
     role: Mapped[str] = mapped_column(String, nullable=False)
     content: Mapped[str] = mapped_column(String, nullable=False)
-    retrieval_context: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # JSONB in PostgreSQL
+    retrieval_context: Mapped[list | None] = mapped_column(JSON, nullable=True)  # [{chunk_id, doc_id, chunk_index, score}], text lives in chunk
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
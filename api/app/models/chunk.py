@@ -1,5 +1,5 @@
 # app/models/chunk.py
-from sqlalchemy import String, DateTime, func, Integer, ForeignKey, UniqueConstraint
+from sqlalchemy import String, Text, DateTime, func, Integer, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from uuid import uuid4
 from app.db import Base
@@ -18,5 +18,6 @@ class Chunk(Base):
     page_to: Mapped[int | None] = mapped_column(Integer)
     token_count: Mapped[int | None] = mapped_column(Integer)
     text_hash: Mapped[str | None] = mapped_column(String)
+    text: Mapped[str | None] = mapped_column(Text)  # only filled when Qdrant runs with slim payloads
     vector_id: Mapped[str | None] = mapped_column(String)  # id trong vector DB (Qdrant/Milvus)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -16,3 +16,5 @@ class Document(Base):
     page_count: Mapped[int | None] = mapped_column(Integer)
     chunk_count: Mapped[int] = mapped_column(Integer, default=0)
     status: Mapped[str] = mapped_column(String, nullable=False, default="uploaded")  # uploaded|ingesting|ready|error
+    # Who wrote the row last: api|worker. CDC events of worker writes are skipped by the worker.
+    updated_by: Mapped[str | None] = mapped_column(String, default="api", onupdate="api")
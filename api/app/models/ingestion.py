@@ -9,7 +9,7 @@ class IngestionJob(Base):
 
     id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid4()))
     document_id: Mapped[str] = mapped_column(String, ForeignKey("document.id", ondelete="CASCADE"), nullable=False)
-    stage: Mapped[str] = mapped_column(String, nullable=False)  # queued|downloading|parsing|chunking|embedding|upserting|completed|failed
+    stage: Mapped[str] = mapped_column(String, nullable=False)  # queued|downloading|parsing|preparing|chunking|embedding|upserting|completed|failed
     detail: Mapped[str | None] = mapped_column(String)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,5 @@
 # app/models/knowledge.py
-from sqlalchemy import String, DateTime, func, ForeignKey
+from sqlalchemy import String, DateTime, func, ForeignKey, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 from uuid import uuid4
 from app.db import Base
@@ -11,4 +11,5 @@ class Knowledge(Base):
     owner_id: Mapped[str | None] = mapped_column(String, ForeignKey("users.id", ondelete="SET NULL"))
     name: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str | None] = mapped_column(String)
+    chunking_profile: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # splitter/tokenizer/capacity/overlap or {"preset": name}
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -3,11 +3,26 @@ from sqlalchemy.orm import Session
 from app.deps import get_db
 from app.models import ChatSession, ChatMessage, Knowledge
 from app.schemas import ChatIn
-from app.services.qdrant import search_chunks
+from app.services.qdrant import search_chunks, hydrate_text
+from app.services.resilience import CircuitOpenError, OverloadedError
 import uuid, datetime as dt
 
 router = APIRouter()
 
+TABLE_REF_KEYS = ("index", "uri", "title", "row_group", "row_from", "row_to")
+
+def compact_sources(hits: list[dict]) -> list[dict]:
+    """
+    References stored in ChatMessage.retrieval_context; chunk text stays in the chunk table,
+    table rows in their Parquet file (row chunks keep the reference to their row group)
+    """
+    return [
+        {"chunk_id": str(h.get("chunk_id")), "doc_id": h.get("doc_id"), "chunk_index": h.get("chunk_index"),
+         "score": round(h["score"], 4) if h.get("score") is not None else None,
+         **({"table": {k: h["table"].get(k) for k in TABLE_REF_KEYS}} if (h.get("table") or {}).get("row_group") is not None else {})}
+        for h in hits
+    ]
+
 @router.post("/knowledge/{kid}/chat/sessions")
 def create_session(kid: str, body: ChatIn, db: Session = Depends(get_db)):
     if not db.get(Knowledge, kid): raise HTTPException(404, "Knowledge not found")
@@ -17,10 +32,21 @@ def create_session(kid: str, body: ChatIn, db: Session = Depends(get_db)):
     return {"session_id": sid}
 
 @router.get("/chat/sessions/{sid}/messages")
-def list_messages(sid: str, db: Session = Depends(get_db)):
-    from app.models import ChatMessage
+def list_messages(sid: str, expand: bool = False, db: Session = Depends(get_db)):
+    """
+    Messages of a session. Sources are references (chunk_id, doc_id, chunk_index, score);
+    with expand=true their text is filled in with one bulk chunk lookup for the whole history.
+    """
     msgs = db.query(ChatMessage).filter(ChatMessage.session_id == sid).order_by(ChatMessage.created_at.asc()).all()
-    return [{"role": m.role, "content": m.content, "created_at": m.created_at, "retrieval_context": m.retrieval_context} for m in msgs]
+    out = [{"role": m.role, "content": m.content, "created_at": m.created_at, "retrieval_context": m.retrieval_context} for m in msgs]
+    if expand:
+        # Copies, so the ORM objects' JSON is left untouched
+        for m in out:
+            if m["retrieval_context"]:
+                m["retrieval_context"] = [dict(ref) for ref in m["retrieval_context"]]
+        sess = db.get(ChatSession, sid)
+        hydrate_text(db, [ref for m in out for ref in m["retrieval_context"] or []], sess.knowledge_id if sess else None)
+    return out
 
 @router.post("/chat/sessions/{sid}/messages")
 def chat_send(sid: str, body: ChatIn, db: Session = Depends(get_db)):
@@ -30,7 +56,11 @@ def chat_send(sid: str, body: ChatIn, db: Session = Depends(get_db)):
     um = ChatMessage(id=str(uuid.uuid4()), session_id=sid, role="user", content=body.content)
     db.add(um); db.flush()
     # retrieve
-    hits = search_chunks(sess.knowledge_id, body.content, sess.section, top_k=6)
+    try:
+        hits = search_chunks(sess.knowledge_id, body.content, sess.section, top_k=6, db=db)
+    except (CircuitOpenError, OverloadedError) as e:
+        db.rollback()
+        raise HTTPException(503, f"Search is temporarily unavailable: {e}", headers={"Retry-After": "5"})
     # (placeholder) gọi LLM ở đây, dùng hits để làm context → answer
     answer = f"(demo) Top {len(hits)} chunks retrieved."
     am = ChatMessage(
@@ -38,7 +68,7 @@ def chat_send(sid: str, body: ChatIn, db: Session = Depends(get_db)):
         session_id=sid,
         role="assistant",
         content=answer,
-        retrieval_context=hits,
+        retrieval_context=compact_sources(hits),
     )
     db.add(am); db.commit()
     return {"answer": answer, "sources": hits}
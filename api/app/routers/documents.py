@@ -1,13 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app.deps import get_db
-from app.models import Document, Knowledge
-from app.schemas import PresignIn, DocOut, DocUpdate
-from app.services.s3_presign import make_s3_key, presign_put_url, presign_delete_url, delete_s3_object, BUCKET
-import uuid, datetime as dt
+from app.models import Document, Knowledge, Chunk
+from app.schemas import PresignIn, DocOut, DocUpdate, ChunkIn, BulkPresignIn, MultipartCompleteIn, BulkIngestIn
+from app.services.chunk_store import chunk_text_store
+from app.services.qdrant import delete_document_vectors
+from app.services.table_store import table_rows, table_uri, delete_document_tables
+from app.services.s3_presign import (
+    make_s3_key, presign_put_url, presign_delete_url, delete_s3_object, BUCKET,
+    MULTIPART_THRESHOLD, create_multipart_upload, presign_upload_part_urls,
+    complete_multipart_upload, abort_multipart_upload,
+)
+import os, uuid, datetime as dt
 
 router = APIRouter()
 
+# Files per bulk presign request; larger uploads are split by the client
+MAX_BULK_UPLOAD_FILES = int(os.getenv("MAX_BULK_UPLOAD_FILES", 500))
+
 @router.post("/knowledge/{kid}/documents/upload-url")
 def get_upload_url(kid: str, knowledge_name: str, body: PresignIn, db: Session = Depends(get_db)):
     knowledge = db.get(Knowledge, kid)
@@ -79,6 +91,134 @@ def get_upload_url(kid: str, knowledge_name: str, body: PresignIn, db: Session =
         "bucket": BUCKET,
     }
 
+@router.post("/knowledge/{kid}/documents/upload-urls")
+def get_upload_urls(kid: str, knowledge_name: str, body: BulkPresignIn, db: Session = Depends(get_db)):
+    """Presign uploads for many files with one lookup query and one commit"""
+    if not db.get(Knowledge, kid):
+        raise HTTPException(status_code=404, detail="Knowledge not found")
+    if len(body.files) > MAX_BULK_UPLOAD_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_UPLOAD_FILES} files per request")
+    filenames = [f.filename for f in body.files]
+    if len(set(filenames)) != len(filenames):
+        raise HTTPException(status_code=400, detail="Duplicate filenames in request")
+
+    # Newest document per filename, resolved in a single IN query
+    existing = {}
+    for doc in db.query(Document).filter(
+        Document.knowledge_id == kid,
+        Document.filename.in_(filenames)
+    ).order_by(Document.uploaded_at.desc()):
+        existing.setdefault(doc.filename, doc)
+
+    results = []
+    try:
+        for f in body.files:
+            doc = existing.get(f.filename)
+            doc_id = doc.id if doc else str(uuid.uuid4())
+            key = make_s3_key(knowledge_name, doc_id)
+            if doc:
+                doc.s3_key = f"s3://{BUCKET}/{key}"
+                doc.status = "uploaded"
+                doc.chunk_count = 0
+                doc.page_count = None
+            else:
+                db.add(Document(
+                    id=doc_id,
+                    knowledge_id=kid,
+                    filename=f.filename,
+                    s3_key=f"s3://{BUCKET}/{key}",
+                    status="uploaded",
+                ))
+
+            results.append({"doc_id": doc_id, "filename": f.filename, "s3_key": key, "bucket": BUCKET})
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error presigning bulk upload: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to presign uploads: {str(e)}")
+
+    # Multipart uploads are created only once the rows exist, and outside the transaction
+    created = []
+    try:
+        for f, result in zip(body.files, results):
+            key = result["s3_key"]
+            if f.size is not None and f.size > MULTIPART_THRESHOLD:
+                upload_id = create_multipart_upload(key, f.content_type)
+                created.append((key, upload_id))
+                result["upload_id"] = upload_id
+                result["parts"] = presign_upload_part_urls(key, upload_id, f.size)
+            else:
+                result["upload_url"] = presign_put_url(key, f.content_type)
+    except Exception as e:
+        # Rows stay 'uploaded' without an object; the reconciler removes them
+        for key, upload_id in created:
+            try:
+                abort_multipart_upload(key, upload_id)
+            except Exception as abort_error:
+                print(f"Error aborting multipart upload {upload_id}: {abort_error}")
+        print(f"Error presigning bulk upload: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to presign uploads: {str(e)}")
+
+    print(f"Presigned {len(results)} uploads for knowledge {kid} ({len(existing)} replaced)")
+    return {"uploads": results}
+
+@router.post("/documents/{doc_id}/multipart/complete")
+def complete_multipart(doc_id: str, body: MultipartCompleteIn, db: Session = Depends(get_db)):
+    doc = db.get(Document, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    key = doc.s3_key.replace(f"s3://{BUCKET}/", "")
+    try:
+        complete_multipart_upload(key, body.upload_id, [p.model_dump() for p in body.parts])
+        return {"doc_id": doc_id, "completed": True}
+    except Exception as e:
+        print(f"Error completing multipart upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to complete multipart upload: {str(e)}")
+
+@router.delete("/documents/{doc_id}/multipart/{upload_id}")
+def abort_multipart(doc_id: str, upload_id: str, db: Session = Depends(get_db)):
+    doc = db.get(Document, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    key = doc.s3_key.replace(f"s3://{BUCKET}/", "")
+    try:
+        abort_multipart_upload(key, upload_id)
+        return {"doc_id": doc_id, "aborted": True}
+    except Exception as e:
+        print(f"Error aborting multipart upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to abort multipart upload: {str(e)}")
+
+@router.post("/knowledge/{kid}/documents/ingest")
+def trigger_ingest_bulk(kid: str, body: BulkIngestIn, db: Session = Depends(get_db)):
+    """Flip many documents to 'ingesting' with a single UPDATE"""
+    if not body.doc_ids:
+        return {"queued": [], "count": 0}
+    try:
+        queued = db.execute(
+            update(Document)
+            .where(
+                Document.knowledge_id == kid,
+                Document.id.in_(body.doc_ids),
+                Document.status != "ingesting",
+            )
+            .values(status="ingesting")
+            .returning(Document.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.commit()
+        return {"queued": queued, "count": len(queued)}
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating document statuses: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to update document statuses: {str(e)}")
+
 @router.get("/knowledge/{kid}/documents", response_model=list[DocOut])
 def list_docs(kid: str, db: Session = Depends(get_db)):
     q = db.query(Document).filter(Document.knowledge_id == kid).order_by(Document.uploaded_at.desc())
@@ -127,9 +267,14 @@ def delete_document(doc_id: str, db: Session = Depends(get_db)):
         key = s3_key.split("/", 3)[-1] if "/" in s3_key else s3_key
     
     try:
+        # Delete vectors first so search stops returning the document's chunks
+        delete_document_vectors(doc.knowledge_id, doc_id)
+
         # Delete from S3
         delete_s3_object(key)
         print(f"Deleted S3 object: {key}")
+        tables = delete_document_tables(doc.knowledge_id, doc_id)
+        if tables: print(f"Deleted {tables} tables of document {doc_id}")
         
         # Delete from database
         db.delete(doc)
@@ -170,9 +315,14 @@ def update_document(doc_id: str, body: DocUpdate, db: Session = Depends(get_db))
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        # Update chunk_count if provided
+        # Update chunk_count if provided, dropping chunk rows left over from a longer previous version
         if body.chunk_count is not None:
             doc.chunk_count = body.chunk_count
+            db.query(Chunk).filter(
+                Chunk.document_id == doc_id,
+                Chunk.chunk_index >= body.chunk_count
+            ).delete(synchronize_session=False)
+            chunk_text_store.invalidate(doc_id)
         
         # Update status if provided
         if body.status is not None:
@@ -189,3 +339,48 @@ def update_document(doc_id: str, body: DocUpdate, db: Session = Depends(get_db))
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to update document: {str(e)}")
+
+@router.post("/documents/{doc_id}/chunks")
+def upsert_chunks(doc_id: str, body: list[ChunkIn], db: Session = Depends(get_db)):
+    if not db.get(Document, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not body:
+        return {"doc_id": doc_id, "upserted": 0}
+
+    try:
+        rows = [{"id": str(uuid.uuid4()), "document_id": doc_id, **c.model_dump()} for c in body]
+        stmt = pg_insert(Chunk).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_chunk_doc_idx",
+            set_={
+                col: stmt.excluded[col]
+                for col in ("section", "page_from", "page_to", "token_count", "text_hash", "vector_id", "text")
+            },
+        )
+        db.execute(stmt)
+        db.commit()
+        chunk_text_store.invalidate(doc_id)
+        table_rows.invalidate(doc_id)
+        return {"doc_id": doc_id, "upserted": len(rows)}
+    except Exception as e:
+        db.rollback()
+        print(f"Error upserting chunks: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to upsert chunks: {str(e)}")
+
+@router.get("/documents/{doc_id}/tables/{index}/rows")
+def get_table_rows(doc_id: str, index: int, offset: int = 0, limit: int = 50, db: Session = Depends(get_db)):
+    """Rows of a table extracted from the document; only the Parquet row groups covering the range are read"""
+    doc = db.get(Document, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        return {"doc_id": doc_id, "index": index, **table_rows.rows(table_uri(doc.knowledge_id, doc_id, index), max(offset, 0), min(max(limit, 1), 1000))}
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Table not found")
+    except Exception as e:
+        print(f"Error reading table {index} of document {doc_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to read table rows: {str(e)}")
@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from app.deps import get_db
+from app.models import Document, IngestionJob, Chunk
+from app.schemas import IngestionJobIn, DeadLetterReplayIn, StatusBatchIn
+from app.services.chunk_store import chunk_text_store
+import json
+
+router = APIRouter()
+
+@router.post("/documents/{doc_id}/ingestion-jobs")
+def record_ingestion_job(doc_id: str, body: IngestionJobIn, db: Session = Depends(get_db)):
+    """Record an ingestion stage of a document; the worker posts 'failed' rows for dead letters"""
+    if not db.get(Document, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        job = IngestionJob(document_id=doc_id, stage=body.stage, detail=body.detail)
+        db.add(job)
+        db.commit()
+        return {"id": job.id, "stage": job.stage}
+    except Exception as e:
+        db.rollback()
+        print(f"Error recording ingestion job: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to record ingestion job: {str(e)}")
+
+@router.post("/documents/status-batch")
+def write_status_batch(body: StatusBatchIn, db: Session = Depends(get_db)):
+    """
+    Apply a batch of worker status updates and ingestion_job rows in one transaction.
+    Rows are tagged updated_by='worker' so the worker skips their CDC events.
+    """
+    try:
+        # Skip documents deleted meanwhile instead of failing the batch: the ORM
+        # bulk update by primary key raises StaleDataError for a missing row
+        doc_ids = {u.doc_id for u in body.updates} | {j.doc_id for j in body.jobs}
+        existing = set(db.scalars(select(Document.id).where(Document.id.in_(doc_ids)))) if doc_ids else set()
+        updates = [
+            {"id": u.doc_id, "updated_by": "worker",
+             **{k: v for k, v in (("status", u.status), ("chunk_count", u.chunk_count)) if v is not None}}
+            for u in body.updates if u.doc_id in existing
+        ]
+        if updates:
+            db.execute(update(Document), updates)
+        # Drop chunk rows left over from a longer previous version
+        counted = [u for u in body.updates if u.chunk_count is not None and u.doc_id in existing]
+        if counted:
+            db.execute(delete(Chunk).where(or_(*[
+                and_(Chunk.document_id == u.doc_id, Chunk.chunk_index >= u.chunk_count) for u in counted
+            ])))
+        jobs = body.jobs
+        rows = [{"id": j.id, "document_id": j.doc_id, "stage": j.stage, "detail": j.detail}
+                for j in jobs if j.doc_id in existing]
+        if rows:
+            db.execute(insert(IngestionJob), rows)
+        db.commit()
+        for u in counted:
+            chunk_text_store.invalidate(u.doc_id)
+        return {"updated": len(updates), "jobs": len(rows)}
+    except Exception as e:
+        db.rollback()
+        print(f"Error writing status batch: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to write status batch: {str(e)}")
+
+@router.get("/ingestion/dead-letters")
+def list_dead_letters(knowledge_id: str | None = None, limit: int = 100, db: Session = Depends(get_db)):
+    """Documents whose ingestion failed for good, with the context of the last failure"""
+    latest = (
+        db.query(IngestionJob.document_id, func.max(IngestionJob.created_at).label("created_at"))
+        .filter(IngestionJob.stage == "failed")
+        .group_by(IngestionJob.document_id)
+        .subquery()
+    )
+    query = (
+        db.query(Document, IngestionJob)
+        .outerjoin(latest, latest.c.document_id == Document.id)
+        .outerjoin(IngestionJob, (IngestionJob.document_id == latest.c.document_id)
+                   & (IngestionJob.created_at == latest.c.created_at)
+                   & (IngestionJob.stage == "failed"))
+        .filter(Document.status == "error")
+    )
+    if knowledge_id:
+        query = query.filter(Document.knowledge_id == knowledge_id)
+
+    rows = []
+    for doc, job in query.order_by(Document.updated_at.desc()).limit(limit).all():
+        failure = {}
+        if job and job.detail:
+            try:
+                failure = json.loads(job.detail)
+            except ValueError:
+                failure = {"error": job.detail}
+        rows.append({
+            "doc_id": doc.id,
+            "knowledge_id": doc.knowledge_id,
+            "filename": doc.filename,
+            "stage": failure.get("stage"),
+            "error": failure.get("error"),
+            "attempts": failure.get("attempts"),
+            "failed_at": job.created_at if job else doc.updated_at,
+        })
+    return rows
+
+@router.post("/ingestion/dead-letters/replay")
+def replay_dead_letters(body: DeadLetterReplayIn, db: Session = Depends(get_db)):
+    """
+    Re-queue failed documents. Flipping status back to 'ingesting' emits a CDC
+    update, so the worker picks them up like a fresh upload.
+    """
+    if not body.doc_ids and not body.knowledge_id:
+        raise HTTPException(status_code=400, detail="Provide doc_ids or knowledge_id")
+    stmt = update(Document).where(Document.status == "error")
+    if body.doc_ids:
+        stmt = stmt.where(Document.id.in_(body.doc_ids))
+    if body.knowledge_id:
+        stmt = stmt.where(Document.knowledge_id == body.knowledge_id)
+    try:
+        replayed = db.execute(stmt.values(status="ingesting").returning(Document.id)).scalars().all()
+        db.commit()
+        print(f"Replayed {len(replayed)} dead-lettered documents")
+        return {"replayed": replayed}
+    except Exception as e:
+        db.rollback()
+        print(f"Error replaying dead letters: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to replay dead letters: {str(e)}")
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.deps import get_db
-from app.models import Knowledge
-from app.schemas import KnowledgeCreate, KnowledgeOut
+from app.models import Knowledge, Document
+from app.schemas import KnowledgeCreate, KnowledgeUpdate, KnowledgeOut
+from app.services.qdrant import delete_knowledge_vectors
+from app.services.s3_presign import delete_s3_objects, BUCKET
+from app.services.table_store import delete_knowledge_tables
 import uuid
 
 router = APIRouter()
@@ -14,7 +17,8 @@ def list_knowledge(db: Session = Depends(get_db)):
 @router.post("/knowledge", response_model=KnowledgeOut)
 def create_knowledge(body: KnowledgeCreate, db: Session = Depends(get_db)):
     try:
-        k = Knowledge(id=str(uuid.uuid4()), name=body.name, description=body.description)
+        profile = body.chunking_profile.model_dump(exclude_none=True) if body.chunking_profile else None
+        k = Knowledge(id=str(uuid.uuid4()), name=body.name, description=body.description, chunking_profile=profile)
         db.add(k)
         db.flush()  # Flush to get any database-generated values
         db.commit()
@@ -33,3 +37,56 @@ def get_knowledge(kid: str, db: Session = Depends(get_db)):
     k = db.get(Knowledge, kid)
     if not k: raise HTTPException(404, "Not found")
     return k
+
+@router.patch("/knowledge/{kid}", response_model=KnowledgeOut)
+def update_knowledge(kid: str, body: KnowledgeUpdate, db: Session = Depends(get_db)):
+    k = db.get(Knowledge, kid)
+    if not k: raise HTTPException(404, "Not found")
+    try:
+        if body.name is not None:
+            k.name = body.name
+        if body.description is not None:
+            k.description = body.description
+        # Applies to documents ingested from now on; re-ingest existing documents to rechunk them
+        if body.chunking_profile is not None:
+            k.chunking_profile = body.chunking_profile.model_dump(exclude_none=True) or None
+        db.flush()
+        db.commit()
+        db.refresh(k)
+        print(f"Knowledge updated: id={k.id}, chunking_profile={k.chunking_profile}")
+        return k
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating knowledge: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to update knowledge: {str(e)}")
+
+@router.delete("/knowledge/{kid}")
+def delete_knowledge(kid: str, db: Session = Depends(get_db)):
+    """
+    Delete a knowledge base with everything stored for it. Vectors go first so
+    search stops returning its chunks at once, then the S3 objects (uploads
+    and extracted tables), then the rows (documents, chunks and jobs
+    cascade). Anything left behind by a failure half-way is picked up by the
+    reconciler.
+    """
+    k = db.get(Knowledge, kid)
+    if not k: raise HTTPException(404, "Not found")
+    try:
+        collections = delete_knowledge_vectors(kid)
+        keys = [
+            s3_key.replace(f"s3://{BUCKET}/", "")
+            for (s3_key,) in db.query(Document.s3_key).filter(Document.knowledge_id == kid)
+        ]
+        deleted_objects = delete_s3_objects(keys) + delete_knowledge_tables(kid)
+        db.delete(k)
+        db.commit()
+        print(f"Knowledge deleted: id={kid}, collections={collections}, s3_objects={deleted_objects}")
+        return {"deleted": True, "knowledge_id": kid, "collections": collections, "s3_objects": deleted_objects}
+    except Exception as e:
+        db.rollback()
+        print(f"Error deleting knowledge: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to delete knowledge: {str(e)}")
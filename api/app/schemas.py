@@ -1,21 +1,58 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
 from datetime import datetime
 
+# Presets and tokenizer specs the worker's ChunkerCache (rag/src/profiles.py) understands
+CHUNKING_PRESETS = Literal["default", "qwen3", "qwen3-long", "plain-text"]
+TOKENIZER_SPEC = r"^(tiktoken:[\w.\-]+|hf:[\w.\-]+(/[\w.\-]+)?|chars)$"
+
+class ChunkingProfile(BaseModel):
+    preset: Optional[CHUNKING_PRESETS] = None
+    splitter: Optional[Literal["markdown", "text"]] = None
+    tokenizer: Optional[str] = Field(None, pattern=TOKENIZER_SPEC)  # tiktoken:<model> | hf:<model id> | chars
+    capacity: Optional[int | tuple[int, int]] = None
+    overlap: Optional[int] = Field(None, ge=0)
+
 class KnowledgeCreate(BaseModel):
     name: str
     description: Optional[str] = None
+    chunking_profile: Optional[ChunkingProfile] = None
+
+class KnowledgeUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    chunking_profile: Optional[ChunkingProfile] = None
 
 class KnowledgeOut(BaseModel):
     id: str
     name: str
     description: Optional[str] = None
+    chunking_profile: Optional[dict] = None
     class Config: from_attributes = True
 
 class PresignIn(BaseModel):
     filename: str
     content_type: str
 
+class BulkPresignFile(BaseModel):
+    filename: str
+    content_type: str
+    size: Optional[int] = None  # bytes; files above the multipart threshold get per-part URLs
+
+class BulkPresignIn(BaseModel):
+    files: list[BulkPresignFile]
+
+class MultipartPart(BaseModel):
+    part_number: int
+    etag: str
+
+class MultipartCompleteIn(BaseModel):
+    upload_id: str
+    parts: list[MultipartPart]
+
+class BulkIngestIn(BaseModel):
+    doc_ids: list[str]
+
 class DocOut(BaseModel):
     id: str
     filename: str
@@ -32,4 +69,36 @@ class ChatIn(BaseModel):
 
 class DocUpdate(BaseModel):
     chunk_count: Optional[int] = None
-    status: Optional[str] = None
\ No newline at end of file
+    status: Optional[str] = None
+class ChunkIn(BaseModel):
+    chunk_index: int
+    section: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    token_count: Optional[int] = None
+    text_hash: Optional[str] = None
+    vector_id: Optional[str] = None
+    text: Optional[str] = None
+
+class IngestionJobIn(BaseModel):
+    stage: str
+    detail: Optional[str] = None
+
+class StatusUpdateIn(BaseModel):
+    doc_id: str
+    status: Optional[str] = None
+    chunk_count: Optional[int] = None
+
+class IngestionJobBatchIn(BaseModel):
+    id: str
+    doc_id: str
+    stage: str
+    detail: Optional[str] = None
+
+class StatusBatchIn(BaseModel):
+    updates: list[StatusUpdateIn] = []
+    jobs: list[IngestionJobBatchIn] = []
+
+class DeadLetterReplayIn(BaseModel):
+    doc_ids: Optional[list[str]] = None
+    knowledge_id: Optional[str] = None
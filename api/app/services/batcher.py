@@ -0,0 +1,106 @@
+import asyncio, os, queue, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Sequence
+from prometheus_client import Histogram
+
+BATCH_SIZE = Histogram(
+    "query_embed_batch_size", "Queries per batched embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_DELAY = Histogram(
+    "query_embed_queue_seconds", "Time a query waited for its batch to be sent",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25),
+)
+CALL_LATENCY = Histogram(
+    "query_embed_call_seconds", "Latency of one batched embedding call",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+class MicroBatcher:
+    """
+    Collect concurrent single-item requests into one batched call
+
+    The first request of a batch waits at most `max_wait` seconds for others
+    to join; a batch is sent as soon as it holds `max_batch` items. Up to
+    `workers` batches are in flight at once, each on its own executor thread;
+    while all are busy, new requests keep collecting into the next batch.
+    Results are fanned back out through futures, so both request threads
+    (sync routes) and coroutines (`submit_async`) can wait on them.
+    """
+
+    def __init__(self, fn: Callable[[list], Sequence[Any]], max_batch: int = 32, max_wait: float = 0.005, workers: int = 4):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: queue.Queue = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="micro-batch")
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item: Any, timeout: float | None = None) -> Any:
+        return self.submit(item).result(timeout)
+
+    async def submit_async(self, item: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._collect()
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: list):
+        try:
+            sent_at = time.perf_counter()
+            BATCH_SIZE.observe(len(batch))
+            for _, _, enqueued_at in batch:
+                QUEUE_DELAY.observe(sent_at - enqueued_at)
+            try:
+                results = list(self.fn([item for item, _, _ in batch]))
+                CALL_LATENCY.observe(time.perf_counter() - sent_at)
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                # A short result list must not leave the remaining callers waiting forever
+                missing = RuntimeError(f"Batched call returned {len(results)} results for {len(batch)} items")
+                for _, future, _ in batch[len(results):]:
+                    future.set_exception(missing)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            self._slots.release()
+
+_query_batcher: MicroBatcher | None = None
+_query_batcher_lock = threading.Lock()
+
+def get_query_batcher(embed_batch: Callable[[list], Sequence[Any]]) -> MicroBatcher:
+    """Process-wide batcher for query embeddings (EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS, EMBED_BATCH_WORKERS)"""
+    global _query_batcher
+    if _query_batcher is None:
+        with _query_batcher_lock:
+            if _query_batcher is None:
+                _query_batcher = MicroBatcher(
+                    embed_batch,
+                    max_batch=int(os.getenv("EMBED_BATCH_MAX_SIZE", 32)),
+                    max_wait=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5)) / 1000,
+                    workers=int(os.getenv("EMBED_BATCH_WORKERS", 4)),
+                )
+    return _query_batcher
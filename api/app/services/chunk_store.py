@@ -0,0 +1,60 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from app.models import Chunk
+
+ChunkKey = tuple[str, int]  # (doc_id, chunk_index)
+
+class ChunkTextStore:
+    """Bulk chunk text lookups from the chunk table with an in-process LRU in front"""
+
+    def __init__(self, max_items: int = 10_000, batch_size: int = 500):
+        self.max_items = max_items
+        self.batch_size = batch_size
+        self._cache: OrderedDict[ChunkKey, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, keys: list[ChunkKey]) -> dict[ChunkKey, str]:
+        """Return text for every key that has one; cache misses are fetched in a single query per batch"""
+        found: dict[ChunkKey, str] = {}
+        misses: list[ChunkKey] = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                text = self._cache.get(key)
+                if text is None:
+                    misses.append(key)
+                else:
+                    self._cache.move_to_end(key)
+                    found[key] = text
+
+        for i in range(0, len(misses), self.batch_size):
+            batch = misses[i:i + self.batch_size]
+            rows = db.query(Chunk.document_id, Chunk.chunk_index, Chunk.text).filter(
+                tuple_(Chunk.document_id, Chunk.chunk_index).in_(batch),
+                Chunk.text.isnot(None),
+            ).all()
+            fetched = {(r.document_id, r.chunk_index): r.text for r in rows}
+            found.update(fetched)
+            self._put(fetched)
+        return found
+
+    def get(self, db: Session, doc_id: str, chunk_index: int) -> str | None:
+        return self.get_many(db, [(doc_id, chunk_index)]).get((doc_id, chunk_index))
+
+    def invalidate(self, doc_id: str):
+        """Drop cached chunks of a document, e.g. after it was re-ingested"""
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == doc_id]:
+                del self._cache[key]
+
+    def _put(self, items: dict[ChunkKey, str]):
+        with self._lock:
+            for key, text in items.items():
+                self._cache[key] = text
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+chunk_text_store = ChunkTextStore(max_items=int(os.getenv("CHUNK_TEXT_CACHE_SIZE", 10_000)))
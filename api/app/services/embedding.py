@@ -0,0 +1,188 @@
+"""Query embedding for search; mirrors rag/src/embed.py so queries and chunks share one model"""
+import os
+import abc
+import threading
+import ollama
+import numpy as np
+
+from app.services.resilience import AIMDLimiter, get_backend
+
+
+class EmbeddingBackend(abc.ABC):
+    """Turns a batch of texts into a [n, dim] float32 matrix"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        ...
+
+
+class OllamaBackend(EmbeddingBackend):
+    """Remote Ollama server over HTTP, guarded by the shared 'ollama' resilience backend"""
+
+    name = "ollama"
+
+    def __init__(self, model: str = "qwen3-embedding:0.6b", host: str | None = None):
+        self.model = model
+        self.host = host or os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434")
+        timeout = float(os.getenv("OLLAMA_TIMEOUT", 120))
+        self.client = ollama.Client(host=self.host, timeout=timeout)
+        # Shared by every Embed in the process: one concurrency limit and breaker per Ollama
+        self.backend = get_backend(
+            "ollama",
+            timeout=timeout,
+            limiter=AIMDLimiter(initial=2, max_limit=int(os.getenv("OLLAMA_MAX_CONCURRENCY", 8)))
+        )
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        response = self.backend.call(self.client.embed, model=self.model, input=texts, cost=len(texts))
+        return np.asarray(response["embeddings"], dtype=np.float32)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    In-process ONNX Runtime inference of the embedding model for CPU-only nodes
+
+    Texts are tokenized once, sorted by length and run in buckets padded only
+    to the longest text of the bucket (rounded up to `pad_multiple`), so short
+    chunks don't pay for long ones. Pooled rows are written straight into a
+    preallocated float32 matrix in input order. One session run at a time:
+    the session already uses `intra_op_threads` cores.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_dir: str,
+        model_file: str = "model.onnx",
+        max_length: int = 512,
+        max_batch_tokens: int = 8192,
+        pad_multiple: int = 16,
+        pooling: str = "last",
+        intra_op_threads: int | None = None
+    ):
+        """
+        Args:
+            model_dir: Directory with the exported model and its tokenizer.json
+            model_file: ONNX file in model_dir, e.g. 'model_quantized.onnx' for int8 weights
+            max_length: Tokens kept per text
+            max_batch_tokens: Padded tokens per session run
+            pad_multiple: Bucket lengths are rounded up to a multiple of this
+            pooling: 'last' (last non-padding token, Qwen3-Embedding) or 'mean'
+            intra_op_threads: Threads per session run (default: all cores)
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if pooling not in ("last", "mean"):
+            raise ValueError(f"Unknown pooling: {pooling}")
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.pad_multiple = pad_multiple
+        self.pooling = pooling
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.pad_id = self.tokenizer.padding["pad_id"] if self.tokenizer.padding else 0
+        # Padding is done per bucket below
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        output = self.session.get_outputs()[0]
+        self.output_name = output.name
+        self._lock = threading.Lock()
+        self.dimension = output.shape[-1]
+        if not isinstance(self.dimension, int):
+            # Symbolic output dimension: find it with a probe run
+            self.dimension = None
+            self.dimension = self.embed_batch(["dimension probe"]).shape[1]
+
+    def _buckets(self, lengths: np.ndarray):
+        """Index groups of similar length whose padded size fits max_batch_tokens"""
+        order = np.argsort(lengths, kind="stable")
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while end < len(order):
+                padded = -(-int(lengths[order[end]]) // self.pad_multiple) * self.pad_multiple
+                if padded * (end - start + 1) > self.max_batch_tokens:
+                    break
+                end += 1
+            yield order[start:end]
+            start = end
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if hidden.ndim == 2:
+            # Model exported with pooling built in
+            pooled = hidden
+        elif self.pooling == "last":
+            pooled = hidden[np.arange(len(hidden)), mask.sum(axis=1) - 1]
+        else:
+            pooled = (hidden * mask[..., None]).sum(axis=1) / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norms, 1e-12)
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        lengths = np.fromiter((len(e.ids) for e in encodings), dtype=np.int64, count=len(encodings))
+        out = np.empty((len(texts), self.dimension or 0), dtype=np.float32)
+        for idx in self._buckets(lengths):
+            width = -(-int(lengths[idx].max()) // self.pad_multiple) * self.pad_multiple
+            input_ids = np.full((len(idx), width), self.pad_id, dtype=np.int64)
+            mask = np.zeros((len(idx), width), dtype=np.int64)
+            for row, i in enumerate(idx):
+                ids = encodings[i].ids
+                input_ids[row, :len(ids)] = ids
+                mask[row, :len(ids)] = 1
+            feeds = {"input_ids": input_ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            if "position_ids" in self.input_names:
+                feeds["position_ids"] = np.broadcast_to(np.arange(width, dtype=np.int64), input_ids.shape).copy()
+            with self._lock:
+                hidden = self.session.run([self.output_name], feeds)[0]
+            pooled = self._pool(hidden, mask)
+            if out.shape[1] != pooled.shape[1]:
+                out = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            out[idx] = pooled
+        return out
+
+
+def create_backend(name: str | None = None, model: str = "qwen3-embedding:0.6b") -> EmbeddingBackend:
+    """Embedding backend selected by EMBED_BACKEND (ollama | onnx)"""
+    name = name or os.getenv("EMBED_BACKEND", "ollama")
+    if name == "ollama":
+        return OllamaBackend(model=model)
+    if name == "onnx":
+        return OnnxBackend(
+            model_dir=os.environ["ONNX_MODEL_DIR"],
+            model_file=os.getenv("ONNX_MODEL_FILE", "model.onnx"),
+            max_length=int(os.getenv("ONNX_MAX_LENGTH", 512)),
+            max_batch_tokens=int(os.getenv("ONNX_MAX_BATCH_TOKENS", 8192)),
+            pooling=os.getenv("ONNX_POOLING", "last"),
+            intra_op_threads=int(os.getenv("ONNX_INTRA_OP_THREADS", 0)) or None
+        )
+    raise ValueError(f"Unknown embedding backend: {name}")
+
+
+class Embed:
+    def __init__(self, model: str = "qwen3-embedding:0.6b", backend: EmbeddingBackend | str | None = None):
+        self.model = model
+        self.backend = backend if isinstance(backend, EmbeddingBackend) else create_backend(backend, model=model)
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list[str]) -> np.ndarray:
+        """Embed a batch of texts in one request, returns a [n, dim] float32 matrix"""
+        return self.backend.embed_batch(texts)
@@ -1,18 +1,203 @@
-import os, numpy as np
+import os, time, threading, uuid
 from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    Filter, FieldCondition, MatchValue, MatchAny, FilterSelector, PointIdsList,
+    DeleteAlias, DeleteAliasOperation,
+)
+from sqlalchemy.orm import Session
+from app.services.chunk_store import chunk_text_store
+from app.services.embedding import Embed
+from app.services.batcher import get_query_batcher
+from app.services.local_index import LocalIndexRegistry
+from app.services.table_store import table_rows
+from app.services.resilience import AIMDLimiter, get_backend
 
-client = QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333"))
-VECTOR_SIZE = 1024
+QDRANT_TIMEOUT = float(os.getenv("QDRANT_TIMEOUT", 5))
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# ':memory:' runs an in-process Qdrant (load tests)
+client = (QdrantClient(location=QDRANT_URL) if QDRANT_URL == ":memory:"
+          else QdrantClient(url=QDRANT_URL, timeout=int(QDRANT_TIMEOUT)))
+# Concurrency limit, breaker and hedging shared by every request of this process
+qdrant_backend = get_backend(
+    "qdrant",
+    timeout=QDRANT_TIMEOUT,
+    queue_timeout=float(os.getenv("QDRANT_QUEUE_TIMEOUT", 1)),
+    limiter=AIMDLimiter(initial=8, max_limit=int(os.getenv("QDRANT_MAX_CONCURRENCY", 32)))
+)
+VECTOR_SIZE = int(os.getenv("EMBED_DIM", 1024))
+
+# Tenancy settings mirror the worker's QdrantVectorStore / CollectionRouter
+TENANCY = os.getenv("QDRANT_TENANCY", "dedicated")
+SHARED_COLLECTION = os.getenv("QDRANT_SHARED_COLLECTION", "rag_chunks")
+ROUTER_REFRESH_SECONDS = float(os.getenv("QDRANT_ROUTER_REFRESH_SECONDS", 30))
+# Two-stage retrieval: search the chunks of the N closest documents only (0 = flat search).
+# Document-level vectors live in '<collection>__docs', written by the worker.
+DOC_ROUTING_TOP_DOCS = int(os.getenv("DOC_ROUTING_TOP_DOCS", 0))
+DOCS_SUFFIX = "__docs"
+_dedicated: set[str] = set()
+_refreshed_at = 0.0
+
+def resolve_collection(knowledge_id: str) -> str:
+    """Collection holding a knowledge base: its own collection/alias, or the shared one"""
+    global _dedicated, _refreshed_at
+    if TENANCY != "shared":
+        return knowledge_id
+    if time.monotonic() - _refreshed_at >= ROUTER_REFRESH_SECONDS:
+        names = {c.name for c in client.get_collections().collections}
+        names.update(a.alias_name for a in client.get_aliases().aliases)
+        names.discard(SHARED_COLLECTION)
+        _dedicated, _refreshed_at = names, time.monotonic()
+    return knowledge_id if knowledge_id in _dedicated else SHARED_COLLECTION
+
+def _exists(name: str) -> bool:
+    """A collection, or an alias serving one (re-embedded and rebuilt collections are swapped in by alias)"""
+    return client.collection_exists(name) or name in {a.alias_name for a in client.get_aliases().aliases}
+
+_embed: Embed | None = None
+_embed_lock = threading.Lock()
+
+def get_embed() -> Embed:
+    """Process-wide embedder, built on first use (EMBED_BACKEND selects ollama or onnx)"""
+    global _embed
+    if _embed is None:
+        with _embed_lock:
+            if _embed is None:
+                _embed = Embed(model=os.getenv("EMBED_MODEL", "qwen3-embedding:0.6b"))
+    return _embed
 
 def embed_query(text: str) -> list[float]:
-    v = np.random.randn(VECTOR_SIZE).astype(np.float32); v /= (np.linalg.norm(v)+1e-12)
-    return v.tolist()
+    # Concurrent chat requests share one batched embedding call
+    return get_query_batcher(get_embed().embed_batch)(text).tolist()
+
+def _table_rows(hit: dict) -> bool:
+    return (hit.get("table") or {}).get("row_group") is not None
+
+def hydrate_text(db: Session, hits: list[dict], knowledge_id: str | None = None) -> list[dict]:
+    """
+    Fill in chunk text for hits from slim payloads with a single bulk read of the chunk store;
+    table row chunks get just their row group read back from the table's Parquet file. Chunks
+    ingested before the chunk table always kept text fall back to their Qdrant payload.
+    """
+    missing = [(h["doc_id"], h["chunk_index"]) for h in hits if "text" not in h and "doc_id" in h and not _table_rows(h)]
+    if missing:
+        texts = chunk_text_store.get_many(db, missing)
+        for h in hits:
+            if "text" not in h and "doc_id" in h and not _table_rows(h):
+                h["text"] = texts.get((h["doc_id"], h["chunk_index"]))
+    unresolved = [h for h in hits if h.get("text") is None and h.get("chunk_id") and not _table_rows(h)]
+    if unresolved and knowledge_id:
+        try:
+            points = qdrant_backend.call(client.retrieve, resolve_collection(knowledge_id),
+                                         ids=list({str(h["chunk_id"]) for h in unresolved}), with_payload=["text"])
+        except Exception as e:
+            print(f"Error fetching chunk text from Qdrant for knowledge {knowledge_id}: {e}")
+            points = []
+        texts = {str(p.id): (p.payload or {}).get("text") for p in points}
+        for h in unresolved:
+            h["text"] = texts.get(str(h["chunk_id"]))
+    return table_rows.hydrate(hits)
+
+def _tenant_conditions(knowledge_id: str, collection: str) -> list:
+    if collection == SHARED_COLLECTION:
+        return [FieldCondition(key="knowledge_id", match=MatchValue(value=knowledge_id))]
+    return []
 
-def search_chunks(knowledge_id: str, query: str, section: str | None, top_k: int = 8):
+def _count_points(knowledge_id: str) -> int:
+    collection = resolve_collection(knowledge_id)
+    if not _exists(collection):
+        return 0
+    must = _tenant_conditions(knowledge_id, collection)
+    return qdrant_backend.call(client.count, collection, count_filter=Filter(must=must) if must else None, exact=True).count
+
+def _fetch_points(knowledge_id: str, doc_ids: list[str]) -> list[tuple]:
+    """(id, vector, payload) of every point of these documents, for the local index"""
+    collection = resolve_collection(knowledge_id)
+    points = []
+    for i in range(0, len(doc_ids), 256):
+        flt = Filter(must=_tenant_conditions(knowledge_id, collection) + [
+            FieldCondition(key="doc_id", match=MatchAny(any=doc_ids[i:i + 256]))
+        ])
+        offset = None
+        while True:
+            batch, offset = qdrant_backend.call(
+                client.scroll, collection, scroll_filter=flt, limit=1000, offset=offset,
+                with_payload=True, with_vectors=True
+            )
+            points.extend((p.id, p.vector, p.payload) for p in batch)
+            if offset is None:
+                break
+    return points
+
+# Exact in-process search for small knowledge bases (LOCAL_INDEX=float16|int8), Qdrant for the rest
+local_indexes = LocalIndexRegistry(fetch_points=_fetch_points, count_points=_count_points)
+
+def doc_point_id(doc_id: str) -> str:
+    # Same ids as the worker's vectorstore.doc_point_id
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:doc"))
+
+_no_doc_vectors: dict[str, float] = {}
+
+def route_documents(knowledge_id: str, collection: str, v: list[float], top_docs: int) -> list[str] | None:
+    """doc_ids of the closest documents, or None to search flat (no document vectors, or no match)"""
+    docs = f"{collection}{DOCS_SUFFIX}"
+    if time.monotonic() - _no_doc_vectors.get(docs, float("-inf")) < ROUTER_REFRESH_SECONDS:
+        return None
+    if not _exists(docs):
+        _no_doc_vectors[docs] = time.monotonic()
+        return None
+    must = _tenant_conditions(knowledge_id, collection)
+    res = qdrant_backend.hedged(client.search, docs, query_vector=v, query_filter=Filter(must=must) if must else None,
+                                limit=top_docs, with_payload=["doc_id"])
+    return [r.payload["doc_id"] for r in res if r.payload and r.payload.get("doc_id")] or None
+
+def search_chunks(knowledge_id: str, query: str, section: str | None, top_k: int = 8, db: Session | None = None):
     v = embed_query(query)
-    must = [FieldCondition(key="knowledge_id", match=MatchValue(value=knowledge_id))]
-    if section: must.append(FieldCondition(key="section", match=MatchValue(value=section)))
-    flt = Filter(must=must)
-    res = client.search("rag_chunks", query_vector=v, query_filter=flt, limit=top_k, with_payload=True)
-    return [{"chunk_id": r.id, "score": r.score, **(r.payload or {})} for r in res]
+    index = local_indexes.get(knowledge_id, db) if db is not None and local_indexes.enabled else None
+    if index is not None:
+        return hydrate_text(db, index.search(v, section, top_k), knowledge_id)
+    collection = resolve_collection(knowledge_id)
+    must = _tenant_conditions(knowledge_id, collection)
+    # heading_path holds every ancestor heading, so a section filter also matches its subsections
+    if section: must.append(FieldCondition(key="heading_path", match=MatchValue(value=section)))
+    doc_ids = route_documents(knowledge_id, collection, v, DOC_ROUTING_TOP_DOCS) if DOC_ROUTING_TOP_DOCS > 0 else None
+    if doc_ids:
+        # Uses the doc_id payload index
+        must.append(FieldCondition(key="doc_id", match=MatchAny(any=doc_ids)))
+    flt = Filter(must=must) if must else None
+    res = qdrant_backend.hedged(client.search, collection, query_vector=v, query_filter=flt, limit=top_k, with_payload=True)
+    hits = [{"chunk_id": r.id, "score": r.score, **(r.payload or {})} for r in res]
+    return hydrate_text(db, hits, knowledge_id) if db is not None else hits
+
+def delete_document_vectors(knowledge_id: str, doc_id: str):
+    """Delete every point of a document from the collection of its knowledge base"""
+    collection = resolve_collection(knowledge_id)
+    if not _exists(collection):
+        return
+    flt = Filter(must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id))])
+    qdrant_backend.call(client.delete, collection, points_selector=FilterSelector(filter=flt))
+    if _exists(f"{collection}{DOCS_SUFFIX}"):
+        qdrant_backend.call(client.delete, f"{collection}{DOCS_SUFFIX}", points_selector=PointIdsList(points=[doc_point_id(doc_id)]))
+
+def delete_knowledge_vectors(knowledge_id: str) -> list[str]:
+    """
+    Drop everything Qdrant holds for a knowledge base: its alias, its own
+    collection and staged/versioned copies ('<kid>__*'), and its points in
+    the shared collection and its document-level collection. Returns the
+    dropped collection names.
+    """
+    aliases = [a.alias_name for a in client.get_aliases().aliases if a.alias_name.split("__", 1)[0] == knowledge_id]
+    if aliases:
+        client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)) for alias in aliases
+        ])
+    dropped = [c.name for c in client.get_collections().collections if c.name.split("__", 1)[0] == knowledge_id]
+    for name in dropped:
+        client.delete_collection(name)
+    if TENANCY == "shared":
+        flt = Filter(must=[FieldCondition(key="knowledge_id", match=MatchValue(value=knowledge_id))])
+        for collection in (SHARED_COLLECTION, f"{SHARED_COLLECTION}{DOCS_SUFFIX}"):
+            if _exists(collection):
+                qdrant_backend.call(client.delete, collection, points_selector=FilterSelector(filter=flt))
+    _dedicated.discard(knowledge_id)
+    local_indexes.drop(knowledge_id)
+    return dropped
@@ -0,0 +1,303 @@
+"""Client resilience for Qdrant calls; mirrors rag/src/resilience.py in the worker"""
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('app.resilience')
+
+
+# Transport-level exceptions of the HTTP clients in use (httpx, requests, qdrant-client), matched by name
+_TRANSPORT_ERRORS = {"TransportError", "TimeoutException", "ResponseHandlingException", "ConnectionError", "Timeout"}
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    Timeouts, connection errors and 5xx responses count against a backend;
+    an answer it gave on purpose (a 404 for a missing collection, a rejected
+    request) does not
+    """
+    if isinstance(error, (TimeoutError, ConnectionError, FuturesTimeout)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return any(cls.__name__ in _TRANSPORT_ERRORS for cls in type(error).__mro__)
+
+
+class CircuitOpenError(Exception):
+    """The backend's circuit breaker is open; the call was not attempted"""
+
+
+class OverloadedError(Exception):
+    """No concurrency slot freed up in time; the call was shed"""
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit driven by observed latency
+
+    Additive increase while calls complete within the latency target,
+    multiplicative decrease when they fail or run slow. Without a fixed target
+    the limit follows a gradient: a short-term latency average is compared with
+    `tolerance` times a slow long-term average, so a sustained slowdown shrinks
+    the limit while single outliers don't.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: Optional[float] = None,
+        tolerance: float = 2.0,
+        backoff: float = 0.7
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self._short: Optional[float] = None
+        self._long: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def target(self) -> Optional[float]:
+        if self.latency_target is not None:
+            return self.latency_target
+        return self._long * self.tolerance if self._long is not None else None
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.inflight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.inflight += 1
+            return True
+
+    def release(self, latency: float, ok: bool = True):
+        """Return a slot; `latency` is per unit of work (seconds / cost)"""
+        with self._cond:
+            saturated = self.inflight >= int(self.limit)
+            self.inflight -= 1
+            if ok:
+                self._short = latency if self._short is None else self._short + (latency - self._short) * 0.2
+                self._long = latency if self._long is None else self._long + (latency - self._long) * 0.01
+            target = self.target()
+            now = time.monotonic()
+            if not ok or (target is not None and self._short > target):
+                # At most one decrease per round trip, so a burst of slow
+                # completions from one episode doesn't collapse the limit
+                if now - self._last_decrease >= (self._short or 0.0):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif saturated:
+                # Only grow when the limit was actually the bottleneck
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed: calls pass; `failure_threshold` consecutive failures open it
+    open: calls fail fast for `reset_timeout` seconds
+    half_open: a single probe call passes; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """A call let through as the half-open probe never ran; let another one probe"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self.state = "closed"
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the breaker"""
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class Backend:
+    """
+    Timeouts, adaptive concurrency, circuit breaking and hedging for one backend
+
+    Clients keep their own transport timeouts (ollama/qdrant clients are built
+    with `timeout`); a call that returns but took longer than `timeout` still
+    counts as a failure so a slow backend opens the breaker. Only backend
+    failures (see `is_backend_failure`) count; other errors are passed on.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30.0,
+        queue_timeout: float = 10.0,
+        limiter: Optional[AIMDLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_quantile: float = 0.95,
+        hedge_workers: int = 32
+    ):
+        """
+        Args:
+            name: Backend name used in logs and stats
+            timeout: Seconds after which a call counts as failed
+            queue_timeout: Seconds to wait for a concurrency slot before shedding the call
+            limiter: Concurrency limiter (default AIMDLimiter())
+            breaker: Circuit breaker (default CircuitBreaker())
+            hedge_quantile: Latency quantile after which a hedged call sends its backup request
+            hedge_workers: Threads running the requests of hedged calls
+        """
+        self.name = name
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.limiter = limiter or AIMDLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_quantile = hedge_quantile
+        self._latencies = deque(maxlen=200)
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix=f"hedge-{name}")
+        self._counts = {"ok": 0, "failed": 0, "errors": 0, "shed": 0, "rejected": 0, "hedged": 0}
+
+    def call(self, fn: Callable, *args, cost: float = 1.0, **kwargs) -> Any:
+        """
+        Call `fn(*args, **kwargs)` through the breaker and the concurrency limit
+
+        Args:
+            cost: Units of work in the call (e.g. texts in a batch); latency is
+                normalized by it before feeding the limiter
+        """
+        if not self.breaker.allow():
+            self._counts["rejected"] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if not self.limiter.acquire(self.queue_timeout):
+            self._counts["shed"] += 1
+            self.breaker.release_probe()
+            raise OverloadedError(f"{self.name} is at its concurrency limit ({int(self.limiter.limit)})")
+
+        start = time.monotonic()
+        ok = False
+        error = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = time.monotonic() - start <= self.timeout
+            return result
+        except Exception as e:
+            # The backend answered, just not with a result (e.g. 404 for an empty knowledge base)
+            ok = error = not is_backend_failure(e)
+            raise
+        finally:
+            latency = time.monotonic() - start
+            self.limiter.release(latency / max(cost, 1.0), ok)
+            if ok:
+                self._latencies.append(latency)
+                self._counts["errors" if error else "ok"] += 1
+                self.breaker.record_success()
+            else:
+                self._counts["failed"] += 1
+                if self.breaker.record_failure():
+                    logger.warning(f"{self.name} circuit opened after {latency:.2f}s call")
+
+    def hedge_delay(self) -> float:
+        """Latency quantile of recent successful calls; half the timeout until there is history"""
+        if len(self._latencies) < 20:
+            return self.timeout / 2
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    def hedged(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Call `fn` and, if it hasn't answered within the hedge delay, send a
+        backup request and return whichever succeeds first; raises only if
+        both fail. Only for idempotent reads. The delay counts from when the
+        request starts running, not from when it was queued for a hedge
+        thread. No backup is sent while the limiter is saturated, so hedging
+        never adds load to a struggling backend.
+        """
+        started = threading.Event()
+
+        def primary():
+            started.set()
+            return self.call(fn, *args, **kwargs)
+
+        first = self._executor.submit(primary)
+        started.wait()
+        done, _ = wait([first], timeout=self.hedge_delay())
+        if done or self.limiter.inflight >= int(self.limiter.limit):
+            return first.result()
+
+        self._counts["hedged"] += 1
+        pending = {first, self._executor.submit(self.call, fn, *args, **kwargs)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request finishes on its hedge thread and is ignored
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.breaker.state,
+            "limit": round(self.limiter.limit, 2),
+            "inflight": self.limiter.inflight,
+            "hedge_delay": round(self.hedge_delay(), 4),
+            **self._counts,
+        }
+
+
+_backends: Dict[str, Backend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str, **kwargs) -> Backend:
+    """Process-wide Backend per name, so every client of one service shares its limit and breaker"""
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = Backend(name, **kwargs)
+            _backends[name] = backend
+        return backend
+
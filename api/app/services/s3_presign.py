@@ -13,6 +13,8 @@ s3_client = boto3.client(
 )
 
 BUCKET = os.getenv("S3_BUCKET", "insightscanx")
+MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", 100 * 1024 * 1024))
+MULTIPART_PART_SIZE = int(os.getenv("S3_MULTIPART_PART_SIZE", 64 * 1024 * 1024))
 
 def make_s3_key(knowledge_name: str, doc_id: str) -> str:
     return f"knowledge-data/{knowledge_name}/{doc_id}"
@@ -39,6 +41,38 @@ def presign_put_url(key: str, content_type: str = None, expires=900):
     
     return presigned_url
 
+def create_multipart_upload(key: str, content_type: str = None) -> str:
+    params = {'Bucket': BUCKET, 'Key': key}
+    if content_type:
+        params['ContentType'] = content_type
+    return s3_client.create_multipart_upload(**params)['UploadId']
+
+def presign_upload_part_urls(key: str, upload_id: str, size: int, part_size: int = MULTIPART_PART_SIZE, expires=3600):
+    """Presigned PUT URL per part; signing is local, so this makes no S3 calls"""
+    part_count = max((size + part_size - 1) // part_size, 1)
+    return [
+        {
+            "part_number": n,
+            "url": s3_client.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': BUCKET, 'Key': key, 'UploadId': upload_id, 'PartNumber': n},
+                ExpiresIn=expires
+            ),
+        }
+        for n in range(1, part_count + 1)
+    ]
+
+def complete_multipart_upload(key: str, upload_id: str, parts: list[dict]):
+    return s3_client.complete_multipart_upload(
+        Bucket=BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': p['part_number'], 'ETag': p['etag']} for p in parts]}
+    )
+
+def abort_multipart_upload(key: str, upload_id: str):
+    s3_client.abort_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload_id)
+
 def presign_delete_url(key: str, expires=900):
     params = {'Bucket': BUCKET, 'Key': key}
     
@@ -58,3 +92,17 @@ def delete_s3_object(key: str):
     except ClientError as e:
         print(f"Error deleting S3 object {key}: {e}")
         raise
+
+def delete_s3_objects(keys: list[str]) -> int:
+    """Delete many objects, 1000 keys per request; returns how many were deleted"""
+    deleted = 0
+    for i in range(0, len(keys), 1000):
+        response = s3_client.delete_objects(
+            Bucket=BUCKET,
+            Delete={'Objects': [{'Key': key} for key in keys[i:i + 1000]], 'Quiet': True}
+        )
+        errors = response.get('Errors', [])
+        for error in errors:
+            print(f"Error deleting S3 object {error['Key']}: {error.get('Message')}")
+        deleted += len(keys[i:i + 1000]) - len(errors)
+    return deleted
@@ -0,0 +1,107 @@
+import os, shutil, threading
+from collections import OrderedDict
+from app.services.s3_presign import s3_client, delete_s3_objects, BUCKET
+
+# Same layout as the worker's TableStore: Parquet per table, one row group per row chunk
+TABLES_PREFIX = "knowledge-tables/"
+# Set when the worker keeps tables on a shared volume instead of S3
+TABLE_STORE_DIR = os.getenv("TABLE_STORE_DIR") or None
+
+def table_uri(knowledge_id: str, doc_id: str, index: int) -> str:
+    key = f"{TABLES_PREFIX}{knowledge_id}/{doc_id}/{index}.parquet"
+    return os.path.join(TABLE_STORE_DIR, key) if TABLE_STORE_DIR else f"s3://{BUCKET}/{key}"
+
+def markdown_rows(columns: list[str], rows: list[list[str]]) -> str:
+    def row(cells): return "| " + " | ".join(str(c).replace("|", "\\|").replace("\n", " ") for c in cells) + " |"
+    return "\n".join([row(columns), "| " + " | ".join("---" for _ in columns) + " |"] + [row(r) for r in rows])
+
+class TableRowStore:
+    """Reads only the row groups a request needs from Parquet tables, with an LRU of recent groups"""
+
+    def __init__(self, max_groups: int = 256):
+        self.max_groups = max_groups
+        self._cache: OrderedDict[tuple[str, int], tuple[list[str], list[list[str]]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._s3 = None
+
+    def _open(self, uri: str):
+        import pyarrow.parquet as pq
+        if not uri.startswith("s3://"):
+            return pq.ParquetFile(uri)
+        if self._s3 is None:
+            from pyarrow import fs
+            self._s3 = fs.S3FileSystem(access_key=os.getenv("AWS_ACCESS_KEY_ID"), secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                                       region=os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION"))
+        # Ranged reads: the footer, then just the requested row groups
+        return pq.ParquetFile(self._s3.open_input_file(uri[len("s3://"):]))
+
+    def row_group(self, uri: str, group: int, parquet=None) -> tuple[list[str], list[list[str]]]:
+        key = (uri, group)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        table = (parquet or self._open(uri)).read_row_group(group)
+        value = (table.column_names, [list(r) for r in zip(*(c.to_pylist() for c in table.columns))])
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.max_groups:
+                self._cache.popitem(last=False)
+        return value
+
+    def rows(self, uri: str, offset: int, limit: int) -> dict:
+        """Rows [offset, offset + limit) of a table, reading the overlapping row groups only"""
+        parquet = self._open(uri)
+        meta = parquet.metadata
+        columns, rows, start = parquet.schema_arrow.names, [], 0
+        for group in range(meta.num_row_groups):
+            size = meta.row_group(group).num_rows
+            if start + size > offset and start < offset + limit:
+                _, group_rows = self.row_group(uri, group, parquet)
+                rows.extend(group_rows[max(offset - start, 0):offset + limit - start])
+            start += size
+        return {"columns": columns, "rows": rows, "offset": offset, "total_rows": meta.num_rows}
+
+    def hydrate(self, hits: list[dict]) -> list[dict]:
+        """Fill in the text of table row chunks from their row group"""
+        for h in hits:
+            table = h.get("table") or {}
+            if h.get("text") or table.get("row_group") is None:
+                continue
+            try:
+                columns, rows = self.row_group(table["uri"], table["row_group"])
+            except (OSError, IndexError) as e:
+                print(f"Error reading table rows {table['uri']}#{table['row_group']}: {e}")
+                continue
+            title = table.get("title") or f"Table {table['index'] + 1}"
+            h["text"] = f"{title} (rows {table['row_from'] + 1}-{table['row_to']})\n\n{markdown_rows(columns, rows)}"
+        return hits
+
+    def invalidate(self, doc_id: str):
+        """Drop cached row groups of a document, e.g. after it was re-ingested"""
+        with self._lock:
+            for key in [k for k in self._cache if f"/{doc_id}/" in k[0]]:
+                del self._cache[key]
+
+table_rows = TableRowStore(max_groups=int(os.getenv("TABLE_ROW_CACHE_SIZE", 256)))
+
+def _delete_prefix(prefix: str) -> int:
+    if TABLE_STORE_DIR:
+        directory = os.path.join(TABLE_STORE_DIR, prefix)
+        if not os.path.isdir(directory): return 0
+        count = sum(len([f for f in files if f.endswith(".parquet")]) for _, _, files in os.walk(directory))
+        shutil.rmtree(directory)
+        return count
+    keys = [
+        o["Key"]
+        for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=BUCKET, Prefix=prefix)
+        for o in page.get("Contents", [])
+    ]
+    return delete_s3_objects(keys) if keys else 0
+
+def delete_document_tables(knowledge_id: str, doc_id: str) -> int:
+    table_rows.invalidate(doc_id)
+    return _delete_prefix(f"{TABLES_PREFIX}{knowledge_id}/{doc_id}/")
+
+def delete_knowledge_tables(knowledge_id: str) -> int:
+    return _delete_prefix(f"{TABLES_PREFIX}{knowledge_id}/")
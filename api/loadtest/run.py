@@ -0,0 +1,224 @@
+import argparse, asyncio, json, os, random, sys, tempfile, threading, time
+from collections import defaultdict
+import numpy as np
+
+# Request mixes the harness can drive, each at its own rate (--rate NAME=RPS)
+WORKLOADS = ("chat_send", "list_docs", "get_upload_url", "patch_status")
+
+class Workloads:
+    """Builds one request of each workload against the seeded (or given) knowledge base"""
+
+    def __init__(self, knowledge_id: str, knowledge_name: str, doc_ids: list[str], session_ids: list[str]):
+        self.kid = knowledge_id
+        self.name = knowledge_name
+        self.doc_ids = doc_ids
+        self.session_ids = session_ids
+        self.questions = [f"what does document {i} say about topic {j}?" for i in range(50) for j in range(20)]
+
+    def request(self, workload: str) -> tuple[str, str, dict]:
+        """(method, path, kwargs for httpx)"""
+        if workload == "chat_send":
+            return "POST", f"/api/chat/chat/sessions/{random.choice(self.session_ids)}/messages", {
+                "json": {"content": random.choice(self.questions)}}
+        if workload == "list_docs":
+            return "GET", f"/api/knowledge/{self.kid}/documents", {}
+        if workload == "get_upload_url":
+            # A bounded name pool exercises both the new-document and the re-upload path
+            return "POST", f"/api/knowledge/{self.kid}/documents/upload-url", {
+                "params": {"knowledge_name": self.name},
+                "json": {"filename": f"upload-{random.randrange(1000)}.pdf", "content_type": "application/pdf"}}
+        if workload == "patch_status":
+            return "PATCH", f"/api/documents/{random.choice(self.doc_ids)}", {"json": {"status": "ready"}}
+        raise ValueError(f"Unknown workload: {workload}")
+
+class Saturation:
+    """Samples DB pool checkouts and busy threadpool threads of the in-process server"""
+
+    def __init__(self, engine, limiter, interval: float = 0.05):
+        self.engine = engine
+        self.limiter = limiter
+        self.interval = interval
+        self.samples: list[tuple[int, float]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="saturation", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append((self.engine.pool.checkedout(), self.limiter.borrowed_tokens))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def report(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        pool = self.engine.pool
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0) if hasattr(pool, "size") else None
+        db = np.array([s[0] for s in self.samples] or [0])
+        threads = np.array([s[1] for s in self.samples] or [0])
+        total = self.limiter.total_tokens
+        return {
+            "db_pool": {"capacity": capacity, "mean": float(db.mean()), "max": int(db.max()),
+                        "saturated_pct": float((db >= capacity).mean() * 100) if capacity else None},
+            "threadpool": {"capacity": total, "mean": float(threads.mean()), "max": int(threads.max()),
+                           "saturated_pct": float((threads >= total).mean() * 100)},
+        }
+
+async def drive(base_url: str, workloads: Workloads, rates: dict[str, float], duration: float,
+                timeout: float, max_in_flight: int) -> dict:
+    """
+    Open-loop load: each workload sends Poisson arrivals at its rate no matter how
+    slow responses are. Latency is measured from the scheduled send time, so time
+    spent waiting for a free client slot counts (no coordinated omission).
+    """
+    import httpx
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    slots = asyncio.Semaphore(max_in_flight)
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one(workload: str, scheduled: float):
+            method, path, kwargs = workloads.request(workload)
+            async with slots:
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    if response.status_code >= 400:
+                        errors[workload][str(response.status_code)] += 1
+                        return
+                except Exception as e:
+                    errors[workload][type(e).__name__] += 1
+                    return
+            latencies[workload].append(time.perf_counter() - scheduled)
+
+        async def generate(workload: str, rate: float, start: float, tasks: list):
+            scheduled = start
+            while True:
+                scheduled += random.expovariate(rate)
+                if scheduled - start >= duration:
+                    return
+                await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+                tasks.append(asyncio.create_task(one(workload, scheduled)))
+
+        tasks: list = []
+        start = time.perf_counter()
+        await asyncio.gather(*(generate(w, r, start, tasks) for w, r in rates.items() if r > 0))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - start
+
+    report = {}
+    for workload, rate in rates.items():
+        if rate <= 0:
+            continue
+        ok = np.array(latencies[workload] or [0.0]) * 1000
+        failed = sum(errors[workload].values())
+        total = len(latencies[workload]) + failed
+        report[workload] = {
+            "target_rps": rate,
+            "requests": total,
+            "throughput_rps": len(latencies[workload]) / wall,
+            "error_rate": failed / total if total else 0.0,
+            "errors": dict(errors[workload]),
+            "latency_ms": {p: float(np.percentile(ok, q)) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        }
+    return report
+
+def start_server(host: str, port: int, threadpool_size: int | None):
+    """Run app.main:app with uvicorn on a background loop; returns (server, loop, thread limiter)"""
+    import anyio.to_thread, uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False))
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(server.serve(),), name="uvicorn", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    async def limiter():
+        # Sync routes run on AnyIO's default thread limiter (40 threads unless resized)
+        lim = anyio.to_thread.current_default_thread_limiter()
+        if threadpool_size:
+            lim.total_tokens = threadpool_size
+        return lim
+    return server, loop, asyncio.run_coroutine_threadsafe(limiter(), loop).result()
+
+def format_report(report: dict) -> str:
+    lines = [f"{'workload':<16} {'target':>7} {'rps':>8} {'errors':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}"]
+    for name, r in report["workloads"].items():
+        lat = r["latency_ms"]
+        lines.append(f"{name:<16} {r['target_rps']:>7.1f} {r['throughput_rps']:>8.1f} {r['error_rate']:>6.1%} "
+                     f"{lat['p50']:>8.1f} {lat['p95']:>8.1f} {lat['p99']:>8.1f}")
+    for name, s in (report.get("saturation") or {}).items():
+        pct = f"{s['saturated_pct']:.1f}%" if s["saturated_pct"] is not None else "n/a"
+        lines.append(f"{name:<16} in use mean={s['mean']:.1f} max={s['max']} of {s['capacity']}, saturated {pct} of the time")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with mixed workloads at fixed arrival rates")
+    parser.add_argument("--rate", action="append", default=[], metavar="WORKLOAD=RPS",
+                        help=f"Requests/s per workload, one of {', '.join(WORKLOADS)} (repeatable)")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout (s)")
+    parser.add_argument("--max-in-flight", type=int, default=512, help="Client connection limit")
+    parser.add_argument("--url", help="Test a running API instead of an in-process one on stand-ins")
+    parser.add_argument("--knowledge-id", help="With --url: knowledge base to use (with --knowledge-name, --doc-id, --session-id)")
+    parser.add_argument("--knowledge-name")
+    parser.add_argument("--doc-id", action="append", default=[])
+    parser.add_argument("--session-id", action="append", default=[])
+    parser.add_argument("--database-url", help="In-process: Postgres instead of SQLite")
+    parser.add_argument("--documents", type=int, default=200, help="Seeded ready documents")
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBED_DIM", 1024)))
+    parser.add_argument("--embed-base-ms", type=float, default=5.0, help="Fake embedding latency per call")
+    parser.add_argument("--embed-item-ms", type=float, default=0.5, help="Fake embedding latency per text")
+    parser.add_argument("--db-pool-size", type=int, help="DB_POOL_SIZE of the in-process API")
+    parser.add_argument("--threadpool-size", type=int, help="Threads for sync routes of the in-process API")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    rates = {w: 0.0 for w in WORKLOADS}
+    for spec in args.rate or ["chat_send=10", "list_docs=20", "get_upload_url=5", "patch_status=10"]:
+        name, _, rps = spec.partition("=")
+        if name not in rates:
+            parser.error(f"Unknown workload '{name}'")
+        rates[name] = float(rps)
+
+    saturation = server = mock_s3 = embed = None
+    if args.url:
+        if not (args.knowledge_id and args.knowledge_name and args.doc_id and args.session_id):
+            parser.error("--url needs --knowledge-id, --knowledge-name, --doc-id and --session-id")
+        base_url = args.url
+        ids = {"knowledge_id": args.knowledge_id, "knowledge_name": args.knowledge_name,
+               "doc_ids": args.doc_id, "session_ids": args.session_id}
+    else:
+        from loadtest.standins import FakeEmbeddingServer, configure_env, seed, start_s3
+        embed = FakeEmbeddingServer(dim=args.dim, base_ms=args.embed_base_ms, per_item_ms=args.embed_item_ms).start()
+        configure_env(tempfile.mkdtemp(prefix="rag-loadtest-"), embed.url, args.dim, args.database_url)
+        if args.db_pool_size:
+            os.environ["DB_POOL_SIZE"] = str(args.db_pool_size)
+        mock_s3 = start_s3()
+        ids = seed(embed, documents=args.documents, chunks_per_doc=args.chunks_per_doc)
+        server, loop, limiter = start_server("127.0.0.1", 8765, args.threadpool_size)
+        base_url = "http://127.0.0.1:8765"
+        from app.db import engine
+        saturation = Saturation(engine, limiter).start()
+
+    print(f"Driving {base_url} for {args.duration:.0f}s: " + ", ".join(f"{w}={r:g}/s" for w, r in rates.items() if r > 0),
+          file=sys.stderr)
+    report = {"workloads": asyncio.run(drive(base_url, Workloads(**ids), rates, args.duration, args.timeout, args.max_in_flight))}
+    if saturation is not None:
+        report["saturation"] = saturation.report()
+        report["embedding_calls"] = {"calls": embed.calls, "texts": embed.texts}
+    if server is not None:
+        server.should_exit = True
+        embed.stop()
+        mock_s3.stop()
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
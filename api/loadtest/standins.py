@@ -0,0 +1,117 @@
+import hashlib, json, os, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+class FakeEmbeddingServer:
+    """
+    Ollama-compatible /api/embed returning deterministic unit vectors (seeded
+    by the text), with a simulated model latency of `base_ms` per call plus
+    `per_item_ms` per input text.
+    """
+
+    def __init__(self, dim: int = 1024, base_ms: float = 5.0, per_item_ms: float = 0.5, port: int = 0):
+        self.dim = dim
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                texts = body.get("input") or []
+                if isinstance(texts, str):
+                    texts = [texts]
+                with server._lock:
+                    server.calls += 1
+                    server.texts += len(texts)
+                time.sleep((server.base_ms + server.per_item_ms * len(texts)) / 1000)
+                payload = json.dumps({"model": body.get("model"), "embeddings": [server.vector(t) for t in texts]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+
+    def vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+def configure_env(workdir: str, embed_url: str, dim: int, db_url: str | None = None):
+    """Point the API at the stand-ins; must run before `app` is imported"""
+    os.environ["DATABASE_URL"] = db_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    os.environ["QDRANT_URL"] = ":memory:"
+    os.environ["OLLAMA_HOST"] = embed_url
+    os.environ["EMBED_BACKEND"] = "ollama"
+    os.environ["EMBED_DIM"] = str(dim)
+    os.environ["S3_BUCKET"] = "loadtest"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+def start_s3():
+    """moto's in-process S3 with the bucket created; returns the mock to stop later"""
+    from moto import mock_aws
+    import boto3
+    mock = mock_aws()
+    mock.start()
+    boto3.client("s3", region_name=os.environ["AWS_REGION"]).create_bucket(Bucket=os.environ["S3_BUCKET"])
+    return mock
+
+def seed(embed: FakeEmbeddingServer, documents: int = 200, chunks_per_doc: int = 20, sessions: int = 50) -> dict:
+    """
+    Create a knowledge base with ready documents, their chunk points in
+    Qdrant, and chat sessions. Returns the ids the workloads use.
+    """
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+    from app.db import Base, SessionLocal, engine
+    from app.models import ChatSession, Document, Knowledge
+    from app.services.qdrant import client
+
+    Base.metadata.create_all(engine)
+    kid, name = str(uuid.uuid4()), "loadtest"
+    doc_ids = [str(uuid.uuid4()) for _ in range(documents)]
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    with SessionLocal() as db:
+        db.add(Knowledge(id=kid, name=name))
+        db.flush()
+        db.add_all(
+            Document(id=doc_id, knowledge_id=kid, filename=f"doc-{i}.pdf", s3_key=f"s3://{os.environ['S3_BUCKET']}/knowledge-data/{name}/{doc_id}",
+                     status="ready", chunk_count=chunks_per_doc)
+            for i, doc_id in enumerate(doc_ids)
+        )
+        db.add_all(ChatSession(id=sid, knowledge_id=kid) for sid in session_ids)
+        db.commit()
+
+    client.create_collection(kid, vectors_config=VectorParams(size=embed.dim, distance=Distance.COSINE))
+    points = []
+    for doc_id in doc_ids:
+        for idx in range(chunks_per_doc):
+            text = f"chunk {idx} of document {doc_id}"
+            points.append(PointStruct(
+                id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:{idx}")),
+                vector=embed.vector(text),
+                payload={"doc_id": doc_id, "knowledge_id": kid, "chunk_index": idx, "text": text, "heading_path": []},
+            ))
+    for i in range(0, len(points), 1000):
+        client.upsert(kid, points=points[i:i + 1000])
+    return {"knowledge_id": kid, "knowledge_name": name, "doc_ids": doc_ids, "session_ids": session_ids}
@@ -0,0 +1,58 @@
+import os
+import json
+import logging
+import argparse
+
+from src.embed import Embed
+from src.evaluation import RetrievalEvaluator, load_questions, sweep, format_report
+from src.vectorstore import QdrantVectorStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger('rag_worker')
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation (recall@k, MRR, nDCG, latency, QPS)")
+    parser.add_argument("questions", help="JSONL file with labelled questions")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--top-docs", type=int, action="append",
+                        help="Two-stage retrieval over the N closest documents, 0 = flat (repeatable, compares each)")
+    parser.add_argument("--sweep", help="JSON file with a list of chunking/index configs to compare")
+    parser.add_argument("--corpus", help="Directory of corpus documents for --sweep (doc_id = file stem)")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    embed = Embed(model=os.getenv("EMBED_MODEL", "qwen3-embedding:0.6b"))
+
+    if args.sweep:
+        if not args.corpus:
+            parser.error("--sweep requires --corpus")
+        with open(args.sweep, encoding="utf-8") as f:
+            configs = json.load(f)
+        reports = sweep(configs, args.corpus, questions, embed, concurrency=args.concurrency)
+    else:
+        # Evaluate the live index through the same routing and filters as chat
+        store = QdrantVectorStore(
+            host=os.getenv("QDRANT_HOST", "qdrant"),
+            port=os.getenv("QDRANT_PORT", 6333),
+            tenancy=os.getenv("QDRANT_TENANCY", "dedicated"),
+            shared_collection=os.getenv("QDRANT_SHARED_COLLECTION", "rag_chunks")
+        )
+        reports = []
+        for top_docs in args.top_docs or [0]:
+            report = RetrievalEvaluator(store, embed, top_k=args.top_k, concurrency=args.concurrency, top_docs=top_docs).run(questions)
+            report["config"] = f"live top_docs={top_docs}" if top_docs else "live flat"
+            reports.append(report)
+
+    print(format_report(reports))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    main()
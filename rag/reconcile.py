@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import logging
+import argparse
+
+import boto3
+
+from src.reconcile import TASKS, Reconciler
+from src.vectorstore import QdrantVectorStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger('rag_worker')
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete vectors, S3 objects, rows and scratch files no document accounts for")
+    parser.add_argument("--only", action="append", choices=TASKS, help="Only run these tasks (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting it")
+    parser.add_argument("--rate", type=float, default=float(os.getenv("RECONCILE_RATE", 0)) or None,
+                        help="Max points, objects or rows deleted per second")
+    parser.add_argument("--min-age", type=float, default=float(os.getenv("RECONCILE_MIN_AGE", 3600)),
+                        help="Seconds an orphan must exist before it is deleted")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=float(os.getenv("RECONCILE_INTERVAL", 0)),
+                        help="Run every N seconds instead of once")
+    args = parser.parse_args()
+
+    store = QdrantVectorStore(
+        host=os.getenv("QDRANT_HOST", "qdrant"),
+        port=os.getenv("QDRANT_PORT", 6333),
+        vector_size=int(os.getenv("EMBED_DIM", 1024)),
+        tenancy=os.getenv("QDRANT_TENANCY", "dedicated"),
+        shared_collection=os.getenv("QDRANT_SHARED_COLLECTION", "rag_chunks")
+    )
+    s3_client = boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_REGION", "ap-northeast-1")
+    )
+    reconciler = Reconciler(
+        store,
+        database_url=os.environ["DATABASE_URL"],
+        s3_client=s3_client,
+        bucket=os.getenv("S3_BUCKET"),
+        page_size=args.page_size,
+        rate=args.rate,
+        min_age=args.min_age,
+        dry_run=args.dry_run
+    )
+
+    while True:
+        print(json.dumps(reconciler.run(args.only), indent=2))
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
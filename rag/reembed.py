@@ -0,0 +1,82 @@
+import os
+import json
+import logging
+import argparse
+import boto3
+
+from src.embed import Embed
+from src.reembed import ChunkTextSource, Reembedder
+from src.tables import TableStore
+from src.vectorstore import QdrantVectorStore, TenantLocks
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger('rag_worker')
+
+def main():
+    parser = argparse.ArgumentParser(description="Blue/green re-embedding of all collections with a new embedding model")
+    parser.add_argument("command", choices=["run", "switch", "status", "docs"],
+                        help="run: copy into model-versioned collections; switch: catch up and swap aliases; "
+                             "status: show checkpoints; docs: rebuild document-level vectors from chunk vectors")
+    parser.add_argument("--model", default=os.getenv("EMBED_MODEL", "qwen3-embedding:0.6b"), help="New embedding model")
+    parser.add_argument("--dim", type=int, default=int(os.getenv("EMBED_DIM", 1024)), help="Dimension of the new model")
+    parser.add_argument("--previous-model", default=os.getenv("PREVIOUS_EMBED_MODEL"),
+                        help="Model of collections not yet versioned; switch keeps a copy of them under its name")
+    parser.add_argument("--lock-timeout", type=float, default=60, help="Seconds switch waits for in-flight ingests")
+    parser.add_argument("--knowledge-id", action="append", help="Only these logical collections (repeatable)")
+    parser.add_argument("--partition", type=int, default=0, help="Partition of the point id space handled by this worker")
+    parser.add_argument("--partitions", type=int, default=1, help="Number of workers splitting the job")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--rate", type=float, help="Max texts embedded per second")
+    parser.add_argument("--checkpoint-dir", default=os.getenv("REEMBED_CHECKPOINT_DIR", "/app/tmp/reembed"))
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL")
+    store = QdrantVectorStore(
+        host=os.getenv("QDRANT_HOST", "qdrant"),
+        port=os.getenv("QDRANT_PORT", 6333),
+        vector_size=args.dim,
+        tenancy=os.getenv("QDRANT_TENANCY", "dedicated"),
+        shared_collection=os.getenv("QDRANT_SHARED_COLLECTION", "rag_chunks"),
+        # Shared with the workers' ingests, so switches never run underneath one
+        tenant_locks=TenantLocks(database_url)
+    )
+    reembedder = Reembedder(
+        store,
+        Embed(model=args.model),
+        model=args.model,
+        batch_size=args.batch_size,
+        rate=args.rate,
+        checkpoint_dir=args.checkpoint_dir,
+        text_source=ChunkTextSource(database_url) if database_url else None,
+        previous_model=args.previous_model,
+        lock_timeout=args.lock_timeout,
+        # Table row chunks are re-embedded from their Parquet row group
+        tables=TableStore(
+            s3_client=boto3.client(
+                's3',
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                region_name=os.getenv("AWS_REGION", "ap-northeast-1")
+            ),
+            bucket=os.getenv("S3_BUCKET"),
+            local_dir=os.getenv("TABLE_STORE_DIR") or None
+        )
+    )
+
+    if args.command == "run":
+        reembedder.run(args.knowledge_id, partition=args.partition, partitions=args.partitions)
+    elif args.command == "switch":
+        switched = reembedder.switch(args.knowledge_id)
+        logger.info(f"Switched {len(switched)} collections to {args.model}")
+    elif args.command == "docs":
+        for logical in sorted(reembedder.logical_collections(args.knowledge_id)):
+            store.rebuild_doc_vectors(logical)
+    else:
+        print(json.dumps(reembedder.checkpoints(), indent=2))
+
+if __name__ == "__main__":
+    main()
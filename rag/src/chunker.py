@@ -0,0 +1,268 @@
+import bisect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger('rag_worker.chunker')
+
+
+def _label(item) -> str:
+    label = getattr(item, 'label', '')
+    return getattr(label, 'value', label) or ''
+
+
+def _page_span(item):
+    pages = [p.page_no for p in (getattr(item, 'prov', None) or []) if getattr(p, 'page_no', None) is not None]
+    if not pages:
+        return None, None
+    return min(pages), max(pages)
+
+
+def _table_data(item, document):
+    """(columns, body rows, caption) of a Docling table; header rows are joined per column"""
+    grid = getattr(getattr(item, 'data', None), 'grid', None) or []
+    header = []
+    while len(header) < len(grid) and grid[len(header)] and any(c.column_header for c in grid[len(header)]):
+        header.append(grid[len(header)])
+    width = max((len(row) for row in grid), default=0)
+    columns = []
+    for i in range(width):
+        # Spanning header cells repeat in every column they cover
+        parts = []
+        for row in header:
+            text = (row[i].text or '').strip() if i < len(row) else ''
+            if text and (not parts or parts[-1] != text):
+                parts.append(text)
+        columns.append(" / ".join(parts) or f"column_{i + 1}")
+    rows = [[(c.text or '').strip() for c in row] for row in grid[len(header):]]
+    caption = ''
+    if hasattr(item, 'caption_text'):
+        caption = (item.caption_text(document) or '').strip()
+    return columns, rows, caption
+
+
+def iter_docling_blocks(document) -> Iterator[Dict[str, Any]]:
+    """
+    Walk a DoclingDocument in reading order and yield one block per element
+
+    Each block is a dict with 'type' (heading|text|table|code), 'text',
+    'page_from' and 'page_to'. Headings also carry a 'level'; tables also
+    carry their cells as 'columns' and 'rows', and a 'caption'.
+    """
+    for item, _ in document.iterate_items():
+        label = _label(item)
+        page_from, page_to = _page_span(item)
+        block = {"page_from": page_from, "page_to": page_to}
+
+        if label in ('title', 'section_header'):
+            text = (getattr(item, 'text', '') or '').strip()
+            if not text:
+                continue
+            level = 0 if label == 'title' else getattr(item, 'level', 1)
+            block.update(type='heading', level=level, text=text)
+        elif label == 'table':
+            text = item.export_to_markdown(doc=document)
+            if not text:
+                continue
+            columns, rows, caption = _table_data(item, document)
+            block.update(type='table', text=text, columns=columns, rows=rows, caption=caption)
+        elif label == 'code':
+            text = getattr(item, 'text', '') or ''
+            if not text:
+                continue
+            block.update(type='code', text=f"```\n{text}\n```")
+        else:
+            text = getattr(item, 'text', '') or ''
+            if not text.strip():
+                continue
+            if label == 'list_item':
+                text = f"- {text}"
+            block.update(type='text', text=text)
+        yield block
+
+
+def iter_batches(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of up to `size` items without materializing the iterable"""
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class StreamingChunker:
+    """Split a stream of document blocks into chunks section by section"""
+
+    def __init__(
+        self,
+        splitter,
+        max_section_chars: int = 200_000,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        parallelism: int = 1,
+        max_tokens: Optional[int] = None
+    ):
+        """
+        Args:
+            splitter: semantic_text_splitter splitter (MarkdownSplitter/TextSplitter)
+            max_section_chars: Flush a section early once its text grows past this size,
+                so a document without headings does not build up in memory
+            count_tokens: Optional tokenizer callback used to fill 'token_count'
+            parallelism: Number of sections split concurrently; sections are read
+                in windows of this size, so memory stays bounded
+            max_tokens: Upper chunk capacity, in count_tokens units; bounds the
+                pre-cut table chunks, which pass through unsplit
+        """
+        self.splitter = splitter
+        self.max_section_chars = max_section_chars
+        self.count_tokens = count_tokens
+        self.parallelism = max(parallelism, 1)
+        self.max_tokens = max_tokens
+
+    def iter_sections(self, blocks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Group blocks into sections delimited by headings
+
+        Tables and code blocks form sections of their own so every chunk has a
+        single element type. Blocks carrying 'table' metadata (see tables.py)
+        pass through as sections of their own that are never split. Yields
+        dicts with 'heading_path', 'element_type', 'text' and 'spans', where
+        spans is a list of (char_offset, page_from, page_to) for every block
+        in the section.
+        """
+        heading_stack: List[tuple] = []
+        parts: List[str] = []
+        spans: List[tuple] = []
+        size = 0
+        element_type = 'text'
+        has_body = False
+
+        def flush():
+            nonlocal parts, spans, size, has_body
+            section = None
+            if parts:
+                section = {
+                    "heading_path": [text for _, text in heading_stack],
+                    "element_type": element_type,
+                    "text": "\n\n".join(parts),
+                    "spans": spans,
+                }
+            parts, spans, size, has_body = [], [], 0, False
+            return section
+
+        for block in blocks:
+            # Table description/row blocks are sized already: one section, one chunk each
+            if block.get('table'):
+                if has_body:
+                    yield flush()
+                flush()
+                element_type = 'text'
+                yield {
+                    "heading_path": [text for _, text in heading_stack],
+                    "element_type": block['type'],
+                    "text": block['text'],
+                    "spans": [(0, block.get('page_from'), block.get('page_to'))],
+                    "table": block['table'],
+                }
+                continue
+
+            # Headings without a body yet stay attached to whatever follows them
+            if block['type'] == 'heading':
+                if has_body:
+                    yield flush()
+                element_type = 'text'
+            else:
+                if has_body and block['type'] != element_type:
+                    yield flush()
+                element_type = block['type']
+                has_body = True
+
+            if block['type'] == 'heading':
+                level = block.get('level', 1)
+                while heading_stack and heading_stack[-1][0] >= level:
+                    heading_stack.pop()
+                heading_stack.append((level, block['text']))
+                text = f"{'#' * max(level, 1)} {block['text']}"
+            else:
+                text = block['text']
+
+            spans.append((size, block.get('page_from'), block.get('page_to')))
+            parts.append(text)
+            size += len(text) + 2
+
+            if size >= self.max_section_chars and has_body:
+                yield flush()
+
+        section = flush()
+        if section:
+            yield section
+
+    @staticmethod
+    def _section_pages(spans: List[tuple], start: int, end: int):
+        starts = [s[0] for s in spans]
+        first = max(bisect.bisect_right(starts, start) - 1, 0)
+        last = max(bisect.bisect_left(starts, end) - 1, first)
+        pages_from = [s[1] for s in spans[first:last + 1] if s[1] is not None]
+        pages_to = [s[2] for s in spans[first:last + 1] if s[2] is not None]
+        return (min(pages_from) if pages_from else None,
+                max(pages_to) if pages_to else None)
+
+    def _split_section(self, section: Dict[str, Any]) -> List[tuple]:
+        if section.get("table"):
+            return [(0, section["text"])]
+        return self.splitter.chunk_indices(section["text"])
+
+    def _split_window(self, window: List[Dict[str, Any]], pool: ThreadPoolExecutor) -> List[List[tuple]]:
+        if len(window) == 1:
+            return [self._split_section(window[0])]
+        # Newer semantic_text_splitter releases split batches across its own thread pool
+        chunk_all_indices = getattr(self.splitter, 'chunk_all_indices', None)
+        if chunk_all_indices is not None:
+            split = iter(chunk_all_indices([section["text"] for section in window if not section.get("table")]))
+            return [self._split_section(section) if section.get("table") else next(split) for section in window]
+        return list(pool.map(self._split_section, window))
+
+    def _to_chunks(self, section: Dict[str, Any], indices: List[tuple]) -> Iterator[Dict[str, Any]]:
+        for offset, text in indices:
+            page_from, page_to = self._section_pages(section["spans"], offset, offset + len(text))
+            yield {
+                "text": text,
+                "heading_path": section["heading_path"],
+                "element_type": section["element_type"],
+                "page_from": page_from,
+                "page_to": page_to,
+                "token_count": self.count_tokens(text) if self.count_tokens else None,
+                "table": section.get("table"),
+            }
+
+    def iter_chunks(self, blocks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield chunks with their heading path, element type, page span and token count
+
+        At most `parallelism` sections are held in memory at a time.
+        """
+        sections = self.iter_sections(blocks)
+        if self.parallelism == 1:
+            for section in sections:
+                yield from self._to_chunks(section, self._split_section(section))
+            return
+
+        with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+            for window in iter_batches(sections, self.parallelism):
+                for section, indices in zip(window, self._split_window(window, pool)):
+                    yield from self._to_chunks(section, indices)
+
+
+if __name__ == "__main__":
+    from semantic_text_splitter import MarkdownSplitter
+
+    blocks = [
+        {"type": "heading", "level": 1, "text": "Intro", "page_from": 1, "page_to": 1},
+        {"type": "text", "text": "Hello world. " * 200, "page_from": 1, "page_to": 1},
+        {"type": "heading", "level": 2, "text": "Details", "page_from": 2, "page_to": 2},
+        {"type": "text", "text": "More text. " * 300, "page_from": 2, "page_to": 3},
+    ]
+    chunker = StreamingChunker(MarkdownSplitter.from_tiktoken_model("gpt-4o", capacity=(200, 300), overlap=20))
+    for chunk in chunker.iter_chunks(blocks):
+        print(chunk["heading_path"], chunk["element_type"], chunk["page_from"], chunk["page_to"], len(chunk["text"]))
@@ -0,0 +1,207 @@
+import gc
+import os
+import json
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .chunker import iter_docling_blocks
+from .extract import pdf_needs_ocr, pdf_page_count
+from .memory import MB, JobMemory, rss_bytes
+
+logger = logging.getLogger('rag_worker.conversion')
+
+# Docling converters of a conversion child, built once per process
+_converters: Dict[str, Any] = {}
+
+
+def _init_child():
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+
+    # OCR only runs for scans and PDFs with pages lacking a text layer
+    _converters["default"] = DocumentConverter()
+    _converters["text_layer"] = DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=PdfPipelineOptions(do_ocr=False))}
+    )
+
+
+def _convert(path: str, fmt: str, low_memory: bool, page_window: int, out_dir: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Convert a document in the child and spill its blocks to a JSONL file, so
+    only the file path crosses the process boundary instead of the
+    DoclingDocument. Low-memory mode converts PDFs `page_window` pages at a
+    time and drops each window before the next.
+    """
+    ocr = fmt == "pdf" and pdf_needs_ocr(path)
+    converter = _converters["default" if fmt != "pdf" or ocr else "text_layer"]
+    fd, out_path = tempfile.mkstemp(prefix="blocks_", suffix=".jsonl", dir=out_dir)
+    blocks = 0
+    with JobMemory(path) as memory, os.fdopen(fd, "w", encoding="utf-8") as out:
+        memory.enter("converting")
+        if low_memory:
+            pages = pdf_page_count(path)
+            windows = [(first, min(first + page_window - 1, pages)) for first in range(1, pages + 1, page_window)]
+        else:
+            windows = [None]
+        try:
+            for page_range in windows:
+                if page_range is None:
+                    document = converter.convert(path).document
+                else:
+                    document = converter.convert(path, page_range=page_range).document
+                for block in iter_docling_blocks(document):
+                    out.write(json.dumps(block, ensure_ascii=False) + "\n")
+                    blocks += 1
+                del document
+                gc.collect()
+        except BaseException:
+            out.close()
+            os.remove(out_path)
+            raise
+    stage = memory.stages["converting"]
+    return out_path, {
+        "pid": os.getpid(),
+        "blocks": blocks,
+        "ocr": ocr,
+        "low_memory": low_memory,
+        "seconds": stage["seconds"],
+        "peak_rss_mb": stage["peak_rss_mb"],
+        "end_rss_mb": rss_bytes() / MB,
+    }
+
+
+class SpilledBlocks:
+    """
+    Blocks streamed from a child's spill file; the file is removed once read
+    to the end or closed, including when it was never read at all
+    """
+
+    def __init__(self, path: str):
+        self.path: Optional[str] = path
+        self._file = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._file is None:
+            if self.path is None:
+                raise StopIteration
+            self._file = open(self.path, encoding="utf-8")
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise StopIteration
+        return json.loads(line)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+class ConversionPool:
+    """
+    Runs Docling conversion in child processes so its memory is returned to
+    the OS instead of fragmenting the long-lived worker
+
+    Children are recycled after `max_tasks_per_child` conversions, and the
+    whole pool is swapped out when a child reports more than
+    `max_child_rss_mb` resident after a job. PDFs with at least
+    `low_memory_pages` pages or files of `low_memory_file_mb` and up are
+    converted in page windows; a PDF whose child dies mid-conversion (e.g.
+    OOM-killed) is retried once the same way.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_tasks_per_child: Optional[int] = None,
+        max_child_rss_mb: Optional[float] = None,
+        low_memory_pages: Optional[int] = None,
+        low_memory_file_mb: Optional[float] = None,
+        page_window: Optional[int] = None,
+        tmp_dir: Optional[str] = None,
+    ):
+        self.workers = workers or int(os.getenv("CONVERT_WORKERS", os.getenv("INGEST_WORKERS", 1)))
+        self.max_tasks_per_child = max_tasks_per_child or int(os.getenv("CONVERT_MAX_TASKS_PER_CHILD", 20))
+        self.max_child_rss_mb = max_child_rss_mb or float(os.getenv("CONVERT_MAX_CHILD_RSS_MB", 3072))
+        self.low_memory_pages = low_memory_pages or int(os.getenv("LOW_MEMORY_PAGES", 300))
+        self.low_memory_file_mb = low_memory_file_mb or float(os.getenv("LOW_MEMORY_FILE_MB", 50))
+        self.page_window = page_window or int(os.getenv("LOW_MEMORY_PAGE_WINDOW", 25))
+        # Same scratch directory as downloads, so the reconciler sweeps leftovers
+        self.tmp_dir = tmp_dir or os.getenv("CONVERT_TMP_DIR") or os.path.join("/app", "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_child,
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    def _recycle(self, executor: ProcessPoolExecutor, reason: str):
+        """Replace `executor` unless another thread already did; its running conversions still finish"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            logger.info(f"Recycling conversion processes: {reason}")
+            self._executor = self._new_executor()
+        executor.shutdown(wait=False)
+
+    def is_oversize(self, path: str, fmt: str) -> bool:
+        if fmt != "pdf":
+            return False
+        if os.path.getsize(path) >= self.low_memory_file_mb * MB:
+            return True
+        return pdf_page_count(path) >= self.low_memory_pages
+
+    def convert(self, path: str, fmt: str) -> Tuple[SpilledBlocks, Dict[str, Any]]:
+        """
+        Convert a document in a child process
+
+        Returns:
+            (blocks streamed from the child's spill file, conversion stats of the child);
+            close the blocks if they may not be read to the end
+        """
+        low_memory = self.is_oversize(path, fmt)
+        while True:
+            # Submitted under the lock: _recycle swaps the executor under it before
+            # shutting the old one down, so this never submits to a shut-down pool
+            try:
+                with self._lock:
+                    executor = self._executor
+                    future = executor.submit(_convert, path, fmt, low_memory, self.page_window, self.tmp_dir)
+                out_path, stats = future.result()
+                break
+            except BrokenProcessPool as e:
+                self._recycle(executor, f"a conversion process died converting {path}")
+                if low_memory or fmt != "pdf":
+                    # MemoryError makes the ingestion retryable through the retry topic
+                    raise MemoryError(f"Conversion process died converting {path}") from e
+                logger.warning(f"Conversion process died converting {path}, retrying in low-memory mode")
+                low_memory = True
+
+        if stats["end_rss_mb"] > self.max_child_rss_mb:
+            self._recycle(executor, f"process {stats['pid']} at {stats['end_rss_mb']:.0f} MB after converting {path}")
+        logger.debug(f"Converted {path}: {stats}")
+        return SpilledBlocks(out_path), stats
+
+    def close(self):
+        with self._lock:
+            self._executor.shutdown(wait=True, cancel_futures=True)
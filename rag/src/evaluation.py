@@ -0,0 +1,268 @@
+import json
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from .chunker import StreamingChunker, iter_docling_blocks, iter_batches
+from .profiles import ChunkerCache
+from .vectorstore import QdrantVectorStore, chunk_point_id
+
+logger = logging.getLogger('rag_worker.evaluation')
+
+PROFILE_FIELDS = ("preset", "splitter", "tokenizer", "capacity", "overlap")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    Load a labelled question set from JSONL
+
+    Each line holds 'question' and 'knowledge_id', an optional 'section', and
+    at least one of 'relevant_chunks' ([[doc_id, chunk_index], ...]),
+    'answers' (strings expected in a relevant chunk) or 'relevant_doc_ids'.
+    Labels are used in that order of precedence.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _targets(question: Dict[str, Any]) -> set:
+    if question.get("relevant_chunks"):
+        return {(doc_id, int(idx)) for doc_id, idx in question["relevant_chunks"]}
+    if question.get("answers"):
+        return {f"answer:{i}" for i in range(len(question["answers"]))}
+    return set(question.get("relevant_doc_ids") or [])
+
+
+def _hit_target(question: Dict[str, Any], payload: Dict[str, Any]):
+    """Label target matched by a hit, or None if the hit is not relevant"""
+    if question.get("relevant_chunks"):
+        key = (payload.get("doc_id"), payload.get("chunk_index"))
+        return key if key in _targets(question) else None
+    if question.get("answers"):
+        text = (payload.get("text") or "").lower()
+        for i, answer in enumerate(question["answers"]):
+            if answer.lower() in text:
+                return f"answer:{i}"
+        return None
+    doc_id = payload.get("doc_id")
+    return doc_id if doc_id in set(question.get("relevant_doc_ids") or []) else None
+
+
+def score_hits(question: Dict[str, Any], hits: List[Dict[str, Any]], k: int) -> Dict[str, float]:
+    """recall@k, reciprocal rank and nDCG@k with binary gains for one query"""
+    targets = _targets(question)
+    found = set()
+    reciprocal_rank = 0.0
+    dcg = 0.0
+    for rank, hit in enumerate(hits[:k], start=1):
+        target = _hit_target(question, hit.get("payload") or {})
+        if target is None:
+            continue
+        if not reciprocal_rank:
+            reciprocal_rank = 1.0 / rank
+        # A target only earns gain once, so many chunks of one relevant doc don't inflate nDCG
+        if target not in found:
+            found.add(target)
+            dcg += 1.0 / math.log2(rank + 1)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(targets), k) + 1))
+    return {
+        "recall": len(found) / len(targets) if targets else 0.0,
+        "rr": reciprocal_rank,
+        "ndcg": dcg / ideal if ideal else 0.0,
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+class RetrievalEvaluator:
+    """Run labelled questions through the chat search path and report quality and speed"""
+
+    def __init__(self, store: QdrantVectorStore, embed, top_k: int = 8, concurrency: int = 8, top_docs: int = 0):
+        """
+        Args:
+            top_docs: Two-stage retrieval over the closest `top_docs` documents (0 = flat search)
+        """
+        self.store = store
+        self.embed = embed
+        self.top_k = top_k
+        self.concurrency = concurrency
+        self.top_docs = top_docs
+
+    def _run_one(self, question: Dict[str, Any], query: np.ndarray):
+        start = time.perf_counter()
+        hits = self.store.search_knowledge(
+            knowledge_id=question["knowledge_id"],
+            query_embeddings=query[None, :],
+            section=question.get("section"),
+            top_k=self.top_k,
+            top_docs=self.top_docs
+        )[0]
+        return hits, time.perf_counter() - start
+
+    def run(self, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Embed every question first, then time only the searches"""
+        start = time.perf_counter()
+        queries = [
+            vector
+            for batch in iter_batches([q["question"] for q in questions], 32)
+            for vector in self.embed.embed_batch(batch)
+        ]
+        embed_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            results = list(pool.map(self._run_one, questions, queries))
+        wall = time.perf_counter() - start
+
+        scores = [score_hits(q, hits, self.top_k) for q, (hits, _) in zip(questions, results)]
+        latencies_ms = [latency * 1000 for _, latency in results]
+        n = len(questions)
+        return {
+            "queries": n,
+            "top_k": self.top_k,
+            "top_docs": self.top_docs,
+            f"recall@{self.top_k}": sum(s["recall"] for s in scores) / n if n else 0.0,
+            "mrr": sum(s["rr"] for s in scores) / n if n else 0.0,
+            f"ndcg@{self.top_k}": sum(s["ndcg"] for s in scores) / n if n else 0.0,
+            "latency_ms": {
+                "p50": percentile(latencies_ms, 50),
+                "p95": percentile(latencies_ms, 95),
+                "p99": percentile(latencies_ms, 99),
+            },
+            "qps": n / wall if wall else 0.0,
+            "embed_seconds": embed_seconds,
+        }
+
+
+class CachingEmbed:
+    """Memoize embeddings by text so sweep configs that share chunks embed them once"""
+
+    def __init__(self, embed):
+        self.embed = embed
+        self.cache: Dict[str, np.ndarray] = {}
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        missing = [t for t in dict.fromkeys(texts) if t not in self.cache]
+        if missing:
+            for text, vector in zip(missing, self.embed.embed_batch(missing)):
+                self.cache[text] = vector
+        return np.stack([self.cache[t] for t in texts])
+
+
+def index_corpus(
+    store: QdrantVectorStore,
+    embed,
+    chunker: StreamingChunker,
+    documents: Iterable[tuple],
+    knowledge_id: str,
+    batch_size: int = 32
+) -> int:
+    """
+    Chunk, embed and upsert (doc_id, DoclingDocument) pairs the way the worker does,
+    including the mean-pooled document-level vectors
+
+    Returns:
+        Number of chunks indexed
+    """
+    collection_name = store.router.resolve(knowledge_id)
+    total = 0
+    for doc_id, document in documents:
+        chunk_count = 0
+        doc_vector = None
+        for batch in iter_batches(chunker.iter_chunks(iter_docling_blocks(document)), batch_size):
+            embeddings = embed.embed_batch([chunk["text"] for chunk in batch])
+            doc_vector = embeddings.sum(axis=0) if doc_vector is None else doc_vector + embeddings.sum(axis=0)
+            payloads = [
+                {
+                    "doc_id": doc_id,
+                    "knowledge_id": knowledge_id,
+                    "text": chunk["text"],
+                    "chunk_index": chunk_count + i,
+                    "heading_path": chunk["heading_path"],
+                    "element_type": chunk["element_type"],
+                }
+                for i, chunk in enumerate(batch)
+            ]
+            ids = [chunk_point_id(doc_id, p["chunk_index"]) for p in payloads]
+            if not store.insert_emb(collection_name=collection_name, embeddings=embeddings, payloads=payloads, ids=ids):
+                raise RuntimeError(f"Failed to index chunks of {doc_id}")
+            chunk_count += len(batch)
+        if doc_vector is not None:
+            payload = {"doc_id": doc_id, "knowledge_id": knowledge_id, "chunk_count": chunk_count}
+            if not store.upsert_doc_vector(collection_name, doc_id, doc_vector, payload):
+                raise RuntimeError(f"Failed to index the document vector of {doc_id}")
+        total += chunk_count
+    return total
+
+
+def sweep(
+    configs: List[Dict[str, Any]],
+    corpus_dir: str,
+    questions: List[Dict[str, Any]],
+    embed,
+    vector_size: int = 1024,
+    concurrency: int = 8
+) -> List[Dict[str, Any]]:
+    """
+    Compare chunking/index configs against one question set on in-memory Qdrant
+
+    Each config may set 'name', 'top_k', 'top_docs' and any chunking profile
+    field ('preset', 'splitter', 'tokenizer', 'capacity', 'overlap', see
+    profiles.py). 'quantization' is rejected: in-memory Qdrant ignores it, so
+    compare quantization against a server index instead. Every file in
+    `corpus_dir` is one document whose doc_id is the file stem; questions are
+    searched in a single 'eval' knowledge base.
+    """
+    rejected = [c.get("name") or json.dumps(c, sort_keys=True) for c in configs if c.get("quantization")]
+    if rejected:
+        raise ValueError(f"quantization has no effect on in-memory Qdrant, remove it from: {', '.join(rejected)}")
+
+    from docling.document_converter import DocumentConverter
+
+    converter = DocumentConverter()
+    paths = sorted(p for p in Path(corpus_dir).iterdir() if p.is_file())
+    logger.info(f"Converting {len(paths)} corpus documents...")
+    documents = [(p.stem, converter.convert(str(p)).document) for p in paths]
+    embed = CachingEmbed(embed)
+    questions = [{**q, "knowledge_id": "eval"} for q in questions]
+    # Every config then finds the question vectors cached, not just the ones after the first
+    for batch in iter_batches([q["question"] for q in questions], 32):
+        embed.embed_batch(batch)
+    chunkers = ChunkerCache()
+
+    reports = []
+    for config in configs:
+        name = config.get("name") or json.dumps(config, sort_keys=True)
+        chunker = chunkers.get({k: config[k] for k in PROFILE_FIELDS if k in config})
+        store = QdrantVectorStore(vector_size=vector_size, location=":memory:")
+
+        start = time.perf_counter()
+        chunk_count = index_corpus(store, embed, chunker, documents, "eval")
+        index_seconds = time.perf_counter() - start
+
+        report = RetrievalEvaluator(
+            store, embed, top_k=config.get("top_k", 8), concurrency=concurrency, top_docs=config.get("top_docs", 0)
+        ).run(questions)
+        report.update(config=name, chunks=chunk_count, index_seconds=index_seconds)
+        logger.info(f"[{name}] {json.dumps(report)}")
+        reports.append(report)
+    return reports
+
+
+def format_report(reports: List[Dict[str, Any]]) -> str:
+    lines = [f"{'config':<32} {'chunks':>7} {'recall':>7} {'mrr':>6} {'ndcg':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'qps':>8}"]
+    for r in reports:
+        k = r["top_k"]
+        lines.append(
+            f"{str(r.get('config', '-'))[:32]:<32} {r.get('chunks', '-'):>7} {r[f'recall@{k}']:>7.3f} {r['mrr']:>6.3f} "
+            f"{r[f'ndcg@{k}']:>6.3f} {r['latency_ms']['p50']:>8.1f} {r['latency_ms']['p95']:>8.1f} "
+            f"{r['latency_ms']['p99']:>8.1f} {r['qps']:>8.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,204 @@
+import os
+import time
+import logging
+import threading
+import tracemalloc
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('rag_worker.memory')
+
+MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """Resident set size of a process (default: this one)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        if pid is not None:
+            return 0
+        # Not Linux: peak RSS is the best portable approximation
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class JobMemory:
+    """
+    Peak memory per ingestion stage of one job
+
+    RSS is sampled by a shared background thread while the job is running and
+    on every stage switch, so each stage gets the peak RSS seen while it was
+    current. RSS is per process: with several ingest threads, peaks include
+    the other jobs. With MEMORY_TRACEMALLOC=true the peak of Python-level
+    allocations is also recorded per stage (exact only with INGEST_WORKERS=1).
+    Work done in child processes is reported through `record_child`.
+    """
+
+    _active: "set[JobMemory]" = set()
+    _lock = threading.Lock()
+    _sampler: Optional[threading.Thread] = None
+    sample_interval = float(os.getenv("MEMORY_SAMPLE_INTERVAL", 0.1))
+    use_tracemalloc = os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true"
+
+    def __init__(self, doc_id: str):
+        self.doc_id = doc_id
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.stage: Optional[str] = None
+        self._stage_started = 0.0
+        self.start_rss = rss_bytes()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        cls = type(self)
+        if cls.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        with cls._lock:
+            cls._active.add(self)
+            if cls._sampler is None:
+                cls._sampler = threading.Thread(target=cls._sample_forever, name="memory-sampler", daemon=True)
+                cls._sampler.start()
+        return self
+
+    def stop(self):
+        self.enter(None)
+        with type(self)._lock:
+            type(self)._active.discard(self)
+
+    @classmethod
+    def _sample_forever(cls):
+        while True:
+            time.sleep(cls.sample_interval)
+            rss = rss_bytes()
+            with cls._lock:
+                jobs = list(cls._active)
+            for job in jobs:
+                job._observe(rss)
+
+    def _observe(self, rss: int):
+        stage = self.stage
+        if stage is not None:
+            entry = self.stages[stage]
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], rss / MB)
+
+    def enter(self, stage: Optional[str]):
+        """Make `stage` current (None ends the last one); re-entering a stage accumulates into it"""
+        now = time.perf_counter()
+        self._observe(rss_bytes())
+        if self.stage is not None:
+            entry = self.stages[self.stage]
+            entry["seconds"] += now - self._stage_started
+            if self.use_tracemalloc and tracemalloc.is_tracing():
+                entry["py_peak_mb"] = max(entry.get("py_peak_mb", 0.0), tracemalloc.get_traced_memory()[1] / MB)
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        if stage is not None:
+            # Create the entry before publishing the stage to the sampler thread
+            self.stages.setdefault(stage, {"peak_rss_mb": 0.0, "seconds": 0.0})
+        self.stage = stage
+        self._stage_started = now
+        self._observe(rss_bytes())
+
+    def record_child(self, stage: str, stats: Dict[str, Any]):
+        """Attach memory measured in a child process (e.g. conversion) to a stage"""
+        entry = self.stages.setdefault(stage, {"peak_rss_mb": 0.0, "seconds": 0.0})
+        entry.update({f"child_{k}": v for k, v in stats.items()})
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "start_rss_mb": round(self.start_rss / MB, 1),
+            "end_rss_mb": round(rss_bytes() / MB, 1),
+            "stages": {
+                stage: {k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()}
+                for stage, entry in self.stages.items()
+            },
+        }
+
+
+def write_fixture_pdf(path: str, pages: int = 500, lines_per_page: int = 45):
+    """Write a plain text-layer PDF of `pages` pages (no external dependencies)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Section {page + 1}.{line + 1}: retrieval augmented generation test paragraph {page * lines_per_page + line}"
+                 for line in range(lines_per_page)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 50 790 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import tempfile
+
+    from .conversion import ConversionPool
+
+    # Memory regression check: convert a large PDF repeatedly through the
+    # conversion pool and fail if the worker process grows or a conversion
+    # child exceeds its budget
+    parser = argparse.ArgumentParser(description="Memory regression check of document conversion")
+    parser.add_argument("--pdf", help="PDF to convert (default: a generated text-layer PDF)")
+    parser.add_argument("--pages", type=int, default=400, help="Pages of the generated PDF")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-parent-growth-mb", type=float, default=50)
+    parser.add_argument("--max-child-peak-mb", type=float, default=float(os.getenv("CONVERT_MAX_CHILD_RSS_MB", 3072)))
+    args = parser.parse_args()
+
+    pdf = args.pdf
+    if pdf is None:
+        pdf = os.path.join(tempfile.mkdtemp(), "large.pdf")
+        write_fixture_pdf(pdf, pages=args.pages)
+    print(f"{pdf}: {os.path.getsize(pdf) / MB:.1f} MB")
+
+    pool = ConversionPool()
+    baseline = None
+    child_peak = 0.0
+    for run in range(args.runs):
+        with JobMemory(f"run-{run}") as memory:
+            memory.enter("parsing")
+            blocks, stats = pool.convert(pdf, "pdf")
+            count = sum(1 for _ in blocks)
+            memory.record_child("parsing", stats)
+        parent = rss_bytes() / MB
+        baseline = parent if baseline is None else baseline
+        child_peak = max(child_peak, stats["peak_rss_mb"])
+        print(f"run {run}: {count} blocks, parent rss {parent:.0f} MB, child peak {stats['peak_rss_mb']:.0f} MB, "
+              f"low_memory={stats['low_memory']}, {stats['seconds']:.1f}s")
+    pool.close()
+
+    growth = rss_bytes() / MB - baseline
+    failures = []
+    if growth > args.max_parent_growth_mb:
+        failures.append(f"worker process grew {growth:.0f} MB over {args.runs - 1} runs")
+    if child_peak > args.max_child_peak_mb:
+        failures.append(f"conversion child peaked at {child_peak:.0f} MB")
+    print("FAIL: " + "; ".join(failures) if failures else f"OK: parent growth {growth:.0f} MB, child peak {child_peak:.0f} MB")
+    sys.exit(1 if failures else 0)
@@ -1,17 +1,53 @@
 import os
+import json
 import time
+import hashlib
 import logging
 import boto3
 import requests
 from botocore.exceptions import ClientError
-from semantic_text_splitter import MarkdownSplitter
-from docling.document_converter import DocumentConverter
 
+from .chunker import iter_docling_blocks, iter_batches
+from .conversion import ConversionPool, SpilledBlocks
+from .memory import JobMemory
+from .profiles import ChunkerCache
 from .embed import Embed
-from .vectorstore import QdrantVectorStore
+from .status import StatusWriter
+from .tables import TableStore
+from .extract import TEXT_FORMATS, sniff_format, iter_text_native_blocks, pdf_needs_ocr
+from .vectorstore import QdrantVectorStore, TenantLocks, chunk_point_id
 
 logger = logging.getLogger('rag_worker.rag')
 
+class IngestionError(Exception):
+    """Ingestion failure tagged with the stage it happened in"""
+
+    # Failures here come from the document itself; retrying won't change the outcome
+    PERMANENT_STAGES = ("parsing",)
+
+    def __init__(self, stage: str, cause: Exception):
+        super().__init__(f"{stage}: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+    @property
+    def retryable(self) -> bool:
+        if isinstance(self.cause, (OSError, MemoryError)):
+            return True
+        return self.stage not in self.PERMANENT_STAGES
+
+class DocumentParseError(Exception):
+    """Failure of a lazily extracted block stream, raised while a later stage pulls blocks"""
+
+def parse_errors(blocks):
+    """Tag extractor failures as parsing errors; I/O and memory errors stay retryable"""
+    try:
+        yield from blocks
+    except (OSError, MemoryError):
+        raise
+    except Exception as e:
+        raise DocumentParseError(str(e)) from e
+
 class ChunkingRAG:
     def __init__(self):
         self.s3_client = boto3.client(
@@ -20,10 +56,51 @@ class ChunkingRAG:
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"), 
             region_name=os.getenv("AWS_REGION", "ap-northeast-1")
         )
-        self.document_converter = DocumentConverter()
-        self.splitters = MarkdownSplitter.from_tiktoken_model("gpt-4o", capacity=(800, 1000), overlap=100)
-        self.embed = Embed(model="qwen3-embedding:0.6b")
-        self.qdrant = QdrantVectorStore(host=os.getenv("QDRANT_HOST", "qdrant"), port=os.getenv("QDRANT_PORT", 6333))
+        # Docling runs in recycled child processes unless CONVERT_IN_SUBPROCESS=false
+        self.conversion = None
+        if os.getenv("CONVERT_IN_SUBPROCESS", "true").lower() == "true":
+            self.conversion = ConversionPool(tmp_dir=os.path.join("/app", "tmp"))
+        else:
+            from docling.datamodel.base_models import InputFormat
+            from docling.datamodel.pipeline_options import PdfPipelineOptions
+            from docling.document_converter import DocumentConverter, PdfFormatOption
+
+            # OCR only runs for scans and PDFs with pages lacking a text layer
+            self.document_converter = DocumentConverter()
+            self.text_layer_converter = DocumentConverter(
+                format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=PdfPipelineOptions(do_ocr=False))}
+            )
+        # Large Docling tables are stored once as Parquet and chunked as description + row groups
+        self.tables = TableStore(
+            s3_client=self.s3_client,
+            bucket=os.getenv("S3_BUCKET"),
+            local_dir=os.getenv("TABLE_STORE_DIR") or None,
+            rows_per_chunk=int(os.getenv("TABLE_ROWS_PER_CHUNK", 50)),
+        )
+        self.table_aware = os.getenv("TABLE_AWARE_INGESTION", "true").lower() == "true" and self.tables.enabled
+        self.chunkers = ChunkerCache(parallelism=int(os.getenv("SPLIT_WORKERS", os.cpu_count() or 1)))
+        self.profile_ttl = float(os.getenv("CHUNKING_PROFILE_TTL", 60))
+        self._profiles = {}
+        self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", 32))
+        # Keep-alive session for the API calls that remain (profiles, chunk rows)
+        self.http = requests.Session()
+        # Statuses go straight to Postgres when DATABASE_URL is set, else batched through the API
+        self.status = StatusWriter(
+            database_url=os.getenv("DATABASE_URL"),
+            flush_interval=float(os.getenv("STATUS_FLUSH_INTERVAL", 0.5))
+        )
+        # Changing the model goes through a blue/green re-embedding (reembed.py)
+        self.embed = Embed(model=os.getenv("EMBED_MODEL", "qwen3-embedding:0.6b"))
+        self.qdrant = QdrantVectorStore(
+            host=os.getenv("QDRANT_HOST", "qdrant"),
+            port=os.getenv("QDRANT_PORT", 6333),
+            vector_size=int(os.getenv("EMBED_DIM", 1024)),
+            slim_payload=os.getenv("QDRANT_SLIM_PAYLOAD", "false").lower() == "true",
+            tenancy=os.getenv("QDRANT_TENANCY", "dedicated"),
+            shared_collection=os.getenv("QDRANT_SHARED_COLLECTION", "rag_chunks"),
+            promote_threshold=int(os.getenv("QDRANT_PROMOTE_THRESHOLD", 0)),
+            tenant_locks=TenantLocks(os.getenv("DATABASE_URL"))
+        )
 
     def get_s3_object(self, s3_path: str):
         if s3_path.startswith("s3://"):
@@ -46,33 +123,109 @@ class ChunkingRAG:
                 return False
             raise
 
-    def download_document(self, s3_key: str, file_name: str, max_retries: int = 5, retry_delay: int = 2):
-        save_path = os.path.join("/app", "tmp", file_name)
+    def download_document(self, s3_key: str, file_name: str, doc_id: str | None = None):
+        # Prefix with the doc id so concurrent ingests of same-named files don't collide
+        save_path = os.path.join("/app", "tmp", f"{doc_id}_{file_name}" if doc_id else file_name)
         bucket, key = self.get_s3_object(s3_key)
         logger.info(f"Downloading document from s3://{bucket}/{key} to {save_path}")
         
-        # Wait for file to be available in S3 (with retry)
-        for attempt in range(max_retries):
-            if self.s3_object_exists(bucket, key):
-                logger.debug(f"File found in S3 on attempt {attempt + 1}")
-                break
-            if attempt < max_retries - 1:
-                logger.warning(f"File not found in S3, retrying in {retry_delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                time.sleep(retry_delay)
-            else:
-                error_msg = f"File not found in S3 after {max_retries} attempts: s3://{bucket}/{key}"
-                logger.error(error_msg)
-                raise FileNotFoundError(error_msg)
+        # The upload may not have landed yet; the caller schedules a retry
+        # with backoff instead of sleeping here
+        if not self.s3_object_exists(bucket, key):
+            raise FileNotFoundError(f"File not found in S3: s3://{bucket}/{key}")
         
         self.s3_client.download_file(bucket, key, save_path)
         logger.info(f"Document downloaded successfully to {save_path}")
         return save_path
 
-    def convert_document(self, document_path: str):
-        result = self.document_converter.convert(document_path)
+    def convert_document(self, document_path: str, fmt: str | None = None):
+        fmt = fmt or sniff_format(document_path)
+        converter = self.document_converter
+        if fmt == "pdf" and not pdf_needs_ocr(document_path):
+            converter = self.text_layer_converter
+        result = converter.convert(document_path)
         return result.document
 
-    def upload_document(self, message: dict):
+    def extract_blocks(self, document_path: str, memory: JobMemory | None = None):
+        """
+        Route a file by its magic bytes: text-native formats are streamed by the
+        lightweight extractors, PDFs/Office files/scans go through Docling
+        """
+        fmt = sniff_format(document_path)
+        if fmt in TEXT_FORMATS:
+            logger.debug(f"Extracting {fmt} document with the fast path")
+            return iter_text_native_blocks(document_path, fmt)
+        logger.debug(f"Converting {fmt} document with Docling...")
+        if self.conversion is None:
+            return iter_docling_blocks(self.convert_document(document_path, fmt))
+        blocks, stats = self.conversion.convert(document_path, fmt)
+        if memory is not None:
+            memory.record_child("parsing", stats)
+        return blocks
+
+    def get_chunking_profile(self, knowledge_id: str):
+        """Chunking profile of a knowledge base from the API, cached for CHUNKING_PROFILE_TTL seconds"""
+        cached = self._profiles.get(knowledge_id)
+        if cached and time.monotonic() - cached[0] < self.profile_ttl:
+            return cached[1]
+        try:
+            response = self.http.get(f"http://api:8000/api/knowledge/{knowledge_id}")
+            response.raise_for_status()
+            profile = response.json().get("chunking_profile")
+        except Exception as e:
+            logger.warning(f"Could not load chunking profile for knowledge {knowledge_id}, using default: {e}")
+            profile = cached[1] if cached else None
+        self._profiles[knowledge_id] = (time.monotonic(), profile)
+        return profile
+
+    def save_chunk_metadata(self, doc_id: str, chunks: list, payloads: list, ids: list):
+        """Record chunk metadata in the `chunk` table through the API"""
+        rows = [
+            {
+                "chunk_index": payload["chunk_index"],
+                "section": payload["section"],
+                "page_from": payload["page_from"],
+                "page_to": payload["page_to"],
+                "token_count": payload["token_count"],
+                "text_hash": hashlib.sha1(chunk["text"].encode("utf-8")).hexdigest(),
+                "vector_id": point_id,
+                # Always kept: chat history and the local index read chunk text from here, and with
+                # slim payloads it is the only copy. Table rows live in Parquet only
+                "text": None if self._is_table_rows(chunk) else chunk["text"],
+            }
+            for chunk, payload, point_id in zip(chunks, payloads, ids)
+        ]
+        response = self.http.post(f"http://api:8000/api/documents/{doc_id}/chunks", json=rows)
+        response.raise_for_status()
+
+    @staticmethod
+    def _is_table_rows(chunk: dict) -> bool:
+        return bool(chunk.get("table")) and "row_group" in chunk["table"]
+
+    def update_status(self, doc_id: str, status: str, chunk_count: int | None = None,
+                      stage: str | None = None, detail: str | None = None):
+        """Write a final status, waiting for its batch so it is durable before the offset commit"""
+        self.status.update(doc_id, status=status, chunk_count=chunk_count, stage=stage, detail=detail, wait=True)
+
+    def record_dead_letter(self, doc_id: str, error: "IngestionError", attempts: int):
+        """Mark a document as failed for good and keep the failure context for replay"""
+        detail = json.dumps({"stage": error.stage, "error": str(error.cause), "attempts": attempts})
+        try:
+            self.update_status(doc_id, "error", stage="failed", detail=detail)
+            logger.info(f"Updated document {doc_id} status to 'error'")
+        except Exception as e:
+            logger.error(f"Error updating document status to 'error': {e}", exc_info=True)
+
+    def ingest_document(self, message: dict) -> int:
+        """
+        Download, chunk, embed and upsert one document
+
+        Returns:
+            Number of chunks ingested
+
+        Raises:
+            IngestionError: carrying the stage that failed and whether a retry may help
+        """
         doc_id = message.get('id')
         knowledge_id = message.get('knowledge_id')
         file_name = message.get('filename')
@@ -80,68 +233,132 @@ class ChunkingRAG:
         
         logger.info(f"Starting document ingestion - Doc ID: {doc_id}, Knowledge ID: {knowledge_id}, File: {file_name}, S3 Key: {s3_key}")
         
+        self.status.update(doc_id, stage="downloading")
+        doc_path = None
+        extracted = None
+        # Peak memory per stage, reported in the completion detail
+        memory = JobMemory(doc_id).start()
         try:
-            doc_path = self.download_document(s3_key, file_name)
+            memory.enter("downloading")
+            doc_path = self.download_document(s3_key, file_name, doc_id=doc_id)
             logger.info(f"Document downloaded successfully: {doc_path}")
             
-            logger.debug("Converting document...")
-            document = self.convert_document(doc_path)
-            
-            logger.debug("Splitting document into chunks...")
-            chunks = self.splitters.chunks(document.export_to_markdown())
-            logger.info(f"Document split into {len(chunks)} chunks")
-            
-            logger.debug("Processing chunks and generating embeddings...")
-            for i, chunk in enumerate(chunks):
-                embedding = self.embed.embed(chunk)
-                payload = {
-                    "doc_id": doc_id,
-                    "text": chunk,
-                    'file_name': file_name,
-                    'chunk_index': i
-                }
-                self.qdrant.insert_emb(collection_name=knowledge_id, embeddings=embedding, payloads=payload)
-                if (i + 1) % 10 == 0:
-                    logger.debug(f"Processed {i + 1}/{len(chunks)} chunks")
-            
-            logger.info(f"All chunks processed and inserted into vector store for document {doc_id}")
-            
+            # Only conversion/extraction counts as parsing, the one stage not retried
+            memory.enter("parsing")
+            extracted = self.extract_blocks(doc_path, memory=memory)
+            blocks = parse_errors(extracted)
+
+            # Promotion of the tenant waits for this ingest, and vice versa, so the
+            # collection resolved here stays the one searches read from
+            with self.qdrant.ingest_lock(knowledge_id):
+                memory.enter("preparing")
+                collection_name = self.qdrant.router.resolve(knowledge_id, refresh=True)
+                chunker = self.chunkers.get(self.get_chunking_profile(knowledge_id))
+                tables = self.tables.document(
+                    knowledge_id, doc_id, count_tokens=chunker.count_tokens, max_tokens=chunker.max_tokens
+                ) if self.table_aware else None
+                if tables is not None:
+                    blocks = tables.iter_blocks(blocks)
+                logger.debug(f"Chunking document and generating embeddings into collection '{collection_name}'...")
+                chunk_count = 0
+                # Running sum of chunk embeddings, mean-pooled into the document-level vector
+                doc_vector = None
+                batches = iter_batches(chunker.iter_chunks(blocks), self.embed_batch_size)
+                while True:
+                    memory.enter("chunking")
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+
+                    memory.enter("embedding")
+                    embeddings = self.embed.embed_batch([chunk["text"] for chunk in batch])
+                    batch_sum = embeddings.sum(axis=0)
+                    doc_vector = batch_sum if doc_vector is None else doc_vector + batch_sum
+
+                    memory.enter("upserting")
+                    ids = [chunk_point_id(doc_id, chunk_count + i) for i in range(len(batch))]
+                    payloads = [
+                        {
+                            "doc_id": doc_id,
+                            "knowledge_id": knowledge_id,
+                            "text": chunk["text"],
+                            'file_name': file_name,
+                            'chunk_index': chunk_count + i,
+                            'section': " > ".join(chunk["heading_path"]) or None,
+                            'heading_path': chunk["heading_path"],
+                            'element_type': chunk["element_type"],
+                            'page_from': chunk["page_from"],
+                            'page_to': chunk["page_to"],
+                            'token_count': chunk["token_count"],
+                        }
+                        for i, chunk in enumerate(batch)
+                    ]
+                    for payload, chunk in zip(payloads, batch):
+                        if chunk.get("table"):
+                            payload["table"] = chunk["table"]
+                            if self._is_table_rows(chunk):
+                                del payload["text"]
+                    if not self.qdrant.insert_emb(collection_name=collection_name, embeddings=embeddings, payloads=payloads, ids=ids):
+                        raise RuntimeError(f"Failed to insert chunks {chunk_count}-{chunk_count + len(batch) - 1} into vector store")
+                    self.save_chunk_metadata(doc_id, batch, payloads, ids)
+                    chunk_count += len(batch)
+                    logger.debug(f"Processed {chunk_count} chunks")
+
+                # Drop points left over from a previous, longer version of this document
+                self.qdrant.delete_document(collection_name=collection_name, doc_id=doc_id, from_chunk_index=chunk_count)
+                if tables is not None:
+                    tables.finish()
+                if doc_vector is not None:
+                    doc_payload = {"doc_id": doc_id, "knowledge_id": knowledge_id, "file_name": file_name, "chunk_count": chunk_count}
+                    if not self.qdrant.upsert_doc_vector(collection_name, doc_id, doc_vector, doc_payload):
+                        raise RuntimeError("Failed to insert the document vector into vector store")
             try:
-                logger.debug(f"Updating document status to 'ready' for document {doc_id}")
-                requests.patch(f"http://api:8000/api/documents/{doc_id}", json={"chunk_count": len(chunks), "status": "ready"})
-                logger.info(f"Document {doc_id} successfully ingested with {len(chunks)} chunks")
+                self.qdrant.maybe_promote(knowledge_id)
             except Exception as e:
-                logger.error(f"Error updating document status to 'ready': {e}", exc_info=True)
-                return False
-            return True
-        except FileNotFoundError as e:
-            # File not found in S3 after retries
-            error_msg = str(e)
-            logger.error(f"File not found error during document upload: {error_msg}")
-            try:
-                requests.patch(f"http://api:8000/api/documents/{doc_id}", json={"status": "error"})
-                logger.info(f"Updated document {doc_id} status to 'error'")
-            except Exception as update_error:
-                logger.error(f"Error updating document status to 'error': {update_error}", exc_info=True)
-            return False
+                logger.error(f"Error promoting knowledge base {knowledge_id} to a dedicated collection: {e}", exc_info=True)
+            logger.info(f"All {chunk_count} chunks processed and inserted into vector store for document {doc_id}")
+
+            memory.enter("completed")
+            logger.debug(f"Updating document status to 'ready' for document {doc_id}")
+            self.update_status(doc_id, "ready", chunk_count=chunk_count, stage="completed",
+                               detail=json.dumps({"chunks": chunk_count, "memory": memory.report()}))
+            logger.info(f"Document {doc_id} successfully ingested with {chunk_count} chunks")
+            return chunk_count
+        except DocumentParseError as e:
+            raise IngestionError("parsing", e.__cause__) from e
         except Exception as e:
-            # Other errors during processing
-            error_msg = str(e)
-            logger.error(f"Error during document upload: {error_msg}", exc_info=True)
-            try:
-                requests.patch(f"http://api:8000/api/documents/{doc_id}", json={"status": "error"})
-                logger.info(f"Updated document {doc_id} status to 'error'")
-            except Exception as update_error:
-                logger.error(f"Error updating document status to 'error': {update_error}", exc_info=True)
+            raise IngestionError(memory.stage, e) from e
+        finally:
+            # Removes a conversion spill file that a failed ingest didn't read to the end
+            if isinstance(extracted, SpilledBlocks):
+                extracted.close()
+            memory.stop()
+            logger.info(f"Memory of document {doc_id} ingestion: {json.dumps(memory.report())}")
+            if doc_path and os.path.exists(doc_path):
+                os.remove(doc_path)
+
+    def upload_document(self, message: dict) -> bool:
+        """Ingest a document without retries, marking it 'error' on failure"""
+        doc_id = message.get('id')
+        try:
+            self.ingest_document(message)
+            return True
+        except IngestionError as e:
+            logger.error(f"Error during document upload: {e}", exc_info=True)
+            self.record_dead_letter(doc_id, e, attempts=1)
             return False
 
+
     def delete_document(self, message: dict):
         knowledge_id = message.get('knowledge_id')
         doc_id = message.get('id')
         logger.info(f"Deleting document - Doc ID: {doc_id}, Knowledge ID: {knowledge_id}")
         try:
-            self.qdrant.delete_document(collection_name=knowledge_id, doc_id=doc_id)
+            with self.qdrant.ingest_lock(knowledge_id):
+                self.qdrant.delete_document(collection_name=self.qdrant.router.resolve(knowledge_id, refresh=True), doc_id=doc_id)
             logger.info(f"Successfully deleted document {doc_id} from vector store")
+            if self.tables.enabled:
+                self.tables.delete_tables(knowledge_id, doc_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting document {doc_id}: {e}", exc_info=True)
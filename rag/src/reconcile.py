@@ -0,0 +1,362 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from qdrant_client import models
+
+from .resilience import RateLimiter
+from .tables import TABLES_PREFIX
+from .vectorstore import DOCS_SUFFIX, QdrantVectorStore
+
+logger = logging.getLogger('rag_worker.reconcile')
+
+UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+S3_PREFIX = "knowledge-data/"
+TASKS = ("vectors", "collections", "s3", "rows", "tmp")
+
+
+class Reconciler:
+    """
+    Find and delete data that no `document` / `knowledge` row accounts for
+
+    - vectors: collections (and their '__docs' document-level collections)
+      are scrolled in large pages (ids and two payload
+      fields, no vectors) and the page's doc_ids are looked up with one
+      `id = ANY(...)` query. Points of deleted documents are removed with one
+      filter delete per batch of documents, as are points of documents that
+      failed for good (partial ingests) once their status is re-checked.
+      Points past a document's chunk_count are left to ingestion, which drops
+      them itself after writing the new version.
+    - collections: dedicated collections, aliases and staged copies of
+      knowledge bases that no longer exist are dropped.
+    - s3: objects under knowledge-data/ not referenced by any document,
+      Parquet tables under knowledge-tables/ of deleted documents, and
+      multipart uploads that were never completed.
+    - rows: 'uploaded' documents whose upload never happened, and chunk rows
+      past their document's chunk_count.
+    - tmp: stale downloads left in the worker's scratch directory.
+
+    Deletes are rate limited (points, objects or rows per second) and only
+    touch data older than `min_age`, so in-flight uploads and ingests are
+    left alone. With dry_run nothing is deleted, the report shows what would be.
+    """
+
+    def __init__(
+        self,
+        store: QdrantVectorStore,
+        database_url: str,
+        s3_client=None,
+        bucket: Optional[str] = None,
+        tmp_dir: str = "/app/tmp",
+        page_size: int = 1000,
+        rate: Optional[float] = None,
+        min_age: float = 3600,
+        dry_run: bool = False
+    ):
+        """
+        Args:
+            store: Vector store (its tenancy settings tell which collection is shared)
+            database_url: Postgres URL (SQLAlchemy-style driver suffixes are accepted)
+            s3_client, bucket: Document storage; S3 reconciliation is skipped without them
+            tmp_dir: Scratch directory of the ingest workers
+            page_size: Points scrolled / S3 keys listed per page
+            rate: Max points, objects or rows deleted per second (None = unlimited)
+            min_age: Seconds an orphan must have existed before it is deleted
+            dry_run: Only report what would be deleted
+        """
+        import psycopg2
+        self.conn = psycopg2.connect(database_url.replace("+psycopg2", ""))
+        self.conn.autocommit = True
+        self.store = store
+        self.client = store.client
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.tmp_dir = tmp_dir
+        self.page_size = page_size
+        self.limiter = RateLimiter(rate, burst=max(rate or 0, page_size))
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.report: Counter = Counter()
+
+    def _query(self, sql: str, params=None) -> List[tuple]:
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() if cur.description else []
+
+    def _execute(self, sql: str, params=None) -> int:
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.rowcount
+
+    def run(self, only: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """Run the selected tasks (default: all) and return what was reclaimed"""
+        self.report = Counter()
+        start = time.perf_counter()
+        for task in only or TASKS:
+            if task not in TASKS:
+                raise ValueError(f"Unknown reconcile task: {task}")
+            try:
+                getattr(self, f"reconcile_{task}")()
+            except Exception as e:
+                # One broken task (e.g. S3 unreachable) must not stop the others
+                logger.error(f"Reconcile task '{task}' failed: {e}", exc_info=True)
+                self.report[f"{task}_failed"] += 1
+        report = dict(self.report)
+        verb = "Would reclaim" if self.dry_run else "Reclaimed"
+        logger.info(f"{verb} in {time.perf_counter() - start:.1f}s: {report or 'nothing'}")
+        return report
+
+    # -- vectors -------------------------------------------------------------
+
+    def _physical_collections(self) -> List[str]:
+        """Collections holding live points: everything except staged '<name>__*' copies nobody points at"""
+        aliased = {a.collection_name for a in self.client.get_aliases().aliases}
+        return [
+            c.name for c in self.client.get_collections().collections
+            if "__" not in c.name or c.name in aliased or c.name.endswith(DOCS_SUFFIX)
+        ]
+
+    def reconcile_vectors(self):
+        for collection in self._physical_collections():
+            self._reconcile_collection(collection)
+
+    def _reconcile_collection(self, collection: str):
+        offset = None
+        orphans: Set[str] = set()
+        # doc_id -> updated_at of documents that ended in 'error'
+        failed: Dict[str, Any] = {}
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=["doc_id"],
+                with_vectors=False
+            )
+            self.report["points_scanned"] += len(points)
+            doc_ids = {p.payload.get("doc_id") for p in points if p.payload and p.payload.get("doc_id")}
+            docs = {
+                doc_id: (status, updated_at, age)
+                for doc_id, status, updated_at, age in self._query(
+                    "SELECT id, status, updated_at, EXTRACT(EPOCH FROM now() - updated_at) FROM document WHERE id = ANY(%s)",
+                    (list(doc_ids),)
+                )
+            } if doc_ids else {}
+
+            for doc_id in doc_ids:
+                if doc_id not in docs:
+                    orphans.add(doc_id)
+                    continue
+                status, updated_at, age = docs[doc_id]
+                if status == "error" and (age or 0) >= self.min_age:
+                    failed[doc_id] = updated_at
+            # Batch the documents so each filter delete covers many of them
+            if len(orphans) >= self.page_size or (offset is None and orphans):
+                self._delete_orphan_docs(collection, orphans)
+                orphans = set()
+            if len(failed) >= self.page_size or (offset is None and failed):
+                self._delete_failed_docs(collection, failed)
+                failed = {}
+            if offset is None:
+                break
+
+    def _delete_orphan_docs(self, collection: str, doc_ids: Set[str]):
+        selector = models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="doc_id", match=models.MatchAny(any=sorted(doc_ids)))
+        ]))
+        count = self.client.count(collection, count_filter=selector.filter, exact=True).count
+        self._delete_points(collection, selector, count)
+        self.report["orphan_docs"] += len(doc_ids)
+        self.report["orphan_points"] += count
+        logger.info(f"{collection}: {count} points of {len(doc_ids)} deleted documents")
+
+    def _delete_failed_docs(self, collection: str, failed: Dict[str, Any]):
+        """Delete points of failed documents unless they were re-ingested since they were scanned"""
+        unchanged = {
+            doc_id for doc_id, updated_at in self._query(
+                "SELECT id, updated_at FROM document WHERE id = ANY(%s) AND status = 'error'", (list(failed),)
+            )
+            if updated_at == failed[doc_id]
+        }
+        if not unchanged:
+            return
+        selector = models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="doc_id", match=models.MatchAny(any=sorted(unchanged)))
+        ]))
+        count = self.client.count(collection, count_filter=selector.filter, exact=True).count
+        self._delete_points(collection, selector, count)
+        self.report["failed_docs"] += len(unchanged)
+        self.report["failed_points"] += count
+
+    def _delete_points(self, collection: str, selector, count: int):
+        if self.dry_run or not count:
+            return
+        self.limiter.acquire(count)
+        self.store.backend.call(
+            self.client.delete,
+            collection_name=collection,
+            points_selector=selector,
+            cost=max(count // 100, 1)
+        )
+
+    # -- collections ---------------------------------------------------------
+
+    def reconcile_collections(self):
+        """Drop dedicated collections, aliases and staged copies of deleted knowledge bases"""
+        aliases = {a.alias_name: a.collection_name for a in self.client.get_aliases().aliases}
+        collections = [c.name for c in self.client.get_collections().collections]
+        kids = {name.split("__", 1)[0] for name in list(aliases) + collections}
+        # Only names shaped like knowledge ids; the shared collection and anything else is left alone
+        kids = {kid for kid in kids if UUID_RE.match(kid)}
+        if not kids:
+            return
+        existing = {row[0] for row in self._query("SELECT id FROM knowledge WHERE id = ANY(%s)", (list(kids),))}
+        gone = kids - existing
+        for alias in [a for a in aliases if a.split("__", 1)[0] in gone]:
+            if not self.dry_run:
+                self.client.update_collection_aliases(change_aliases_operations=[
+                    models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias))
+                ])
+            self.report["aliases"] += 1
+        for name in [c for c in collections if c.split("__", 1)[0] in gone]:
+            self.report["collection_points"] += self.client.count(name, exact=False).count
+            if not self.dry_run:
+                self.limiter.acquire(1)
+                self.store.delete_collection(name)
+            self.report["collections"] += 1
+            logger.info(f"Dropped collection '{name}' of deleted knowledge base")
+
+    # -- s3 ------------------------------------------------------------------
+
+    def reconcile_s3(self):
+        if self.s3_client is None or not self.bucket:
+            logger.info("No S3 bucket configured, skipping S3 reconciliation")
+            return
+        self._reconcile_objects()
+        self._reconcile_tables()
+        self._abort_stale_uploads()
+
+    def _old_enough(self, when: datetime) -> bool:
+        return (datetime.now(timezone.utc) - when).total_seconds() >= self.min_age
+
+    def _reconcile_objects(self):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=S3_PREFIX, PaginationConfig={"PageSize": self.page_size}):
+            objects = {o["Key"]: o["Size"] for o in page.get("Contents", []) if self._old_enough(o["LastModified"])}
+            self.report["s3_scanned"] += len(objects)
+            if not objects:
+                continue
+            uris = {f"s3://{self.bucket}/{key}": key for key in objects}
+            referenced = {row[0] for row in self._query("SELECT s3_key FROM document WHERE s3_key = ANY(%s)", (list(uris),))}
+            orphans = [key for uri, key in uris.items() if uri not in referenced]
+            if not orphans:
+                continue
+            self.report["s3_objects"] += len(orphans)
+            self.report["s3_bytes"] += sum(objects[key] for key in orphans)
+            self._delete_objects(orphans)
+
+    def _reconcile_tables(self):
+        """Parquet tables (knowledge-tables/{knowledge_id}/{doc_id}/{n}.parquet) of documents that no longer exist"""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=TABLES_PREFIX, PaginationConfig={"PageSize": self.page_size}):
+            objects = {o["Key"]: o["Size"] for o in page.get("Contents", []) if self._old_enough(o["LastModified"])}
+            self.report["s3_tables_scanned"] += len(objects)
+            if not objects:
+                continue
+            doc_ids = {key: key[len(TABLES_PREFIX):].split("/")[1] for key in objects if key.count("/") == 3}
+            existing = {row[0] for row in self._query("SELECT id FROM document WHERE id = ANY(%s)", (list(set(doc_ids.values())),))}
+            orphans = [key for key in objects if doc_ids.get(key) not in existing]
+            if not orphans:
+                continue
+            self.report["s3_tables"] += len(orphans)
+            self.report["s3_bytes"] += sum(objects[key] for key in orphans)
+            self._delete_objects(orphans)
+
+    def _delete_objects(self, keys: List[str]):
+        if self.dry_run:
+            return
+        self.limiter.acquire(len(keys))
+        # At most 1000 keys per request, which is also the default listing page size
+        for i in range(0, len(keys), 1000):
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+            )
+            for error in response.get("Errors", []):
+                logger.warning(f"Could not delete s3://{self.bucket}/{error['Key']}: {error.get('Message')}")
+
+    def _abort_stale_uploads(self):
+        paginator = self.s3_client.get_paginator("list_multipart_uploads")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=S3_PREFIX):
+            for upload in page.get("Uploads", []):
+                # Multipart uploads run for hours at most; give them a day
+                if (datetime.now(timezone.utc) - upload["Initiated"]).total_seconds() < max(self.min_age, 86400):
+                    continue
+                self.report["s3_uploads_aborted"] += 1
+                if not self.dry_run:
+                    self.limiter.acquire(1)
+                    self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=upload["Key"], UploadId=upload["UploadId"])
+
+    # -- rows ----------------------------------------------------------------
+
+    def reconcile_rows(self):
+        self._delete_abandoned_uploads()
+        if self.dry_run:
+            self.report["chunk_rows"] += self._query("""
+                SELECT count(*) FROM chunk c JOIN document d ON d.id = c.document_id
+                WHERE d.status = 'ready' AND c.chunk_index >= d.chunk_count
+            """)[0][0]
+        else:
+            self.report["chunk_rows"] += self._execute("""
+                DELETE FROM chunk c USING document d
+                WHERE d.id = c.document_id AND d.status = 'ready' AND c.chunk_index >= d.chunk_count
+            """)
+
+    def _delete_abandoned_uploads(self):
+        """Document rows created for an upload URL whose upload never arrived"""
+        if self.s3_client is None:
+            return
+        candidates = self._query("""
+            SELECT id, s3_key FROM document
+            WHERE status = 'uploaded' AND updated_at < now() - make_interval(secs => %s)
+            ORDER BY updated_at LIMIT %s
+        """, (max(self.min_age, 86400), self.page_size))
+        missing = []
+        for doc_id, s3_uri in candidates:
+            bucket, _, key = s3_uri.replace("s3://", "").partition("/")
+            try:
+                self.s3_client.head_object(Bucket=bucket, Key=key)
+            except Exception as e:
+                if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                    missing.append(doc_id)
+        if not missing:
+            return
+        self.report["abandoned_documents"] += len(missing)
+        if not self.dry_run:
+            self.limiter.acquire(len(missing))
+            self._execute("DELETE FROM document WHERE id = ANY(%s) AND status = 'uploaded'", (missing,))
+
+    # -- tmp -----------------------------------------------------------------
+
+    def reconcile_tmp(self):
+        """Downloads the ingest path failed to remove (crashes, kills); subdirectories are left alone"""
+        if not os.path.isdir(self.tmp_dir):
+            return
+        cutoff = time.time() - self.min_age
+        for entry in os.scandir(self.tmp_dir):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat()
+            if stat.st_mtime >= cutoff:
+                continue
+            self.report["tmp_files"] += 1
+            self.report["tmp_bytes"] += stat.st_size
+            if not self.dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
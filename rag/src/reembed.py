@@ -0,0 +1,395 @@
+import re
+import json
+import time
+import uuid
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from qdrant_client import models
+from qdrant_client.models import PointStruct
+
+from .embed import Embed
+from .resilience import RateLimiter
+from .tables import TableStore
+from .vectorstore import DOCS_SUFFIX, QdrantVectorStore
+
+logger = logging.getLogger('rag_worker.reembed')
+
+UUID_SPACE = 1 << 128
+
+
+def model_slug(model: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", model.lower()).strip("-")
+
+
+def versioned_name(logical: str, model: str) -> str:
+    """Physical collection holding `logical` embedded with `model`"""
+    return f"{logical}__{model_slug(model)}"
+
+
+def partition_range(index: int, count: int) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Point id range of partition `index` of `count`: (scroll start offset, exclusive end as int)
+
+    Point ids are UUIDs (chunk_point_id), so the UUID space is split evenly;
+    the first partition also picks up any numeric ids, which sort first.
+    """
+    if not 0 <= index < count:
+        raise ValueError(f"Partition {index} out of range for {count} partitions")
+    start = None if index == 0 else str(uuid.UUID(int=UUID_SPACE * index // count))
+    end = None if index == count - 1 else UUID_SPACE * (index + 1) // count
+    return start, end
+
+
+def _id_int(point_id) -> int:
+    return point_id if isinstance(point_id, int) else uuid.UUID(str(point_id)).int
+
+
+class ChunkTextSource:
+    """Chunk text from the `chunk` table, for points stored with slim payloads"""
+
+    def __init__(self, database_url: str):
+        import psycopg2
+        self.conn = psycopg2.connect(database_url.replace("+psycopg2", ""))
+        self.conn.autocommit = True
+
+    def get_many(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], str]:
+        if not keys:
+            return {}
+        from psycopg2.extras import execute_values
+        with self.conn.cursor() as cur:
+            rows = execute_values(cur, """
+                SELECT c.document_id, c.chunk_index, c.text
+                FROM chunk c JOIN (VALUES %s) AS k(document_id, chunk_index)
+                  ON c.document_id = k.document_id AND c.chunk_index = k.chunk_index
+            """, keys, template="(%s, %s::int)", fetch=True)
+        return {(doc_id, idx): text for doc_id, idx, text in rows if text is not None}
+
+    def changed_since(self, since: float) -> List[str]:
+        """Documents re-ingested after `since` (epoch seconds)"""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT id FROM document WHERE updated_at >= to_timestamp(%s)", (since,))
+            return [row[0] for row in cur.fetchall()]
+
+
+class Reembedder:
+    """
+    Blue/green re-embedding of every collection into collections versioned by model
+
+    Searches and ingestion address logical names (a knowledge_id or the shared
+    collection). `run` copies the points behind each logical name into
+    '<logical>__<model slug>', re-embedding the chunk text taken from the
+    payload (or the chunk table for slim payloads) in large batches. Point ids
+    and payloads are kept, so nothing is re-parsed or re-chunked. Progress is
+    checkpointed per (target, partition) after every batch, so a job can be
+    stopped and resumed, and `partitions` workers can split the id space.
+
+    `switch` catches up with points added, deleted or re-ingested since the
+    run started, then, holding the logical name's lock so no ingest writes
+    meanwhile, catches up once more and repoints the logical alias at the new
+    collection in one alias update. The previous collection is kept, so
+    switching back with the old model is another alias swap. A legacy
+    collection named after the logical name is first copied as it is (no
+    re-embedding) into '<logical>__<previous model slug>' to keep that way
+    back. Redeploy workers and the API with the new EMBED_MODEL/EMBED_DIM at
+    switch time; with several processes the locks need DATABASE_URL.
+    """
+
+    def __init__(
+        self,
+        store: QdrantVectorStore,
+        embed: Embed,
+        model: str,
+        batch_size: int = 256,
+        rate: Optional[float] = None,
+        checkpoint_dir: str = "/app/tmp/reembed",
+        text_source: Optional[ChunkTextSource] = None,
+        tables: Optional[TableStore] = None,
+        previous_model: Optional[str] = None,
+        lock_timeout: float = 60.0
+    ):
+        """
+        Args:
+            store: Vector store whose vector_size is the new model's dimension
+            embed: Embedder for the new model
+            model: New model name, used to version collection names
+            batch_size: Points scrolled and embedded per batch
+            rate: Max texts embedded per second (None = unlimited)
+            checkpoint_dir: Where progress files live (shared by workers on one host/volume)
+            text_source: Chunk table access for points without payload text
+            tables: Parquet access for table row chunks, whose text is stored nowhere else
+            previous_model: Model of the legacy collections, naming their copies kept for rollback
+            lock_timeout: Seconds `switch` waits for in-flight ingests of a logical name
+        """
+        self.store = store
+        self.client = store.client
+        self.embed = embed
+        self.model = model
+        self.slug = model_slug(model)
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.text_source = text_source
+        self.tables = tables
+        self.previous_model = previous_model
+        self.lock_timeout = lock_timeout
+
+    def logical_collections(self, only: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Logical name -> physical collection currently behind it"""
+        aliases = {a.alias_name: a.collection_name for a in self.client.get_aliases().aliases}
+        targets = set(aliases.values())
+        # Document-level collections are rebuilt from chunk vectors, not re-embedded
+        result = {alias: target for alias, target in aliases.items() if not alias.endswith(DOCS_SUFFIX)}
+        for c in self.client.get_collections().collections:
+            # Unaliased '__' collections are staged copies (or leftovers), not live data
+            if c.name not in targets and "__" not in c.name:
+                result[c.name] = c.name
+        if only is not None:
+            only = set(only)
+            result = {name: physical for name, physical in result.items() if name in only}
+        return result
+
+    # -- checkpoints ---------------------------------------------------------
+
+    def _checkpoint_path(self, target: str, partition: int, partitions: int) -> Path:
+        return self.checkpoint_dir / f"{target}.{partition}-of-{partitions}.json"
+
+    def _load_checkpoint(self, target: str, partition: int, partitions: int) -> Dict[str, Any]:
+        path = self._checkpoint_path(target, partition, partitions)
+        if path.exists():
+            return json.loads(path.read_text())
+        return {"offset": None, "done": False, "copied": 0, "skipped": 0, "started_at": time.time()}
+
+    def _save_checkpoint(self, target: str, partition: int, partitions: int, state: Dict[str, Any]):
+        path = self._checkpoint_path(target, partition, partitions)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        tmp.replace(path)
+
+    def checkpoints(self) -> List[Dict[str, Any]]:
+        return [{"file": p.name, **json.loads(p.read_text())} for p in sorted(self.checkpoint_dir.glob("*.json"))]
+
+    # -- copy ----------------------------------------------------------------
+
+    def _ensure_target(self, logical: str, target: str):
+        shared = self.store.router.mode == "shared" and logical == self.store.router.shared_collection
+        try:
+            self.store._create_collection(target, shared=shared)
+        except Exception:
+            # Another partition worker created it first
+            if not self.client.collection_exists(target):
+                raise
+            self.store._create_collection(target, shared=shared)
+
+    def _texts(self, points) -> List[Optional[str]]:
+        texts = [(p.payload or {}).get("text") for p in points]
+        missing = [
+            (p.payload["doc_id"], p.payload["chunk_index"])
+            for p, text in zip(points, texts)
+            if text is None and p.payload and "doc_id" in p.payload
+        ]
+        if missing and self.text_source is not None:
+            found = self.text_source.get_many(missing)
+            texts = [
+                text if text is not None else found.get((p.payload.get("doc_id"), p.payload.get("chunk_index")))
+                for p, text in zip(points, texts)
+            ]
+        if self.tables is not None:
+            for i, p in enumerate(points):
+                table = (p.payload or {}).get("table") or {}
+                if texts[i] is None and table.get("row_group") is not None:
+                    try:
+                        texts[i] = self.tables.row_text(table)
+                    except Exception as e:
+                        logger.warning(f"Could not read rows of {table.get('uri')} group {table['row_group']}: {e}")
+        return texts
+
+    def _reembed(self, target: str, points) -> Tuple[int, int]:
+        """Embed and upsert points into target; returns (copied, skipped)"""
+        texts = self._texts(points)
+        keep = [(p, t) for p, t in zip(points, texts) if t]
+        if len(keep) < len(points):
+            logger.warning(f"{len(points) - len(keep)} points in batch have no chunk text, skipped")
+        if not keep:
+            return 0, len(points)
+        self.limiter.acquire(len(keep))
+        vectors = self.embed.embed_batch([t for _, t in keep]).astype("float32", copy=False).tolist()
+        self.store.backend.call(
+            self.client.upsert,
+            collection_name=target,
+            points=[PointStruct(id=p.id, vector=v, payload=p.payload) for (p, _), v in zip(keep, vectors)],
+            cost=len(keep)
+        )
+        return len(keep), len(points) - len(keep)
+
+    def copy(self, logical: str, source: str, partition: int = 0, partitions: int = 1) -> Dict[str, Any]:
+        target = versioned_name(logical, self.model)
+        state = self._load_checkpoint(target, partition, partitions)
+        if state["done"]:
+            logger.info(f"{target} partition {partition}/{partitions} already done ({state['copied']} points)")
+            return state
+        self._ensure_target(logical, target)
+        start, end = partition_range(partition, partitions)
+        offset = state["offset"] or start
+        logger.info(f"Re-embedding '{source}' -> '{target}' partition {partition}/{partitions} from offset {offset}")
+        while True:
+            points, next_offset = self.store.backend.call(
+                self.client.scroll,
+                collection_name=source,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            if end is not None:
+                in_range = [p for p in points if _id_int(p.id) < end]
+                if len(in_range) < len(points):
+                    points, next_offset = in_range, None
+            if points:
+                copied, skipped = self._reembed(target, points)
+                state["copied"] += copied
+                state["skipped"] += skipped
+            offset = next_offset
+            state["offset"] = str(offset) if offset is not None else None
+            state["done"] = offset is None
+            self._save_checkpoint(target, partition, partitions, state)
+            if state["done"]:
+                break
+        logger.info(f"Finished '{target}' partition {partition}/{partitions}: {state['copied']} copied, {state['skipped']} skipped")
+        return state
+
+    def run(self, only: Optional[Iterable[str]] = None, partition: int = 0, partitions: int = 1):
+        for logical, source in sorted(self.logical_collections(only).items()):
+            if source == versioned_name(logical, self.model):
+                logger.info(f"'{logical}' already serves {self.model}")
+                continue
+            self.copy(logical, source, partition, partitions)
+
+    # -- switch --------------------------------------------------------------
+
+    def _ids(self, collection: str, scroll_filter: Optional[models.Filter] = None) -> Set:
+        ids, offset = set(), None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection, scroll_filter=scroll_filter, limit=10_000,
+                offset=offset, with_payload=False, with_vectors=False
+            )
+            ids.update(p.id for p in points)
+            if offset is None:
+                return ids
+
+    def catch_up(self, source: str, target: str, since: Optional[float] = None) -> Dict[str, int]:
+        """Bring target in line with points added, deleted or re-ingested in source"""
+        source_ids, target_ids = self._ids(source), self._ids(target)
+        todo = source_ids - target_ids
+        stale = target_ids - source_ids
+        if since is not None and self.text_source is not None:
+            for doc_id in self.text_source.changed_since(since):
+                flt = models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))])
+                todo |= self._ids(source, flt)
+        todo = sorted(todo, key=_id_int)
+        copied = 0
+        for i in range(0, len(todo), self.batch_size):
+            points = self.client.retrieve(source, ids=todo[i:i + self.batch_size], with_payload=True, with_vectors=False)
+            copied += self._reembed(target, points)[0]
+        if stale:
+            self.client.delete(target, points_selector=models.PointIdsList(points=list(stale)))
+        return {"copied": copied, "deleted": len(stale)}
+
+    def _mirror(self, source: str, target: str, since: Optional[float] = None) -> Dict[str, int]:
+        """
+        Copy points with their vectors as they are from source into target:
+        ids target lacks, plus points of documents re-ingested since `since`;
+        points gone from source are removed from target
+        """
+        source_ids, target_ids = self._ids(source), self._ids(target)
+        todo = source_ids - target_ids
+        stale = target_ids - source_ids
+        if since is not None and self.text_source is not None:
+            for doc_id in self.text_source.changed_since(since):
+                flt = models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))])
+                todo |= self._ids(source, flt)
+        todo = sorted(todo, key=_id_int)
+        for i in range(0, len(todo), self.batch_size):
+            points = self.client.retrieve(source, ids=todo[i:i + self.batch_size], with_payload=True, with_vectors=True)
+            self.client.upsert(target, points=[PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points])
+        if stale:
+            self.client.delete(target, points_selector=models.PointIdsList(points=list(stale)))
+        return {"copied": len(todo), "deleted": len(stale)}
+
+    def _clone_collection(self, source: str, target: str):
+        """Create target with source's vector, index and quantization settings (same model, same dimension)"""
+        if self.client.collection_exists(target):
+            return
+        info = self.client.get_collection(source)
+        self.client.create_collection(
+            collection_name=target,
+            vectors_config=info.config.params.vectors,
+            hnsw_config=models.HnswConfigDiff(**info.config.hnsw_config.model_dump()),
+            quantization_config=info.config.quantization_config
+        )
+        for field_name, schema in (info.payload_schema or {}).items():
+            self.client.create_payload_index(
+                collection_name=target, field_name=field_name, field_schema=schema.params or schema.data_type
+            )
+
+    def switch(self, only: Optional[Iterable[str]] = None) -> List[str]:
+        """Point every logical name at its collection for this model; returns switched names"""
+        switched = []
+        for logical, source in sorted(self.logical_collections(only).items()):
+            target = versioned_name(logical, self.model)
+            if source == target:
+                continue
+            if not self.client.collection_exists(target):
+                logger.warning(f"'{target}' does not exist, run the re-embedding first; '{logical}' not switched")
+                continue
+            pending = [c for c in self.checkpoints() if c["file"].startswith(f"{target}.") and not c["done"]]
+            if pending:
+                logger.warning(f"'{target}' has unfinished partitions {[c['file'] for c in pending]}; '{logical}' not switched")
+                continue
+            backup = None
+            if source == logical:
+                # Legacy collection named after the logical name: it has to be deleted
+                # before the alias can exist, so keep a copy of it as the way back
+                if not self.previous_model:
+                    logger.warning(f"'{logical}' is a legacy collection; pass the previous model to keep a copy "
+                                   f"of it before switching; '{logical}' not switched")
+                    continue
+                backup = versioned_name(logical, self.previous_model)
+                self._clone_collection(logical, backup)
+                mirror_started = time.time()
+                logger.info(f"Copied legacy collection '{logical}' to '{backup}': {self._mirror(logical, backup)}")
+
+            # Most of the catch-up runs before the lock, so ingests only wait for the last delta
+            started = [c["started_at"] for c in self.checkpoints() if c["file"].startswith(f"{target}.")]
+            catch_up_started = time.time()
+            stats = self.catch_up(source, target, since=min(started) if started else None)
+            logger.info(f"Caught up '{target}' with '{source}': {stats}")
+
+            with self.store.tenant_locks.exclusive(logical, timeout=self.lock_timeout) as acquired:
+                if not acquired:
+                    logger.warning(f"Ingestion into '{logical}' kept its lock for {self.lock_timeout:.0f}s; '{logical}' not switched")
+                    continue
+                stats = self.catch_up(source, target, since=catch_up_started)
+                logger.info(f"Caught up '{target}' with '{source}' under lock: {stats}")
+                if backup is not None:
+                    logger.info(f"Caught up '{backup}' with '{logical}' under lock: {self._mirror(logical, backup, since=mirror_started)}")
+                    logger.warning(f"Deleting legacy collection '{logical}' to alias it to '{target}' (copy kept in '{backup}')")
+                    self.client.delete_collection(logical)
+                    operations = []
+                else:
+                    operations = [models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=logical))]
+                operations.append(models.CreateAliasOperation(
+                    create_alias=models.CreateAlias(collection_name=target, alias_name=logical)
+                ))
+                # Both alias operations apply atomically
+                self.client.update_collection_aliases(change_aliases_operations=operations)
+                self.store._known_collections.discard(logical)
+            switched.append(logical)
+            logger.info(f"'{logical}' now serves '{target}' (previous: '{backup or source}')")
+            # Document-level vectors are means of chunk vectors, so they follow the new model;
+            # they are rebuilt into a staged collection and swapped in the same way
+            self.store.rebuild_doc_vectors(logical)
+        return switched
@@ -0,0 +1,101 @@
+import json
+import time
+import random
+import logging
+from typing import Any, Dict
+
+from confluent_kafka import Producer
+
+from .scheduler import IngestJob
+
+logger = logging.getLogger('rag_worker.retry')
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 5.0, max_delay: float = 600.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class RetryPublisher:
+    """
+    Re-queue failed jobs on a delayed-retry topic and park exhausted ones on a
+    dead-letter topic
+
+    Retry records carry a `not_before` timestamp; the consumer holds them in
+    the scheduler until then instead of sleeping, so the partition keeps
+    moving.
+    """
+
+    def __init__(self, producer: Producer, retry_topic: str, dead_letter_topic: str, policy: RetryPolicy):
+        self.producer = producer
+        self.retry_topic = retry_topic
+        self.dead_letter_topic = dead_letter_topic
+        self.policy = policy
+
+    @staticmethod
+    def encode(job: IngestJob, **extra) -> bytes:
+        record = {
+            "kind": job.kind,
+            "knowledge_id": job.knowledge_id,
+            "doc_id": job.doc_id,
+            "message": job.message,
+            "attempt": job.attempt,
+            **extra,
+        }
+        return json.dumps(record).encode("utf-8")
+
+    @staticmethod
+    def decode(msg) -> IngestJob:
+        record: Dict[str, Any] = json.loads(msg.value().decode("utf-8"))
+        return IngestJob(
+            kind=record["kind"],
+            knowledge_id=record["knowledge_id"],
+            doc_id=record["doc_id"],
+            message=record["message"],
+            topic=msg.topic(),
+            partition=msg.partition(),
+            offset=msg.offset(),
+            attempt=record.get("attempt", 1),
+            not_before=record.get("not_before", 0.0),
+        )
+
+    def _produce(self, topic: str, job: IngestJob, value: bytes):
+        # Key by document so retries of one document stay ordered
+        self.producer.produce(topic, key=job.doc_id.encode("utf-8"), value=value)
+        # Wait for delivery before the original offset may be committed
+        remaining = self.producer.flush(30)
+        if remaining:
+            raise RuntimeError(f"{remaining} messages not delivered to {topic}")
+
+    def handle_failure(self, job: IngestJob, stage: str, error: Exception, retryable: bool) -> bool:
+        """
+        Schedule a retry or dead-letter the job
+
+        Returns:
+            True if a retry was scheduled, False if the job was dead-lettered
+        """
+        if retryable and job.attempt < self.policy.max_attempts:
+            delay = self.policy.delay(job.attempt)
+            retry = IngestJob(**{**job.__dict__, "attempt": job.attempt + 1})
+            self._produce(self.retry_topic, retry, self.encode(
+                retry, not_before=time.time() + delay, stage=stage, error=str(error)
+            ))
+            logger.warning(
+                f"Scheduled retry {retry.attempt}/{self.policy.max_attempts} of document {job.doc_id} "
+                f"in {delay:.1f}s after {stage} failure: {error}"
+            )
+            return True
+
+        self._produce(self.dead_letter_topic, job, self.encode(
+            job, stage=stage, error=str(error), failed_at=time.time()
+        ))
+        logger.error(f"Dead-lettered document {job.doc_id} after {job.attempt} attempts ({stage}): {error}")
+        return False
@@ -0,0 +1,247 @@
+import heapq
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('rag_worker.scheduler')
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+@dataclass
+class IngestJob:
+    """One unit of work derived from a CDC event"""
+    kind: str                 # ingest | delete
+    knowledge_id: str
+    doc_id: str
+    message: Dict[str, Any]
+    topic: str
+    partition: int
+    offset: int
+    priority: str = INTERACTIVE
+    attempt: int = 1
+    not_before: float = 0.0   # epoch seconds; delayed retries are held until then
+    seq: int = 0
+    finish_tag: float = 0.0
+    generation: int = 0       # OffsetTracker assignment generation of its partition
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class OffsetTracker:
+    """
+    Track in-flight Kafka offsets per partition and expose the highest offset
+    that is safe to commit: everything below it has completed, even though
+    jobs finish out of order
+
+    Each assignment of a partition gets a new generation, so a job that was
+    still running when its partition was revoked can't mark offsets done once
+    the partition is assigned again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int], List[int]] = defaultdict(list)
+        self._done: Dict[Tuple[str, int], set] = defaultdict(set)
+        self._high: Dict[Tuple[str, int], int] = {}
+        self._committed: Dict[Tuple[str, int], int] = {}
+        self._generation: Dict[Tuple[str, int], int] = defaultdict(int)
+
+    def add(self, topic: str, partition: int, offset: int) -> int:
+        """Track an offset; returns the partition's generation to pass back to `done`"""
+        with self._lock:
+            heapq.heappush(self._pending[(topic, partition)], offset)
+            self._high[(topic, partition)] = max(offset, self._high.get((topic, partition), -1))
+            return self._generation[(topic, partition)]
+
+    def done(self, topic: str, partition: int, offset: int, generation: int):
+        with self._lock:
+            tp = (topic, partition)
+            if tp not in self._pending or generation != self._generation[tp]:
+                # Revoked since the offset was added; its new owner redelivers it
+                return
+            self._done[tp].add(offset)
+
+    def committable(self) -> Dict[Tuple[str, int], int]:
+        """Next offset to commit per partition, only for partitions that advanced"""
+        result = {}
+        with self._lock:
+            for tp, pending in self._pending.items():
+                done = self._done[tp]
+                while pending and pending[0] in done:
+                    done.discard(heapq.heappop(pending))
+                # Commit up to the oldest unfinished offset, or past everything seen
+                next_offset = pending[0] if pending else self._high[tp] + 1
+                if self._committed.get(tp) != next_offset:
+                    result[tp] = next_offset
+            return result
+
+    def mark_committed(self, offsets: Dict[Tuple[str, int], int]):
+        with self._lock:
+            self._committed.update(offsets)
+
+    def forget(self, partitions: List[Tuple[str, int]]):
+        """Drop state of partitions revoked in a rebalance"""
+        with self._lock:
+            for tp in partitions:
+                for state in (self._pending, self._done, self._high, self._committed):
+                    state.pop(tp, None)
+                self._generation[tp] += 1
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of ingest jobs across knowledge bases
+
+    Every (knowledge_id, priority) pair is a flow. Jobs get a virtual finish
+    tag of max(virtual_time, flow's last tag) + 1 / weight and the eligible
+    job with the smallest tag runs next, so a tenant bulk-uploading thousands
+    of files only gets its fair share while a single interactive upload from
+    another tenant runs almost immediately. A tenant never has more than
+    `max_per_tenant` jobs running, and jobs of one document run in order.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        max_per_tenant: int = 2,
+        bulk_threshold: int = 10,
+        classify: Optional[Callable[[IngestJob, int], str]] = None
+    ):
+        """
+        Args:
+            weights: Relative share per priority class
+            max_per_tenant: Concurrency cap per knowledge_id
+            bulk_threshold: A tenant with at least this many queued jobs has its
+                new jobs classified as bulk backfill
+            classify: Optional override, called with (job, tenant backlog)
+        """
+        self.weights = weights or {INTERACTIVE: 8.0, BULK: 1.0}
+        self.max_per_tenant = max_per_tenant
+        self.bulk_threshold = bulk_threshold
+        self.classify = classify or self._classify
+        self._lock = threading.Lock()
+        self._flows: Dict[Tuple[str, str], Deque[IngestJob]] = {}
+        self._last_tag: Dict[Tuple[str, str], float] = {}
+        self._running: Dict[str, int] = defaultdict(int)
+        self._backlog: Dict[str, int] = defaultdict(int)
+        self._doc_order: Dict[str, Deque[int]] = defaultdict(deque)
+        self._delayed: List[Tuple[float, int, IngestJob]] = []
+        self._virtual_time = 0.0
+        self._seq = 0
+        self._size = 0
+
+    def _classify(self, job: IngestJob, backlog: int) -> str:
+        if job.kind == "delete":
+            return INTERACTIVE
+        return BULK if backlog >= self.bulk_threshold else INTERACTIVE
+
+    def submit(self, job: IngestJob):
+        with self._lock:
+            if job.not_before > time.time():
+                heapq.heappush(self._delayed, (job.not_before, self._seq, job))
+                self._seq += 1
+                self._size += 1
+                return
+            self._enqueue(job)
+            self._size += 1
+
+    def _release_due(self):
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._enqueue(heapq.heappop(self._delayed)[2])
+
+    def _enqueue(self, job: IngestJob):
+        job.priority = self.classify(job, self._backlog[job.knowledge_id])
+        flow = (job.knowledge_id, job.priority)
+        job.seq = self._seq
+        self._seq += 1
+        start = max(self._virtual_time, self._last_tag.get(flow, 0.0))
+        job.finish_tag = start + 1.0 / self.weights.get(job.priority, 1.0)
+        self._last_tag[flow] = job.finish_tag
+        self._flows.setdefault(flow, deque()).append(job)
+        self._backlog[job.knowledge_id] += 1
+        self._doc_order[job.doc_id].append(job.seq)
+
+    def next(self) -> Optional[IngestJob]:
+        """Pop the eligible job with the smallest finish tag, or None"""
+        with self._lock:
+            self._release_due()
+            best = None
+            for flow, queue in self._flows.items():
+                job = queue[0]
+                if self._running[job.knowledge_id] >= self.max_per_tenant:
+                    continue
+                if self._doc_order[job.doc_id][0] != job.seq:
+                    continue
+                if best is None or (job.finish_tag, job.seq) < (best.finish_tag, best.seq):
+                    best = job
+            if best is None:
+                return None
+
+            flow = (best.knowledge_id, best.priority)
+            self._flows[flow].popleft()
+            if not self._flows[flow]:
+                del self._flows[flow]
+            self._virtual_time = max(self._virtual_time, best.finish_tag - 1.0 / self.weights.get(best.priority, 1.0))
+            self._running[best.knowledge_id] += 1
+            self._size -= 1
+            return best
+
+    def complete(self, job: IngestJob):
+        with self._lock:
+            self._running[job.knowledge_id] -= 1
+            if not self._running[job.knowledge_id]:
+                del self._running[job.knowledge_id]
+            self._backlog[job.knowledge_id] -= 1
+            if not self._backlog[job.knowledge_id]:
+                del self._backlog[job.knowledge_id]
+            order = self._doc_order[job.doc_id]
+            order.popleft()
+            if not order:
+                del self._doc_order[job.doc_id]
+            if not self._flows and not self._running:
+                self._last_tag.clear()
+
+    def drop_partitions(self, partitions: List[Tuple[str, int]]) -> int:
+        """Drop queued and delayed jobs of partitions revoked in a rebalance; returns how many"""
+        revoked = set(partitions)
+        dropped = 0
+        with self._lock:
+            kept = [entry for entry in self._delayed if (entry[2].topic, entry[2].partition) not in revoked]
+            dropped += len(self._delayed) - len(kept)
+            heapq.heapify(kept)
+            self._delayed = kept
+            for flow in list(self._flows):
+                queue = self._flows[flow]
+                for job in [j for j in queue if (j.topic, j.partition) in revoked]:
+                    queue.remove(job)
+                    self._backlog[job.knowledge_id] -= 1
+                    if not self._backlog[job.knowledge_id]:
+                        del self._backlog[job.knowledge_id]
+                    order = self._doc_order[job.doc_id]
+                    order.remove(job.seq)
+                    if not order:
+                        del self._doc_order[job.doc_id]
+                    dropped += 1
+                if not queue:
+                    del self._flows[flow]
+            self._size -= dropped
+            if not self._flows and not self._running:
+                self._last_tag.clear()
+        return dropped
+
+    def pending(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": self._size,
+                "delayed": len(self._delayed),
+                "running": dict(self._running),
+                "flows": {f"{kid}/{prio}": len(q) for (kid, prio), q in self._flows.items()},
+            }
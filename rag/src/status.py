@@ -0,0 +1,208 @@
+import time
+import uuid
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('rag_worker.status')
+
+# Value of document.updated_by on rows written by the worker. The CDC consumer
+# drops change events carrying it, so the worker never re-reads its own writes.
+WORKER_TAG = "worker"
+
+
+class StatusWriter:
+    """
+    Batch document status updates and ingestion_job rows from all ingest threads
+
+    Updates are coalesced per document (last write wins) and flushed every
+    `flush_interval` seconds or once `max_batch` are pending, as one UPDATE ...
+    FROM (VALUES ...) plus one multi-row INSERT. With a DATABASE_URL the
+    writer talks to Postgres through a small connection pool; otherwise it
+    posts the batch to the API over a keep-alive session.
+    """
+
+    def __init__(
+        self,
+        database_url: Optional[str] = None,
+        api_url: str = "http://api:8000/api",
+        flush_interval: float = 0.5,
+        max_batch: int = 200,
+        pool_size: int = 2
+    ):
+        """
+        Args:
+            database_url: Postgres URL (SQLAlchemy-style driver suffixes are accepted)
+            api_url: API base URL, used when no database_url is given
+            flush_interval: Max seconds an update waits before it is written
+            max_batch: Pending updates that trigger an early flush
+            pool_size: Connections (or HTTP keep-alive sockets) to keep open
+        """
+        self.api_url = api_url.rstrip("/")
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pool = None
+        self._session = None
+        if database_url:
+            from psycopg2.pool import ThreadedConnectionPool
+            self._pool = ThreadedConnectionPool(1, pool_size, database_url.replace("+psycopg2", ""))
+        else:
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+
+        self._cond = threading.Condition()
+        self._updates: Dict[str, Dict[str, Any]] = {}
+        self._jobs: List[Dict[str, Any]] = []
+        self._waiters: List[threading.Event] = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+        self._thread.start()
+
+    def update(
+        self,
+        doc_id: str,
+        status: Optional[str] = None,
+        chunk_count: Optional[int] = None,
+        stage: Optional[str] = None,
+        detail: Optional[str] = None,
+        wait: bool = False
+    ):
+        """
+        Queue a document update and/or an ingestion_job row
+
+        Args:
+            status, chunk_count: Document columns to set (None leaves them unchanged);
+                a chunk_count also drops chunk rows at or past it
+            stage, detail: Append an ingestion_job row for this document
+            wait: Block until the batch holding this update is written, so final
+                statuses are durable before the Kafka offset is committed
+
+        Raises:
+            RuntimeError: if wait=True and the batch could not be written
+        """
+        event = self._waiter() if wait else None
+        with self._cond:
+            if status is not None or chunk_count is not None:
+                pending = self._updates.setdefault(doc_id, {"doc_id": doc_id, "status": None, "chunk_count": None})
+                if status is not None:
+                    pending["status"] = status
+                if chunk_count is not None:
+                    pending["chunk_count"] = chunk_count
+            if stage is not None:
+                self._jobs.append({"id": str(uuid.uuid4()), "doc_id": doc_id, "stage": stage, "detail": detail})
+            if event is not None:
+                self._waiters.append(event)
+            if len(self._updates) + len(self._jobs) >= self.max_batch or event is not None:
+                self._cond.notify()
+        if event is not None:
+            event.wait()
+            if event.error is not None:
+                raise RuntimeError(f"Failed to write status of document {doc_id}: {event.error}")
+
+    @staticmethod
+    def _waiter() -> threading.Event:
+        event = threading.Event()
+        event.error = None
+        return event
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not (self._updates or self._jobs or self._closed):
+                    self._cond.wait(self.flush_interval)
+                elif not self._waiters and len(self._updates) + len(self._jobs) < self.max_batch and not self._closed:
+                    # Let concurrent threads join the batch
+                    self._cond.wait(self.flush_interval)
+                updates, self._updates = list(self._updates.values()), {}
+                jobs, self._jobs = self._jobs, []
+                waiters, self._waiters = self._waiters, []
+                closed = self._closed
+            if updates or jobs:
+                error = None
+                try:
+                    start = time.perf_counter()
+                    self._write(updates, jobs)
+                    logger.debug(f"Wrote {len(updates)} status updates and {len(jobs)} ingestion jobs in {time.perf_counter() - start:.3f}s")
+                except Exception as e:
+                    logger.error(f"Error writing {len(updates)} status updates: {e}", exc_info=True)
+                    error = e
+                for event in waiters:
+                    event.error = error
+                    event.set()
+            else:
+                for event in waiters:
+                    event.set()
+            if closed:
+                return
+
+    def _write(self, updates: List[Dict[str, Any]], jobs: List[Dict[str, Any]]):
+        if self._pool is not None:
+            self._write_db(updates, jobs)
+        else:
+            response = self._session.post(
+                f"{self.api_url}/documents/status-batch",
+                json={"updates": updates, "jobs": jobs},
+                timeout=30
+            )
+            response.raise_for_status()
+
+    def _write_db(self, updates: List[Dict[str, Any]], jobs: List[Dict[str, Any]]):
+        from psycopg2.extras import execute_values
+
+        conn = self._pool.getconn()
+        try:
+            with conn, conn.cursor() as cur:
+                if updates:
+                    rows = [(u["doc_id"], u["status"], u["chunk_count"]) for u in updates]
+                    execute_values(cur, f"""
+                        UPDATE document AS d
+                        SET status = COALESCE(v.status, d.status),
+                            chunk_count = COALESCE(v.chunk_count, d.chunk_count),
+                            updated_at = now(),
+                            updated_by = '{WORKER_TAG}'
+                        FROM (VALUES %s) AS v(id, status, chunk_count)
+                        WHERE d.id = v.id
+                    """, rows, template="(%s, %s, %s::int)")
+                    # Drop chunk rows left over from a longer previous version
+                    counted = [(u["doc_id"], u["chunk_count"]) for u in updates if u["chunk_count"] is not None]
+                    if counted:
+                        execute_values(cur, """
+                            DELETE FROM chunk AS c
+                            USING (VALUES %s) AS v(id, chunk_count)
+                            WHERE c.document_id = v.id AND c.chunk_index >= v.chunk_count
+                        """, counted, template="(%s, %s::int)")
+                if jobs:
+                    # Skip rows of documents deleted meanwhile instead of failing the batch
+                    execute_values(cur, """
+                        INSERT INTO ingestion_job (id, document_id, stage, detail)
+                        SELECT v.id, v.document_id, v.stage, v.detail
+                        FROM (VALUES %s) AS v(id, document_id, stage, detail)
+                        JOIN document d ON d.id = v.document_id
+                    """, [(j["id"], j["doc_id"], j["stage"], j["detail"]) for j in jobs])
+        finally:
+            self._pool.putconn(conn)
+
+    def flush(self):
+        """Block until everything queued so far is written"""
+        event = self._waiter()
+        with self._cond:
+            if not (self._updates or self._jobs):
+                return
+            self._waiters.append(event)
+            self._cond.notify()
+        event.wait()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self._pool is not None:
+            self._pool.closeall()
+        if self._session is not None:
+            self._session.close()
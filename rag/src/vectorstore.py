@@ -1,45 +1,316 @@
 from qdrant_client import QdrantClient, models
 from qdrant_client.models import Distance, VectorParams, PointStruct
-from typing import List, Optional, Dict, Any
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Set
 import numpy as np
+import hashlib
+import os
+import threading
+import time
 import uuid
 
+from .resilience import AIMDLimiter, get_backend
+
+
+# Payload fields filtered on by deletes, tenant/section-scoped chat and metadata-filtered search
+PAYLOAD_INDEXES = {
+    "doc_id": models.PayloadSchemaType.KEYWORD,
+    "knowledge_id": models.PayloadSchemaType.KEYWORD,
+    "file_name": models.PayloadSchemaType.KEYWORD,
+    "chunk_index": models.PayloadSchemaType.INTEGER,
+    "heading_path": models.PayloadSchemaType.KEYWORD,
+    "element_type": models.PayloadSchemaType.KEYWORD,
+    "page_from": models.PayloadSchemaType.INTEGER,
+    "page_to": models.PayloadSchemaType.INTEGER,
+    "token_count": models.PayloadSchemaType.INTEGER,
+}
+
+
+# Document-level vectors of collection X live in X + DOCS_SUFFIX
+DOCS_SUFFIX = "__docs"
+
+
+def chunk_point_id(doc_id: str, chunk_index: int) -> str:
+    """Deterministic point id so re-ingesting a document overwrites its points"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:{chunk_index}"))
+
+
+def doc_point_id(doc_id: str) -> str:
+    """Id of a document's point in the document-level collection"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:doc"))
+
+
+def doc_collection(collection_name: str) -> str:
+    """Collection of document-level vectors for a chunk collection (or alias)"""
+    return f"{collection_name}{DOCS_SUFFIX}"
+
+
+class CollectionRouter:
+    """
+    Resolve a knowledge_id to the collection that holds its points
+
+    Tenancy modes:
+        dedicated: one collection per knowledge_id (named after the knowledge_id)
+        shared: small knowledge bases live in one shared collection partitioned by
+            a tenant-aware knowledge_id index; a knowledge base that outgrows
+            `promote_threshold` points is copied into a collection of its own and
+            reached through an alias named after the knowledge_id
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        mode: str = "dedicated",
+        shared_collection: str = "rag_chunks",
+        promote_threshold: int = 0,
+        refresh_interval: float = 30.0
+    ):
+        if mode not in ("dedicated", "shared"):
+            raise ValueError(f"Unknown tenancy mode: {mode}")
+        self.client = client
+        self.mode = mode
+        self.shared_collection = shared_collection
+        self.promote_threshold = promote_threshold
+        self.refresh_interval = refresh_interval
+        self._dedicated = set()
+        self._refreshed_at = 0.0
+
+    def _refresh(self, force: bool = False):
+        """Reload collection and alias names; one call each covers every tenant"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        names = {c.name for c in self.client.get_collections().collections}
+        names.update(a.alias_name for a in self.client.get_aliases().aliases)
+        names.discard(self.shared_collection)
+        self._dedicated = names
+        self._refreshed_at = time.monotonic()
+
+    def is_shared(self, collection_name: str) -> bool:
+        return self.mode == "shared" and collection_name == self.shared_collection
+
+    def resolve(self, knowledge_id: str, refresh: bool = False) -> str:
+        """Collection name to ingest into and search for this knowledge_id (refresh skips the cached names)"""
+        if self.mode == "dedicated":
+            return knowledge_id
+        self._refresh(force=refresh)
+        return knowledge_id if knowledge_id in self._dedicated else self.shared_collection
+
+    def tenant_filter(self, knowledge_id: str, collection_name: str) -> Optional[models.FieldCondition]:
+        """Condition restricting a shared collection to one tenant, None for dedicated collections"""
+        if not self.is_shared(collection_name):
+            return None
+        return models.FieldCondition(key="knowledge_id", match=models.MatchValue(value=knowledge_id))
+
+    def mark_dedicated(self, knowledge_id: str):
+        self._dedicated.add(knowledge_id)
+
+
+class TenantLocks:
+    """
+    Per-tenant reader/writer lock between ingestion and promotion
+
+    Ingests hold a tenant's lock shared while they resolve its collection and
+    write to it; promotion and the re-embedding switch take it exclusively and
+    back off while any ingest holds it. With a database_url these are Postgres advisory locks (one
+    session per hold), so they cover every worker replica; without one they
+    only cover this process.
+    """
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url.replace("+psycopg2", "") if database_url else None
+        self._cond = threading.Condition()
+        # knowledge_id -> number of shared holders, or -1 while held exclusively
+        self._holders: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(knowledge_id: str) -> int:
+        return int.from_bytes(hashlib.sha1(knowledge_id.encode("utf-8")).digest()[:8], "big", signed=True)
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.database_url)
+        conn.autocommit = True
+        return conn
+
+    @contextmanager
+    def shared(self, *knowledge_ids: str):
+        """Hold the locks of all `knowledge_ids` shared (one session for all of them)"""
+        names = sorted(set(knowledge_ids))
+        if self.database_url:
+            conn = self._connect()
+            try:
+                with conn.cursor() as cur:
+                    for name in names:
+                        cur.execute("SELECT pg_advisory_lock_shared(%s)", (self._key(name),))
+                yield
+            finally:
+                # Ending the session releases its advisory locks
+                conn.close()
+            return
+        with self._cond:
+            while any(self._holders.get(name, 0) < 0 for name in names):
+                self._cond.wait()
+            for name in names:
+                self._holders[name] = self._holders.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                for name in names:
+                    self._holders[name] -= 1
+                    if not self._holders[name]:
+                        del self._holders[name]
+                self._cond.notify_all()
+
+    @contextmanager
+    def try_exclusive(self, knowledge_id: str):
+        """Yields whether the lock was acquired; never waits"""
+        if self.database_url:
+            conn = self._connect()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (self._key(knowledge_id),))
+                    acquired = cur.fetchone()[0]
+                yield acquired
+            finally:
+                conn.close()
+            return
+        with self._cond:
+            acquired = knowledge_id not in self._holders
+            if acquired:
+                self._holders[knowledge_id] = -1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._cond:
+                    del self._holders[knowledge_id]
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self, knowledge_id: str, timeout: float = 60.0, interval: float = 0.5):
+        """Like try_exclusive, but keeps trying for up to `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.try_exclusive(knowledge_id) as acquired:
+                if acquired or time.monotonic() >= deadline:
+                    yield acquired
+                    return
+            time.sleep(interval)
+
 
 class QdrantVectorStore:
     """Class for managing Qdrant vector database operations"""
     
-    def __init__(self, host: str = "localhost", port: int = 6333, vector_size: int = 1024):
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6333,
+        vector_size: int = 1024,
+        slim_payload: bool = False,
+        tenancy: str = "dedicated",
+        shared_collection: str = "rag_chunks",
+        promote_threshold: int = 0,
+        quantization: Optional[str] = None,
+        location: Optional[str] = None,
+        tenant_locks: Optional[TenantLocks] = None
+    ):
         """
         Initialize Qdrant client and collection
         
         Args:
             host: Qdrant server host
             port: Qdrant server port
-            collection_name: Name of the collection
             vector_size: Dimension of the vectors (default: 1024)
+            slim_payload: Keep chunk text out of point payloads; the text lives in
+                the chunk table and is fetched in bulk for the final top-k only
+            tenancy: 'dedicated' (collection per knowledge base) or 'shared'
+            shared_collection: Name of the shared collection in 'shared' mode
+            promote_threshold: Point count at which a shared tenant gets its own
+                collection (0 disables promotion)
+            quantization: 'int8' to create new collections with scalar quantization
+            location: Use a local Qdrant instead of a server, e.g. ':memory:' (evaluation)
+            tenant_locks: Coordination of ingests with promotion and collection swaps
+                (process-local by default)
         """
-        self.client = QdrantClient(host=host, port=port)
+        if location is not None:
+            self.client = QdrantClient(location=location)
+        else:
+            self.client = QdrantClient(host=host, port=port, timeout=int(os.getenv("QDRANT_TIMEOUT", 10)))
+        # Shared by every store in the process: one concurrency limit and breaker per Qdrant
+        self.backend = get_backend(
+            "qdrant",
+            timeout=float(os.getenv("QDRANT_TIMEOUT", 10)),
+            limiter=AIMDLimiter(initial=8, max_limit=int(os.getenv("QDRANT_MAX_CONCURRENCY", 32)))
+        )
         self.vector_size = vector_size
+        self.quantization = quantization
+        self.slim_payload = slim_payload
+        self.router = CollectionRouter(
+            self.client,
+            mode=tenancy,
+            shared_collection=shared_collection,
+            promote_threshold=promote_threshold
+        )
+        self.tenant_locks = tenant_locks or TenantLocks()
+        self._known_collections = set()
     
-    def _create_collection(self, collection_name: str):
-        """Create collection if it doesn't exist"""
-        if not self.client.collection_exists(collection_name):
+    def _create_collection(self, collection_name: str, shared: Optional[bool] = None):
+        """
+        Create collection and its payload indexes if they don't exist
+
+        Args:
+            shared: Lay the collection out for tenant-filtered access; defaults to
+                whether it is the router's shared collection
+        """
+        if collection_name in self._known_collections:
+            return
+        if shared is None:
+            shared = self.router.is_shared(collection_name.removesuffix(DOCS_SUFFIX))
+        if not self._exists(collection_name):
             self.client.create_collection(
                 collection_name=collection_name,
                 vectors_config=VectorParams(
                     size=self.vector_size,
                     distance=Distance.COSINE
-                )
+                ),
+                # Every query on a shared collection is tenant-filtered, so build
+                # per-tenant HNSW graphs instead of one global graph
+                hnsw_config=models.HnswConfigDiff(m=0, payload_m=16) if shared else None,
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
+                ) if self.quantization == "int8" else None
             )
             print(f"✅ Created collection '{collection_name}' with vector size {self.vector_size}")
         else:
             print(f"✅ Collection '{collection_name}' already exists")
+        self._create_payload_indexes(collection_name, shared=shared)
+        self._known_collections.add(collection_name)
+
+    def _exists(self, name: str) -> bool:
+        """A collection, or an alias serving one (re-embedded and rebuilt collections are swapped in by alias)"""
+        return self.client.collection_exists(name) or name in {a.alias_name for a in self.client.get_aliases().aliases}
+
+    def _create_payload_indexes(self, collection_name: str, shared: bool = False):
+        """Declare payload indexes, also backfilling collections created before indexes existed"""
+        existing = self.client.get_collection(collection_name).payload_schema or {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            if shared and field_name == "knowledge_id":
+                field_schema = models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema
+            )
     
     def insert_emb(
         self,
         collection_name: str,
         embeddings: Optional[np.ndarray|list] = None,
-        payloads: Optional[Dict[str, Any]] = None
+        payloads: Optional[Dict[str, Any]] = None,
+        ids: Optional[List[str]] = None
     ) -> bool:
         """
         Insert embeddings into the collection
@@ -54,11 +325,18 @@ class QdrantVectorStore:
         """
         try:
             self._create_collection(collection_name)
+            if isinstance(embeddings, np.ndarray):
+                embeddings = embeddings.astype(np.float32, copy=False).tolist()
+            if self.slim_payload:
+                if isinstance(payloads, list):
+                    payloads = [self._slim(payload) for payload in payloads]
+                elif payloads is not None:
+                    payloads = self._slim(payloads)
             if isinstance(payloads, list):
                 num_vectors = len(payloads)
                 points = [
                     PointStruct(
-                        id=uuid.uuid4(),
+                        id=ids[i] if ids else str(uuid.uuid4()),
                         vector=embeddings[i],
                         payload=payloads[i]
                     )
@@ -68,16 +346,18 @@ class QdrantVectorStore:
                 # Create points
                 points = [
                     PointStruct(
-                        id=uuid.uuid4(),
+                        id=ids[0] if ids else str(uuid.uuid4()),
                         vector=embeddings,
                         payload=payloads
                     )
                 ]
             
             # Insert points
-            self.client.upsert(
+            self.backend.call(
+                self.client.upsert,
                 collection_name=collection_name,
-                points=points
+                points=points,
+                cost=len(points)
             )
             
             print(f"✅ Inserted embeddings into collection '{collection_name}'")
@@ -87,6 +367,10 @@ class QdrantVectorStore:
             print(f"❌ Error inserting embeddings: {str(e)}")
             return False
     
+    @staticmethod
+    def _slim(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in payload.items() if key != "text"}
+
     def search(
         self,
         collection_name: str,
@@ -107,17 +391,14 @@ class QdrantVectorStore:
         Returns:
             List of search results, each containing 'id', 'score', and 'payload'
         """
+        if query_embedding is None or np.size(query_embedding) == 0:
+            print("❌ Error searching: no query vector")
+            return []
+        vectors = self._to_vectors(query_embedding)
+        if len(vectors) != 1:
+            raise ValueError(f"search expects a single query vector, got {len(vectors)}; use search_batch")
+        query_vector = vectors[0]
         try:
-            # Convert numpy array to list
-            if isinstance(query_embedding, np.ndarray):
-                # Handle both 1D and 2D arrays
-                if query_embedding.ndim == 2:
-                    query_vector = query_embedding[0].tolist()
-                else:
-                    query_vector = query_embedding.tolist()
-            else:
-                query_vector = query_embedding
-            
             # Build search parameters
             search_params = {
                 "collection_name": collection_name,
@@ -132,7 +413,7 @@ class QdrantVectorStore:
                 search_params["query_filter"] = models.Filter(**filter_conditions)
             
             # Perform search
-            results = self.client.search(**search_params)
+            results = self.backend.hedged(self.client.search, **search_params)
             
             # Format results
             formatted_results = [
@@ -150,10 +431,367 @@ class QdrantVectorStore:
             print(f"❌ Error searching: {str(e)}")
             return []
     
+    def ingest_lock(self, knowledge_id: str):
+        """
+        Held by an ingest while it resolves the tenant's collection and writes to
+        it, so a promotion or a collection swap (re-embedding switch, document
+        vector rebuild) never runs underneath it. In shared mode this also
+        holds the shared collection's lock.
+        """
+        if self.router.mode == "shared":
+            return self.tenant_locks.shared(knowledge_id, self.router.shared_collection)
+        return self.tenant_locks.shared(knowledge_id)
+
+    def swap_alias(self, alias: str, collection: str, lock_name: str, timeout: float = 60.0) -> Optional[str]:
+        """
+        Point `alias` at `collection` under `lock_name`'s exclusive lock
+
+        An existing alias is repointed atomically. A real collection named
+        `alias` (created before aliases were used) has to be deleted first,
+        which the lock keeps ingests from racing with.
+
+        Returns:
+            The collection the alias pointed at before, if any
+        Raises:
+            TimeoutError: if ingests held the lock for all of `timeout`
+        """
+        with self.tenant_locks.exclusive(lock_name, timeout=timeout) as acquired:
+            if not acquired:
+                raise TimeoutError(f"Ingestion into '{lock_name}' kept its lock for {timeout:.0f}s, '{alias}' not swapped")
+            aliases = {a.alias_name: a.collection_name for a in self.client.get_aliases().aliases}
+            previous = aliases.get(alias)
+            operations = []
+            if previous is not None:
+                operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+            elif self.client.collection_exists(alias):
+                print(f"⚠️ Deleting collection '{alias}' to replace it with an alias to '{collection}'")
+                self.client.delete_collection(alias)
+            operations.append(models.CreateAliasOperation(
+                create_alias=models.CreateAlias(collection_name=collection, alias_name=alias)
+            ))
+            # Both alias operations apply atomically
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+            self._known_collections.discard(alias)
+        return previous
+
+    def maybe_promote(self, knowledge_id: str) -> bool:
+        """
+        Move a large tenant out of the shared collection into its own collection
+
+        Runs under the tenant's exclusive lock, so no ingest writes to the tenant
+        meanwhile; if one is in flight, promotion is left to a later ingest.
+        Points are copied into '<knowledge_id>__dedicated', then an alias named
+        after the knowledge_id is created so searches switch over in one step,
+        and anything written to the shared collection since the copy is copied
+        too. Other workers and the API cache collection names for a while, so
+        only the copied ids are deleted from the shared collection, and only
+        after that cache interval has passed.
+
+        Returns:
+            True if the tenant was promoted
+        """
+        router = self.router
+        if router.mode != "shared" or router.promote_threshold <= 0:
+            return False
+        if router.resolve(knowledge_id) != router.shared_collection:
+            return False
+
+        tenant = models.Filter(must=[router.tenant_filter(knowledge_id, router.shared_collection)])
+        count = self.client.count(router.shared_collection, count_filter=tenant, exact=True).count
+        if count < router.promote_threshold:
+            return False
+
+        with self.tenant_locks.try_exclusive(knowledge_id) as acquired:
+            if not acquired:
+                print(f"⏸ Ingestion into tenant '{knowledge_id}' in flight, promotion deferred")
+                return False
+            # Another replica may have promoted it in the meantime
+            if router.resolve(knowledge_id, refresh=True) != router.shared_collection:
+                return False
+
+            target = f"{knowledge_id}__dedicated"
+            shared_docs = doc_collection(router.shared_collection)
+            has_docs = self._exists(shared_docs)
+            print(f"⏫ Promoting tenant '{knowledge_id}' ({count} points) to collection '{target}'")
+            self._create_collection(target)
+            copied = self._copy_points(router.shared_collection, target, tenant)
+            docs_copied: Set = set()
+            if has_docs:
+                self._create_collection(doc_collection(knowledge_id), shared=False)
+                docs_copied = self._copy_points(shared_docs, doc_collection(knowledge_id), tenant)
+
+            self.client.update_collection_aliases(
+                change_aliases_operations=[
+                    models.CreateAliasOperation(
+                        create_alias=models.CreateAlias(collection_name=target, alias_name=knowledge_id)
+                    )
+                ]
+            )
+            router.mark_dedicated(knowledge_id)
+            # Catch writes that bypassed the lock between the copy and the alias switch
+            copied |= self._copy_points(router.shared_collection, target, tenant, skip=copied)
+            if has_docs:
+                docs_copied |= self._copy_points(shared_docs, doc_collection(knowledge_id), tenant, skip=docs_copied)
+
+        # Until every cached resolve has expired, the shared copies keep serving stale readers
+        grace = 2 * router.refresh_interval
+        cleanup = threading.Timer(grace, self._delete_copied, args=(knowledge_id, [
+            (router.shared_collection, copied), (shared_docs, docs_copied)
+        ]))
+        cleanup.daemon = True
+        cleanup.start()
+        print(f"✅ Promoted tenant '{knowledge_id}' to collection '{target}', shared copies removed in {grace:.0f}s")
+        return True
+
+    def _delete_copied(self, knowledge_id: str, copies: List[tuple]):
+        for collection, ids in copies:
+            ids = list(ids)
+            try:
+                for i in range(0, len(ids), 1000):
+                    self.client.delete(collection_name=collection, points_selector=models.PointIdsList(points=ids[i:i + 1000]))
+            except Exception as e:
+                # Left for the reconciler
+                print(f"❌ Error removing promoted tenant '{knowledge_id}' from '{collection}': {e}")
+
+    def _copy_points(self, source: str, target: str, scroll_filter: Optional[models.Filter] = None,
+                     skip: Optional[Set] = None) -> Set:
+        """Copy points (except ids in `skip`) from source to target; returns the ids copied"""
+        copied = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=source,
+                scroll_filter=scroll_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            points = [p for p in points if not skip or p.id not in skip]
+            if points:
+                self.client.upsert(
+                    collection_name=target,
+                    points=[PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points]
+                )
+                copied.update(p.id for p in points)
+            if offset is None:
+                break
+        return copied
+
+    def upsert_doc_vector(self, collection_name: str, doc_id: str, vector_sum: np.ndarray, payload: Dict[str, Any]) -> bool:
+        """
+        Store a document's mean-pooled chunk embedding in the document-level
+        collection next to `collection_name`
+
+        Args:
+            vector_sum: Sum of the document's (unit) chunk embeddings
+            payload: doc_id, knowledge_id, file_name, chunk_count
+        """
+        norm = float(np.linalg.norm(vector_sum))
+        if not norm:
+            return True
+        return self.insert_emb(
+            collection_name=doc_collection(collection_name),
+            embeddings=(vector_sum / norm).astype(np.float32),
+            payloads=payload,
+            ids=[doc_point_id(doc_id)]
+        )
+
+    def rebuild_doc_vectors(self, collection_name: str) -> int:
+        """
+        Recompute the document-level collection of `collection_name` from its
+        chunk vectors, e.g. for knowledge bases ingested before documents had
+        vectors, or after re-embedding with another model. Holds one running
+        sum per document in memory.
+
+        Returns:
+            Number of documents written
+        """
+        sums: Dict[str, np.ndarray] = {}
+        payloads: Dict[str, Dict[str, Any]] = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=["doc_id", "knowledge_id", "file_name"],
+                with_vectors=True
+            )
+            for p in points:
+                doc_id = (p.payload or {}).get("doc_id")
+                if not doc_id:
+                    continue
+                vector = np.asarray(p.vector, dtype=np.float32)
+                if doc_id in sums:
+                    sums[doc_id] += vector
+                    payloads[doc_id]["chunk_count"] += 1
+                else:
+                    sums[doc_id] = vector
+                    payloads[doc_id] = {**p.payload, "chunk_count": 1}
+            if offset is None:
+                break
+
+        # Built into a fresh collection (possibly of another model's dimension)
+        # while searches keep using the live one, then swapped in by alias
+        live = doc_collection(collection_name)
+        staged = f"{live}__{int(time.time())}"
+        self._create_collection(staged, shared=self.router.is_shared(collection_name))
+        doc_ids = list(sums)
+        for i in range(0, len(doc_ids), 256):
+            batch = doc_ids[i:i + 256]
+            vectors = np.stack([sums[d] for d in batch])
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            if not self.insert_emb(staged, vectors, [payloads[d] for d in batch], [doc_point_id(d) for d in batch]):
+                raise RuntimeError(f"Failed to write document vectors into '{staged}'")
+        previous = self.swap_alias(live, staged, lock_name=collection_name)
+        if previous is not None:
+            self.delete_collection(previous)
+        print(f"✅ Rebuilt {len(doc_ids)} document vectors in '{live}' ('{staged}')")
+        return len(doc_ids)
+
+    def route_documents(
+        self,
+        knowledge_id: str,
+        query_embeddings: np.ndarray | list,
+        top_docs: int = 20
+    ) -> Optional[List[List[str]]]:
+        """
+        First stage of two-stage retrieval: the `top_docs` closest documents per query
+
+        Returns:
+            One list of doc_ids per query, or None when the knowledge base has no
+            document-level vectors (search it flat)
+        """
+        collection_name = self.router.resolve(knowledge_id)
+        target = doc_collection(collection_name)
+        if not self.client.collection_exists(target):
+            return None
+        tenant = self.router.tenant_filter(knowledge_id, collection_name)
+        results = self.search_batch(
+            collection_name=target,
+            query_embeddings=query_embeddings,
+            top_k=top_docs,
+            filter_conditions={"must": [tenant]} if tenant is not None else None
+        )
+        if not any(results):
+            return None
+        return [[hit["payload"]["doc_id"] for hit in hits] for hits in results]
+
+    def search_knowledge(
+        self,
+        knowledge_id: str,
+        query_embeddings: np.ndarray | list,
+        section: Optional[str] = None,
+        top_k: int = 8,
+        top_docs: int = 0
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search a knowledge base the way the chat API does: route to its collection,
+        restrict shared collections to the tenant and scope by heading_path
+
+        Args:
+            top_docs: If > 0, search only the chunks of the `top_docs` documents
+                closest to each query (two-stage retrieval, doc_id index filter)
+        """
+        collection_name = self.router.resolve(knowledge_id)
+        must = []
+        tenant = self.router.tenant_filter(knowledge_id, collection_name)
+        if tenant is not None:
+            must.append(tenant)
+        if section:
+            must.append(models.FieldCondition(key="heading_path", match=models.MatchValue(value=section)))
+        routed = self.route_documents(knowledge_id, query_embeddings, top_docs) if top_docs > 0 else None
+        if routed is None:
+            filter_conditions = {"must": must} if must else None
+        else:
+            # A query that matched no document falls back to the flat search
+            filter_conditions = [
+                {"must": must + [models.FieldCondition(key="doc_id", match=models.MatchAny(any=doc_ids))]}
+                if doc_ids else ({"must": must} if must else None)
+                for doc_ids in routed
+            ]
+        return self.search_batch(
+            collection_name=collection_name,
+            query_embeddings=query_embeddings,
+            top_k=top_k,
+            filter_conditions=filter_conditions
+        )
+
+    @staticmethod
+    def _to_vectors(embeddings: np.ndarray | list) -> List[List[float]]:
+        """Convert one or many query vectors to lists with a single vectorized tolist()"""
+        return np.asarray(embeddings, dtype=np.float32).reshape(-1, np.shape(embeddings)[-1]).tolist()
+
+    def search_batch(
+        self,
+        collection_name: str,
+        query_embeddings: np.ndarray | list,
+        top_k: int = 5,
+        score_threshold: Optional[float] = None,
+        filter_conditions: Optional[Dict[str, Any] | List[Optional[Dict[str, Any]]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for many query vectors in a single request
+        
+        Args:
+            query_embeddings: Query vectors as numpy array or list (shape: [n, vector_size])
+            top_k: Number of top results to return per query
+            score_threshold: Minimum similarity score threshold
+            filter_conditions: One filter applied to every query, or a list with one
+                (possibly None) filter per query
+        
+        Returns:
+            One list of results per query, in query order, each result containing
+            'id', 'score', and 'payload'
+        """
+        if np.size(query_embeddings) == 0:
+            return []
+        vectors = self._to_vectors(query_embeddings)
+        if isinstance(filter_conditions, list):
+            if len(filter_conditions) != len(vectors):
+                raise ValueError(f"Got {len(filter_conditions)} filters for {len(vectors)} queries")
+            filters = filter_conditions
+        else:
+            filters = [filter_conditions] * len(vectors)
+
+        requests = [
+            models.QueryRequest(
+                query=vector,
+                filter=models.Filter(**flt) if flt is not None else None,
+                limit=top_k,
+                score_threshold=score_threshold,
+                with_payload=True
+            )
+            for vector, flt in zip(vectors, filters)
+        ]
+        try:
+            responses = self.backend.hedged(
+                self.client.query_batch_points,
+                collection_name=collection_name,
+                requests=requests,
+                cost=len(requests)
+            )
+            return [
+                [
+                    {
+                        "id": point.id,
+                        "score": point.score,
+                        "payload": point.payload
+                    }
+                    for point in response.points
+                ]
+                for response in responses
+            ]
+        except Exception as e:
+            print(f"❌ Error batch searching: {str(e)}")
+            return [[] for _ in vectors]
+
     def delete_collection(self, collection_name: str):
         """Delete the collection"""
         try:
             self.client.delete_collection(collection_name)
+            self._known_collections.discard(collection_name)
             print(f"✅ Deleted collection '{collection_name}'")
         except Exception as e:
             print(f"❌ Error deleting collection: {str(e)}")
@@ -172,23 +810,43 @@ class QdrantVectorStore:
             print(f"❌ Error getting collection info: {str(e)}")
             return {}
 
-    def delete_document(self, collection_name: str, doc_id: str):
-        """Delete all points that have file_name in payload from the collection"""
+    def delete_document(self, collection_name: str, doc_id: str, from_chunk_index: Optional[int] = None):
+        """
+        Delete all points of a document from the collection
+
+        Args:
+            doc_id: Document id stored in the point payload
+            from_chunk_index: If set, only delete chunks with chunk_index >= this value
+                (stale tail left behind when a re-ingested document got shorter)
+        """
+        must = [
+            models.FieldCondition(
+                key="doc_id",
+                match=models.MatchValue(value=doc_id)
+            )
+        ]
+        if from_chunk_index is not None:
+            must.append(
+                models.FieldCondition(
+                    key="chunk_index",
+                    range=models.Range(gte=from_chunk_index)
+                )
+            )
         try:
-            self.client.delete(
+            self.backend.call(
+                self.client.delete,
                 collection_name=collection_name,
                 points_selector=models.FilterSelector(
-                    filter=models.Filter(
-                        must=[
-                            models.FieldCondition(
-                                key="doc_id",
-                                match=models.MatchValue(value=doc_id)
-                            )
-                        ]
-                    )
+                    filter=models.Filter(must=must)
                 )
             )
-            print(f"✅ Deleted all points with doc_id '{doc_id}' from collection '{collection_name}'")
+            if from_chunk_index is None and self._exists(doc_collection(collection_name)):
+                self.backend.call(
+                    self.client.delete,
+                    collection_name=doc_collection(collection_name),
+                    points_selector=models.PointIdsList(points=[doc_point_id(doc_id)])
+                )
+            print(f"✅ Deleted points with doc_id '{doc_id}' from collection '{collection_name}'")
         except Exception as e:
             print(f"❌ Error deleting document: {str(e)}")
 
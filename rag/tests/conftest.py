@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the worker's modules as `src.*`, like the entry points in rag/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+import pytest
+
+from src.extract import iter_text_native_blocks, sniff_format
+
+
+@pytest.mark.parametrize("encoding", ["utf-16", "utf-16-be", "utf-32", "utf-8-sig"])
+def test_text_with_byte_order_mark_is_decoded(tmp_path, encoding):
+    path = tmp_path / "notes.txt"
+    data = "héllo wörld\n\nsecond paragraph\n".encode(encoding)
+    if encoding == "utf-16-be":
+        data = b"\xfe\xff" + data
+    path.write_bytes(data)
+
+    assert sniff_format(str(path)) == "text"
+    assert [b["text"] for b in iter_text_native_blocks(str(path), "text")] == ["héllo wörld", "second paragraph"]
+
+
+def test_utf16_csv_is_decoded(tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_bytes("name,age\nÅsa,41\n".encode("utf-16"))
+
+    assert sniff_format(str(path)) == "csv"
+    blocks = list(iter_text_native_blocks(str(path), "csv"))
+    assert len(blocks) == 1
+    assert "| name | age |" in blocks[0]["text"]
+    assert "| Åsa | 41 |" in blocks[0]["text"]
+
+
+def test_bm_text_is_not_an_image(tmp_path):
+    path = tmp_path / "bmi.csv"
+    path.write_text("BMI,age\n22.1,30\n", encoding="utf-8")
+
+    assert sniff_format(str(path)) == "csv"
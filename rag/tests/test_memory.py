@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_conversion_stays_within_memory_budget(tmp_path):
+    """Runs the memory regression check of src.memory on a generated PDF"""
+    pytest.importorskip("docling")
+    env = {**os.environ, "CONVERT_TMP_DIR": str(tmp_path), "CONVERT_WORKERS": "1"}
+    result = subprocess.run(
+        [sys.executable, "-m", "src.memory", "--pages", "200", "--runs", "3",
+         "--max-parent-growth-mb", "50", "--max-child-peak-mb", "3072"],
+        cwd=RAG_DIR, env=env, capture_output=True, text=True, timeout=1800,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "OK:" in result.stdout
+    # Every spill file was consumed and removed
+    assert not list(tmp_path.glob("blocks_*.jsonl"))
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+
+import pytest
+
+from src.resilience import AIMDLimiter, Backend, CircuitBreaker, CircuitOpenError
+
+
+class FlakyService:
+    """Fault-injecting stand-in for a backend: fixed latency, seeded error rate"""
+
+    def __init__(self, latency: float = 0.001, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError("injected failure")
+        return "ok"
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_limiter_shrinks_under_latency():
+    backend = Backend("flaky", timeout=1.0, limiter=AIMDLimiter(initial=8))
+    service = FlakyService(latency=0.002)
+    for _ in range(30):
+        backend.call(service)
+    assert backend.limiter.limit == 8
+
+    service.latency = 0.03
+    for _ in range(10):
+        backend.call(service)
+    assert backend.limiter.limit < 8
+    assert backend.breaker.state == "closed"
+
+
+def test_breaker_opens_and_half_opens():
+    backend = Backend("flaky", timeout=1.0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.1))
+    service = FlakyService(error_rate=1.0)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            backend.call(service)
+    assert backend.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        backend.call(service)
+    assert service.calls == 3
+
+    # After the reset timeout a single probe is let through; a failed probe re-opens
+    time.sleep(0.1)
+    with pytest.raises(ConnectionError):
+        backend.call(service)
+    assert backend.breaker.state == "open"
+
+    time.sleep(0.1)
+    service.latency, service.error_rate = 0.1, 0.0
+    probe = threading.Thread(target=backend.call, args=(service,))
+    probe.start()
+    time.sleep(0.03)
+    assert backend.breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        backend.call(service)
+    probe.join()
+    assert backend.breaker.state == "closed"
+    assert backend.call(service) == "ok"
+
+
+@pytest.mark.parametrize("status_code, counts", [(404, False), (422, False), (503, True)])
+def test_only_backend_failures_count(status_code, counts):
+    backend = Backend("flaky", breaker=CircuitBreaker(failure_threshold=3))
+
+    def answer():
+        raise HTTPError(status_code)
+
+    for _ in range(3):
+        with pytest.raises(HTTPError):
+            backend.call(answer)
+    assert backend.breaker.state == ("open" if counts else "closed")
+    assert backend.stats()["errors"] == (0 if counts else 3)
+
+
+def test_hedged_returns_backup_when_primary_stalls():
+    backend = Backend("flaky", timeout=0.2)
+    service = FlakyService(latency=1.0)
+
+    def request():
+        # Only the first request stalls
+        if service.calls:
+            return "backup"
+        return service()
+
+    start = time.monotonic()
+    assert backend.hedged(request) == "backup"
+    assert time.monotonic() - start < 0.5
+    assert backend.stats()["hedged"] == 1
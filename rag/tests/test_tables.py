@@ -0,0 +1,25 @@
+from src.tables import TableStore, row_chunk_text
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def test_wide_rows_are_grouped_within_the_chunk_capacity(tmp_path):
+    store = TableStore(local_dir=str(tmp_path), rows_per_chunk=50)
+    columns = ["id", "notes"]
+    rows = [[str(i), "word " * 40] for i in range(200)]
+    tables = store.document("kid", "doc", count_tokens=count_words, max_tokens=512)
+
+    step = tables._rows_per_chunk("Table 1", columns, rows)
+    assert 1 <= step < 50
+    table = {"title": "Table 1", "index": 0, "row_from": 190, "row_to": 190 + step}
+    assert count_words(row_chunk_text(table, columns, rows[:step])) <= 512
+
+
+def test_narrow_rows_keep_rows_per_chunk(tmp_path):
+    store = TableStore(local_dir=str(tmp_path), rows_per_chunk=50)
+    rows = [[str(i), "x"] for i in range(200)]
+
+    assert store.document("kid", "doc", count_tokens=count_words, max_tokens=512)._rows_per_chunk("Table 1", ["id", "v"], rows) == 50
+    assert store.document("kid", "doc")._rows_per_chunk("Table 1", ["id", "v"], [["x " * 1000, "y"]]) == 50
@@ -1,9 +1,13 @@
 import os
-import json
+import time
 import logging
-from confluent_kafka import Consumer
+from concurrent.futures import ThreadPoolExecutor
+from confluent_kafka import Consumer, Producer, TopicPartition
 
-from src.rag import ChunkingRAG
+from src.rag import ChunkingRAG, IngestionError
+from src.retry import RetryPolicy, RetryPublisher
+from src.scheduler import FairScheduler, IngestJob, OffsetTracker
+from src.cdc import CDCDecoder
 
 # Setup logger
 logging.basicConfig(
@@ -13,82 +17,216 @@ logging.basicConfig(
 )
 logger = logging.getLogger('rag_worker')
 
+def parse_event(decoder: CDCDecoder, msg):
+    """
+    Turn a Debezium `document` change event into an IngestJob, or None if
+    the event needs no work
+    """
+    payload = decoder.decode(msg)
+    if payload is None:
+        return None
+    op = payload.get('op')
+    if op == 'c':
+        message = payload.get('after')
+        doc_id = message.get('id') if message else 'unknown'
+        logger.info(f"Inserted row - Document ID: {doc_id}, Status: {message.get('status') if message else 'unknown'}")
+        # Don't process on insert - wait for status to change to "ingesting"
+        # File may not be uploaded to S3 yet
+        return None
+    elif op == 'd':
+        message = payload.get('before')
+        doc_id = message.get('id') if message else 'unknown'
+        logger.info(f"Deleted row - Document ID: {doc_id}")
+        kind = 'delete'
+    elif op == 'u':
+        before = payload.get('before')
+        message = payload.get('after')
+        doc_id = message.get('id') if message else 'unknown'
+        before_status = before.get('status') if before else None
+        after_status = message.get('status') if message else None
+
+        logger.debug(f"Updated row - Document ID: {doc_id}, Status: {before_status} -> {after_status}")
+
+        # Only process when status changes to "ingesting"
+        # This ensures file has been uploaded to S3
+        if not (after_status == 'ingesting' and before_status != 'ingesting'):
+            return None
+        logger.info(f"Status changed to 'ingesting' for document {doc_id}, queueing ingestion...")
+        kind = 'ingest'
+    else:
+        logger.warning(f"Unknown operation: {op}")
+        return None
+
+    return IngestJob(
+        kind=kind,
+        knowledge_id=message.get('knowledge_id'),
+        doc_id=doc_id,
+        message=message,
+        topic=msg.topic(),
+        partition=msg.partition(),
+        offset=msg.offset(),
+    )
+
+def run_job(rag: ChunkingRAG, publisher: RetryPublisher, job: IngestJob):
+    if job.kind == 'delete':
+        rag.delete_document(message=job.message)
+        return
+    logger.info(f"Starting ingestion of document {job.doc_id} (attempt {job.attempt}, {job.priority}, knowledge {job.knowledge_id})")
+    try:
+        chunk_count = rag.ingest_document(message=job.message)
+        logger.info(f"Successfully ingested document {job.doc_id} ({chunk_count} chunks)")
+    except IngestionError as e:
+        logger.error(f"Failed to ingest document {job.doc_id}: {e}")
+        try:
+            retried = publisher.handle_failure(job, e.stage, e.cause, e.retryable)
+        except Exception as publish_error:
+            logger.error(f"Failed to publish failure of document {job.doc_id}: {publish_error}", exc_info=True)
+            retried = False
+        if not retried:
+            rag.record_dead_letter(job.doc_id, e, job.attempt)
+    except Exception as e:
+        logger.error(f"Error ingesting document {job.doc_id}: {e}", exc_info=True)
+
 def main():
     # Get Kafka broker URL from environment
     KAFKA_BROKER_URL = os.getenv("KAFKA_BROKER_URL", "kafka:9092")
     KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "rag.public.document")
+    KAFKA_RETRY_TOPIC = os.getenv("KAFKA_RETRY_TOPIC", "rag.ingest.retry")
+    KAFKA_DLQ_TOPIC = os.getenv("KAFKA_DLQ_TOPIC", "rag.ingest.dlq")
+    # json (with or without schema block) or avro, matching the connector's value converter
+    CDC_FORMAT = os.getenv("CDC_FORMAT", "json")
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+    MAX_BUFFERED_JOBS = int(os.getenv("MAX_BUFFERED_JOBS", 1000))
+    COMMIT_INTERVAL = float(os.getenv("COMMIT_INTERVAL_SECONDS", 5))
     kafka_conf = {
         'bootstrap.servers': KAFKA_BROKER_URL,
         'group.id': 'rag_public_document_worker',
-        'auto.offset.reset': 'earliest'
+        'auto.offset.reset': 'earliest',
+        # Jobs finish out of order, so offsets are committed manually once
+        # everything before them is done
+        'enable.auto.commit': False,
     }
 
-    consumer = Consumer(kafka_conf)
-    consumer.subscribe([KAFKA_TOPIC])
-
     rag = ChunkingRAG()
+    decoder = CDCDecoder(value_format=CDC_FORMAT, schema_registry_url=os.getenv("SCHEMA_REGISTRY_URL"))
+    publisher = RetryPublisher(
+        Producer({'bootstrap.servers': KAFKA_BROKER_URL, 'enable.idempotence': True}),
+        retry_topic=KAFKA_RETRY_TOPIC,
+        dead_letter_topic=KAFKA_DLQ_TOPIC,
+        policy=RetryPolicy(
+            max_attempts=int(os.getenv("MAX_INGEST_ATTEMPTS", 5)),
+            base_delay=float(os.getenv("RETRY_BASE_DELAY", 5)),
+            max_delay=float(os.getenv("RETRY_MAX_DELAY", 600)),
+        ),
+    )
+    scheduler = FairScheduler(
+        weights={
+            "interactive": float(os.getenv("INTERACTIVE_WEIGHT", 8)),
+            "bulk": float(os.getenv("BULK_WEIGHT", 1)),
+        },
+        max_per_tenant=int(os.getenv("MAX_JOBS_PER_TENANT", 2)),
+        bulk_threshold=int(os.getenv("BULK_THRESHOLD", 10)),
+    )
+    offsets = OffsetTracker()
+    pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+    running = set()
+    paused = False
+
+    def commit():
+        committable = offsets.committable()
+        if not committable:
+            return
+        consumer.commit(
+            offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in committable.items()],
+            asynchronous=False
+        )
+        offsets.mark_committed(committable)
+
+    def on_revoke(consumer, partitions):
+        try:
+            commit()
+        except Exception as e:
+            logger.error(f"Failed to commit offsets on revoke: {e}")
+        # Jobs of revoked partitions are redelivered to their new owner: queued
+        # ones are dropped, in-flight ones finish (ingestion is idempotent,
+        # deterministic point ids) without touching the offsets
+        revoked = [(p.topic, p.partition) for p in partitions]
+        offsets.forget(revoked)
+        dropped = scheduler.drop_partitions(revoked)
+        if dropped:
+            logger.info(f"Dropped {dropped} queued jobs of revoked partitions {revoked}")
+
+    def on_done(job, future):
+        scheduler.complete(job)
+        offsets.done(job.topic, job.partition, job.offset, job.generation)
+        running.discard(future)
+
+    consumer = Consumer(kafka_conf)
+    # Failed jobs come back through the retry topic, so the same scheduler
+    # (and its per-document ordering) handles them
+    consumer.subscribe([KAFKA_TOPIC, KAFKA_RETRY_TOPIC], on_revoke=on_revoke)
 
     try:
-        logger.info(f"Subscribed to topic '{KAFKA_TOPIC}' on broker: {KAFKA_BROKER_URL}")
+        logger.info(f"Subscribed to topics '{KAFKA_TOPIC}', '{KAFKA_RETRY_TOPIC}' on broker: {KAFKA_BROKER_URL}")
+        last_commit = time.monotonic()
         while True:
-            msg = consumer.poll(timeout=1.0)
-            if msg is None:
-                continue
-            if msg.error():
-                logger.error(f"Consumer error: {msg.error()}")
-                continue
-            
-            # Check if message has value
-            msg_value = msg.value()
-            if msg_value is None:
-                logger.warning("Received message with None value, skipping...")
-                continue
-            
-            try:
-                data = json.loads(msg_value.decode('utf-8'))
-                payload = data.get('payload') 
-                op = payload.get('op')
-                if op == 'c':
-                    message = payload.get('after')
-                    doc_id = message.get('id') if message else 'unknown'
-                    logger.info(f"Inserted row - Document ID: {doc_id}, Status: {message.get('status') if message else 'unknown'}")
-                    # Don't process on insert - wait for status to change to "ingesting"
-                    # File may not be uploaded to S3 yet
-                elif op == 'd':
-                    message = payload.get('before')
-                    doc_id = message.get('id') if message else 'unknown'
-                    logger.info(f"Deleted row - Document ID: {doc_id}")
-                    rag.delete_document(message=message)
-                elif op == 'u':
-                    before = payload.get('before')
-                    after = payload.get('after')
-                    doc_id = after.get('id') if after else 'unknown'
-                    before_status = before.get('status') if before else None
-                    after_status = after.get('status') if after else None
-                    
-                    logger.debug(f"Updated row - Document ID: {doc_id}, Status: {before_status} -> {after_status}")
-                    
-                    # Only process when status changes to "ingesting"
-                    # This ensures file has been uploaded to S3
-                    if after_status == 'ingesting' and before_status != 'ingesting':
-                        logger.info(f"Status changed to 'ingesting' for document {doc_id}, starting ingestion...")
-                        try:
-                            success = rag.upload_document(message=after)
-                            if success:
-                                logger.info(f"Successfully ingested document {doc_id}")
-                            else:
-                                logger.error(f"Failed to ingest document {doc_id}")
-                        except Exception as e:
-                            logger.error(f"Error ingesting document {doc_id}: {e}", exc_info=True)
+            msg = consumer.poll(timeout=0.2)
+            if msg is not None:
+                if msg.error():
+                    logger.error(f"Consumer error: {msg.error()}")
                 else:
-                    logger.warning(f"Unknown operation: {op}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to decode message: {e}")
-            except Exception as e:
-                logger.error(f"Failed to process message: {e}", exc_info=True)
+                    generation = offsets.add(msg.topic(), msg.partition(), msg.offset())
+                    try:
+                        if msg.topic() == KAFKA_RETRY_TOPIC:
+                            job = RetryPublisher.decode(msg)
+                        else:
+                            job = parse_event(decoder, msg)
+                    except ValueError as e:
+                        logger.error(f"Failed to decode message: {e}")
+                        job = None
+                    except Exception as e:
+                        logger.error(f"Failed to process message: {e}", exc_info=True)
+                        job = None
+                    if job is None:
+                        offsets.done(msg.topic(), msg.partition(), msg.offset(), generation)
+                    else:
+                        job.generation = generation
+                        scheduler.submit(job)
+
+            # Dispatch while there are idle workers and eligible jobs
+            while len(running) < INGEST_WORKERS:
+                job = scheduler.next()
+                if job is None:
+                    break
+                future = pool.submit(run_job, rag, publisher, job)
+                running.add(future)
+                future.add_done_callback(lambda f, job=job: on_done(job, f))
+
+            # Backpressure: stop fetching while the buffer is full, keep polling
+            # so the consumer stays in the group
+            if not paused and scheduler.pending() >= MAX_BUFFERED_JOBS:
+                consumer.pause(consumer.assignment())
+                paused = True
+                logger.info(f"Paused consumption with {scheduler.pending()} buffered jobs: {scheduler.stats()}")
+            elif paused and scheduler.pending() < MAX_BUFFERED_JOBS // 2:
+                consumer.resume(consumer.assignment())
+                paused = False
+                logger.info("Resumed consumption")
+
+            if time.monotonic() - last_commit >= COMMIT_INTERVAL:
+                commit()
+                last_commit = time.monotonic()
     except KeyboardInterrupt:
         logger.info("Exiting on user interrupt.")
     finally:
+        pool.shutdown(wait=True)
+        if rag.conversion is not None:
+            rag.conversion.close()
+        rag.status.close()
+        try:
+            commit()
+        except Exception as e:
+            logger.error(f"Failed to commit offsets on shutdown: {e}")
         consumer.close()
 
 if __name__ == "__main__":
@@ -54,8 +54,28 @@ export const documentsApi = {
       }
     }
   },
+  getUploadUrls: async (kid, files, knowledgeName) => {
+    if (!kid) throw new Error('kid is required')
+    // The API presigns at most 500 files per request
+    const uploads = []
+    for (let i = 0; i < files.length; i += 500) {
+      const res = await api.post(`/knowledge/${kid}/documents/upload-urls?knowledge_name=${encodeURIComponent(knowledgeName)}`, {
+        files: files.slice(i, i + 500).map(file => ({
+          filename: file.name,
+          content_type: file.type || 'application/octet-stream',
+          size: file.size,
+        })),
+      })
+      uploads.push(...res.data.uploads)
+    }
+    return uploads
+  },
+  completeMultipart: (docId, uploadId, parts) =>
+    api.post(`/documents/${docId}/multipart/complete`, { upload_id: uploadId, parts }).then(res => res.data),
   triggerIngest: (docId) =>
     api.post(`/documents/${docId}/ingest`).then(res => res.data),
+  triggerIngestBulk: (kid, docIds) =>
+    api.post(`/knowledge/${kid}/documents/ingest`, { doc_ids: docIds }).then(res => res.data),
   delete: (docId) =>
     api.delete(`/documents/${docId}`).then(res => res.data),
 }
@@ -65,8 +85,9 @@ export const chatApi = {
     api.post(`/knowledge/${kid}/chat/sessions`, { section }).then(res => res.data),
   sendMessage: (sid, content) =>
     api.post(`/chat/sessions/${sid}/messages`, { content }).then(res => res.data),
-  listMessages: (sid) =>
-    api.get(`/chat/sessions/${sid}/messages`).then(res => res.data),
+  // expand=true also returns the text of each source
+  listMessages: (sid, expand = false) =>
+    api.get(`/chat/sessions/${sid}/messages`, { params: { expand } }).then(res => res.data),
 }
 
 export default api